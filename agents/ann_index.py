@@ -0,0 +1,257 @@
+import os
+import numpy as np
+from agents.vec_store import MmapVecStore
+from agents.vecdb2 import VectorSearchEngine
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest neighbour index (pure NumPy).
+
+    The catalog is split into ``n_lists`` clusters by spherical k-means and
+    every row is assigned to its nearest centroid. A query scores the
+    centroids, scans the rows of the ``nprobe`` closest lists exactly
+    against ``matrix`` (the memory-mapped store vectors) and returns their
+    top-k, so a search reads about ``nprobe / n_lists`` of the catalog.
+    More probes raise recall and latency; ``nprobe >= n_lists`` is exact.
+
+    Only the centroids and the list of every row are persisted
+    (``ivf.npz``, tied to the store by ``fingerprint``). New or changed
+    rows are inserted by assigning them to the existing centroids
+    (``update``); the centroids are retrained once the catalog has grown
+    ``RETRAIN_GROWTH`` times past the size they were trained on.
+    """
+
+    FILE = 'ivf.npz'
+
+    RETRAIN_GROWTH = 2.0
+
+    # rows scored against the centroids at a time.
+    BLOCK_ROWS = 8192
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        assignments: np.ndarray,
+        matrix: np.ndarray | None = None,
+        nprobe: int = 16,
+        fingerprint: str | None = None,
+        trained_docs: int | None = None,
+    ) -> None:
+
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.matrix = matrix
+        self.nprobe = nprobe
+        self.fingerprint = fingerprint
+        self.trained_docs = trained_docs if trained_docs is not None else len(self.assignments)
+
+        # CSR view of the lists: rows of list ``l`` are
+        # ``rows[offsets[l]:offsets[l + 1]]``, in ascending row order.
+        self.rows = np.argsort(self.assignments, kind='stable').astype(np.int64)
+        self.offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(np.bincount(self.assignments, minlength=self.n_lists))
+
+    def __len__(self) -> int:
+        return len(self.assignments)
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @staticmethod
+    def default_lists(n_docs: int) -> int:
+        return max(1, int(round(2 * np.sqrt(n_docs))))
+
+    @classmethod
+    def nearest(cls, centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        assignments = np.zeros(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), cls.BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + cls.BLOCK_ROWS], dtype=np.float32)
+            assignments[start:start + cls.BLOCK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    @classmethod
+    def train(
+        cls,
+        matrix: np.ndarray,
+        n_lists: int,
+        iterations: int = 10,
+        sample: int = 50000,
+        seed: int = 0,
+    ) -> np.ndarray:
+        """Spherical k-means centroids of (a sample of) the rows of ``matrix``."""
+
+        rng = np.random.default_rng(seed)
+        n_lists = min(n_lists, len(matrix))
+
+        rows = np.sort(rng.choice(len(matrix), size=min(sample, len(matrix)), replace=False))
+        train = np.asarray(matrix[rows], dtype=np.float32)
+        centroids = train[rng.choice(len(train), size=n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = cls.nearest(centroids, train)
+
+            order = np.argsort(assignments, kind='stable')
+            counts = np.bincount(assignments, minlength=n_lists)
+            starts = np.cumsum(counts) - counts
+
+            sums = np.zeros_like(centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(train[order], starts[filled], axis=0)
+
+            # an emptied list restarts from a random training row.
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = train[rng.choice(len(train), size=len(empty))]
+
+            centroids = MmapVecStore.normalize(sums)
+
+        return centroids
+
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        n_lists: int | None = None,
+        nprobe: int = 16,
+        fingerprint: str | None = None,
+    ) -> "IVFIndex":
+
+        centroids = cls.train(matrix, n_lists or cls.default_lists(len(matrix)))
+        return cls(centroids, cls.nearest(centroids, matrix), matrix, nprobe, fingerprint)
+
+    def update(
+        self,
+        matrix: np.ndarray,
+        reused: dict[int, int],
+        fingerprint: str | None = None,
+    ) -> "IVFIndex":
+        """The index of a rewritten store, inserting its new rows.
+
+        ``reused`` maps rows of ``matrix`` whose vector is unchanged to
+        their row in the store this index was built on; they keep their
+        list, every other row is assigned to the nearest centroid.
+        """
+
+        if len(matrix) > self.RETRAIN_GROWTH * self.trained_docs:
+            return self.build(matrix, self.default_lists(len(matrix)), self.nprobe, fingerprint)
+
+        assignments = np.full(len(matrix), -1, dtype=np.int32)
+        if reused:
+            new_rows = np.fromiter(reused.keys(), dtype=np.int64, count=len(reused))
+            old_rows = np.fromiter(reused.values(), dtype=np.int64, count=len(reused))
+            assignments[new_rows] = self.assignments[old_rows]
+
+        inserted = np.flatnonzero(assignments < 0)
+        if len(inserted):
+            assignments[inserted] = self.nearest(self.centroids, matrix[inserted])
+
+        return IVFIndex(
+            self.centroids, assignments, matrix, self.nprobe, fingerprint, self.trained_docs)
+
+    @classmethod
+    def exists(cls, persist_directory: str) -> bool:
+        return os.path.isfile(os.path.join(persist_directory, cls.FILE))
+
+    def save(self, persist_directory: str) -> None:
+        path = os.path.join(persist_directory, self.FILE)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                assignments=self.assignments,
+                trained_docs=np.array(self.trained_docs),
+                fingerprint=np.array(self.fingerprint or ''),
+            )
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(
+        cls,
+        persist_directory: str,
+        matrix: np.ndarray | None = None,
+        nprobe: int = 16,
+    ) -> "IVFIndex":
+
+        with np.load(os.path.join(persist_directory, cls.FILE)) as arrays:
+            return cls(
+                centroids=arrays['centroids'],
+                assignments=arrays['assignments'],
+                matrix=matrix,
+                nprobe=nprobe,
+                fingerprint=str(arrays['fingerprint']) or None,
+                trained_docs=int(arrays['trained_docs']),
+            )
+
+    def candidates(
+        self,
+        centroid_scores: np.ndarray,
+        top_k: int,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Rows of the ``nprobe`` closest lists, and of further lists while
+        they hold fewer than ``top_k`` rows, without the ``exclude`` rows
+        and, if given, only the ``rows`` of a partition."""
+
+        lists = np.argsort(-centroid_scores, kind='stable')
+
+        if rows is not None:
+            list_sizes = np.bincount(self.assignments[rows], minlength=self.n_lists)
+        else:
+            list_sizes = np.diff(self.offsets)
+            if exclude is not None and len(exclude):
+                list_sizes = list_sizes - np.bincount(
+                    self.assignments[exclude], minlength=self.n_lists)
+        sizes = np.cumsum(list_sizes[lists])
+
+        n_probe = max(self.nprobe, int(np.searchsorted(sizes, top_k)) + 1)
+        candidates = np.sort(np.concatenate([
+            self.rows[self.offsets[l]:self.offsets[l + 1]] for l in lists[:n_probe]
+        ]))
+
+        if rows is not None:
+            in_partition = np.zeros(len(self), dtype=bool)
+            in_partition[rows] = True
+            candidates = candidates[in_partition[candidates]]
+        elif exclude is not None and len(exclude):
+            candidates = np.setdiff1d(candidates, exclude, assume_unique=True)
+        return candidates
+
+    def search_many(
+        self,
+        query_vecs,
+        top_k: int,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+
+        query_vecs = MmapVecStore.normalize(np.asarray(query_vecs))
+
+        if rows is not None:
+            if exclude is not None and len(exclude):
+                rows = np.setdiff1d(rows, exclude, assume_unique=True)
+            top_k = min(top_k, len(rows))
+        else:
+            top_k = min(top_k, len(self) - (len(exclude) if exclude is not None else 0))
+
+        top_rows = np.zeros((len(query_vecs), top_k), dtype=np.int64)
+        scores = np.zeros((len(query_vecs), top_k), dtype=np.float32)
+
+        for i, centroid_scores in enumerate(query_vecs @ self.centroids.T):
+            candidates = self.candidates(centroid_scores, top_k, exclude, rows)
+            exact = np.asarray(self.matrix[candidates], dtype=np.float32) @ query_vecs[i]  # type: ignore
+            best, scores[i] = VectorSearchEngine.top_k(exact, top_k)
+            top_rows[i] = candidates[best]
+
+        return top_rows, scores
+
+    def search(
+        self,
+        query_vec,
+        top_k: int,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+
+        rows_out, scores = self.search_many(query_vec, top_k, exclude, rows)
+        return rows_out[0], scores[0]
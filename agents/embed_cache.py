@@ -0,0 +1,151 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+class EmbeddingCache:
+    """Bounded LRU cache of query embeddings keyed by (model name, text).
+
+    Entries live in an in-memory ``OrderedDict``; when ``persist_path`` is
+    given every new embedding is also written to a SQLite table, so a memory
+    miss falls back to disk before going to the network and the cache
+    survives restarts. The disk table is periodically pruned back to
+    ``max_disk_size`` rows by last use.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        persist_path: str | None = None,
+        max_disk_size: int = 100_000,
+    ) -> None:
+
+        self.max_size = max_size
+        self.max_disk_size = max_disk_size
+        self.persist_path = persist_path
+
+        self.entries: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.writes_since_prune = 0
+
+        self.conn: sqlite3.Connection | None = None
+        if persist_path is not None:
+            self.conn = sqlite3.connect(persist_path, check_same_thread=False)
+            self.conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    model TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, text)
+                )
+                '''
+            )
+            self.conn.commit()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, model_name: str, text: str) -> np.ndarray | None:
+        key = (model_name, text)
+
+        with self.lock:
+            embedding = self.entries.get(key)
+            if embedding is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+            if self.conn is not None:
+                row = self.conn.execute(
+                    'SELECT embedding FROM query_embeddings WHERE model = ? AND text = ?',
+                    key
+                ).fetchone()
+
+                if row is not None:
+                    embedding = np.frombuffer(row[0], dtype=np.float32)
+                    self.conn.execute(
+                        'UPDATE query_embeddings SET last_used = ? WHERE model = ? AND text = ?',
+                        (time.time(), *key)
+                    )
+                    self.conn.commit()
+                    self._remember(key, embedding)
+                    self.disk_hits += 1
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def put(self, model_name: str, text: str, embedding) -> np.ndarray:
+        key = (model_name, text)
+        embedding = np.asarray(embedding, dtype=np.float32)
+
+        with self.lock:
+            self._remember(key, embedding)
+
+            if self.conn is not None:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)',
+                    (*key, embedding.tobytes(), time.time())
+                )
+                self.writes_since_prune += 1
+                if self.writes_since_prune >= 100:
+                    self._prune_disk()
+                    self.writes_since_prune = 0
+                self.conn.commit()
+
+        return embedding
+
+    def get_or_embed(self, model_name: str, text: str, embed_fn) -> np.ndarray:
+        embedding = self.get(model_name, text)
+        if embedding is None:
+            embedding = self.put(model_name, text, embed_fn(text))
+        return embedding
+
+    async def aget_or_embed(self, model_name: str, text: str, aembed_fn) -> np.ndarray:
+        embedding = self.get(model_name, text)
+        if embedding is None:
+            embedding = self.put(model_name, text, await aembed_fn(text))
+        return embedding
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return dict(
+            size=len(self.entries),
+            hits=self.hits,
+            disk_hits=self.disk_hits,
+            misses=self.misses,
+            hit_rate=(self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        )
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            if self.conn is not None:
+                self.conn.execute('DELETE FROM query_embeddings')
+                self.conn.commit()
+
+    def _remember(self, key: tuple[str, str], embedding: np.ndarray) -> None:
+        self.entries[key] = embedding
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _prune_disk(self) -> None:
+        self.conn.execute(  # type: ignore
+            '''
+            DELETE FROM query_embeddings WHERE rowid IN (
+                SELECT rowid FROM query_embeddings
+                ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            ''',
+            (self.max_disk_size,)
+        )
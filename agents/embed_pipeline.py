@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator
+import numpy as np
+from tqdm.auto import tqdm
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class EmbeddingCheckpoint:
+    """SQLite record of finished embeddings, keyed by doc id and text hash.
+
+    A resumed run only reuses rows whose text hash still matches, so a doc
+    edited between two runs is embedded again. The checkpoint also records
+    the embedding model and dimension it was written with; opening it for
+    another model clears it, and rows of another dimension are never
+    returned.
+    """
+
+    def __init__(self, path: str, model_name: str = '') -> None:
+        self.path = path
+        self.model_name = model_name
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                doc_id TEXT PRIMARY KEY,
+                text_hash BLOB NOT NULL,
+                embedding BLOB NOT NULL
+            )
+            '''
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+        meta = dict(self.conn.execute('SELECT key, value FROM meta'))
+        if meta.get('model_name') != model_name:
+            # left by a run with another model (or before the model was
+            # recorded): none of its vectors can be reused.
+            self.conn.execute('DELETE FROM embeddings')
+            self.conn.execute('DELETE FROM meta')
+            self.conn.execute(
+                'INSERT INTO meta VALUES (?, ?)', ('model_name', model_name))
+            meta = dict(model_name=model_name)
+        self.conn.commit()
+
+        self.dim = int(meta['dim']) if 'dim' in meta else None
+
+    @staticmethod
+    def text_hash(text: str) -> bytes:
+        return hashlib.sha256(text.encode('utf-8')).digest()
+
+    def load(self) -> dict[str, tuple[bytes, np.ndarray]]:
+        done = {}
+        for doc_id, text_hash, embedding in self.conn.execute(
+                'SELECT doc_id, text_hash, embedding FROM embeddings'):
+            embedding = np.frombuffer(embedding, dtype=np.float32)
+            if self.dim is None or len(embedding) == self.dim:
+                done[doc_id] = (text_hash, embedding)
+        return done
+
+    def save(self, records: list[tuple[str, str]], embeddings) -> None:
+        embeddings = [np.asarray(emb, dtype=np.float32) for emb in embeddings]
+
+        if self.dim is None and embeddings:
+            self.dim = len(embeddings[0])
+            self.conn.execute(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)', ('dim', str(self.dim)))
+
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)',
+            [
+                (doc_id, self.text_hash(text), emb.tobytes())
+                for (doc_id, text), emb in zip(records, embeddings)
+            ]
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class LlamaIndexEmbedder:
+    """Adapts any llama_index ``BaseEmbedding`` to the pipeline interface."""
+
+    def __init__(self, embed_model) -> None:
+        self.embed_model = embed_model
+        self.model_name = embed_model.model_name
+
+    async def aembed_batch(self, texts: list[str]) -> list[list[float]]:
+        return await self.embed_model.aget_text_embedding_batch(texts)
+
+
+class LocalEmbedder:
+    """Deterministic offline stand-in for a remote embedding API.
+
+    Vectors are derived from a hash of the text, and every batch sleeps
+    ``latency + per_text_latency * len(texts)`` seconds to mimic a network
+    call, so the pipeline can be benchmarked without API keys.
+    """
+
+    def __init__(
+        self,
+        dim: int = 1024,
+        latency: float = 0.05,
+        per_text_latency: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+
+        self.dim = dim
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.failure_rate = failure_rate
+        self.model_name = f'local-hash-{dim}'
+
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def embed(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(
+            hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+
+    def embed_batch(self, texts: list[str]) -> list[np.ndarray]:
+        return [self.embed(text) for text in texts]
+
+    async def aembed_batch(self, texts: list[str]) -> list[np.ndarray]:
+        self.calls += 1
+        await asyncio.sleep(self.latency + self.per_text_latency * len(texts))
+
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            raise ConnectionError("LocalEmbedder simulated failure")
+
+        return self.embed_batch(texts)
+
+
+class EmbeddingPipeline:
+    """Streams (doc_id, text) records through batched, rate-limited embedding.
+
+    Records are grouped into ``batch_size`` batches as they are pulled from
+    the iterable, and at most ``max_in_flight`` batch requests run at once.
+    Each request first takes a token from the bucket (``requests_per_second``),
+    failed requests are retried with exponential backoff and jitter, and
+    every finished batch is written to the optional checkpoint so an
+    interrupted run resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        batch_size: int = 96,
+        max_in_flight: int = 4,
+        requests_per_second: float | None = None,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        max_backoff: float = 30.0,
+        checkpoint_path: str | None = None,
+        show_progress: bool = True,
+    ) -> None:
+
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.checkpoint_path = checkpoint_path
+        self.show_progress = show_progress
+
+        self.requests = 0
+        self.retries = 0
+        self.resumed = 0
+
+    @staticmethod
+    def batched(records: Iterable[tuple[str, str]], batch_size: int) -> Iterator[list[tuple[str, str]]]:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def embed_with_retry(self, batch: list[tuple[str, str]], bucket: TokenBucket | None):
+        texts = [text for _, text in batch]
+
+        for attempt in range(self.max_retries + 1):
+            if bucket is not None:
+                await bucket.acquire()
+
+            self.requests += 1
+            try:
+                return await self.embedder.aembed_batch(texts)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+
+                self.retries += 1
+                delay = min(self.max_backoff, self.backoff_base * 2 ** attempt)
+                await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+    async def arun(self, records: Iterable[tuple[str, str]], total: int | None = None) -> dict[str, np.ndarray]:
+
+        results: dict[str, np.ndarray] = {}
+
+        checkpoint = EmbeddingCheckpoint(
+            self.checkpoint_path, self.embedder.model_name
+        ) if self.checkpoint_path else None
+        done = checkpoint.load() if checkpoint else {}
+
+        def pending():
+            for doc_id, text in records:
+                saved = done.get(doc_id)
+                if saved is not None and saved[0] == EmbeddingCheckpoint.text_hash(text):
+                    results[doc_id] = saved[1]
+                    self.resumed += 1
+                    progress.update(1)
+                    continue
+                yield doc_id, text
+
+        bucket = TokenBucket(self.requests_per_second) \
+            if self.requests_per_second else None
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        progress = tqdm(total=total, desc="Embedding Texts",
+                        disable=not self.show_progress)
+
+        async def run_batch(batch):
+            try:
+                embeddings = await self.embed_with_retry(batch, bucket)
+                for (doc_id, _), emb in zip(batch, embeddings):
+                    results[doc_id] = np.asarray(emb, dtype=np.float32)
+                if checkpoint:
+                    checkpoint.save(batch, embeddings)
+                progress.update(len(batch))
+            finally:
+                semaphore.release()
+
+        tasks = []
+        try:
+            for batch in self.batched(pending(), self.batch_size):
+                # wait for a free slot before pulling the next batch, so the
+                # source is consumed no faster than requests can go out.
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(run_batch(batch)))
+
+            await asyncio.gather(*tasks)
+
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        finally:
+            progress.close()
+            if checkpoint:
+                checkpoint.close()
+
+        return results
+
+    def run(self, records: Iterable[tuple[str, str]], total: int | None = None) -> dict[str, np.ndarray]:
+        """Blocking wrapper around ``arun``.
+
+        When called from inside a running event loop (a notebook, an async
+        server) the pipeline runs on its own loop in a helper thread instead
+        of patching the running loop with ``nest_asyncio``.
+        """
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.arun(records, total))
+
+        outcome: dict = {}
+
+        def target():
+            try:
+                outcome['result'] = asyncio.run(self.arun(records, total))
+            except BaseException as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+    def stats(self) -> dict:
+        return dict(
+            requests=self.requests,
+            retries=self.retries,
+            resumed=self.resumed,
+        )
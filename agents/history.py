@@ -0,0 +1,216 @@
+import json
+from typing import Callable
+from google.genai.types import Content, Part
+from agents.turn_log import ModelTurn, RagTurn, TurnLog, UserTurn
+
+
+class ExtractiveSummarizer:
+    """Summarizes old turns without a model call: one short line per turn.
+
+    Lines are appended to the previous summary and the oldest are dropped
+    once the summary grows past ``max_tokens``.
+    """
+
+    def __init__(self, max_tokens: int = 600, max_chars_per_field: int = 200) -> None:
+        self.max_tokens = max_tokens
+        self.max_chars_per_field = max_chars_per_field
+
+    def __call__(self, previous_summary: str, turns: list[dict]) -> str:
+        lines = previous_summary.splitlines() if previous_summary else []
+        limit = self.max_chars_per_field
+
+        for turn in turns:
+            line = f"- User: {turn['user'][:limit]}"
+            if turn['assistant']:
+                line += f" | Assistant: {turn['assistant'][:limit]}"
+            if turn['products']:
+                line += f" | Recommended: {', '.join(turn['products'])}"
+            if turn['searched']:
+                line += f" | Search results: {', '.join(turn['searched'])}"
+            lines.append(line)
+
+        while len(lines) > 1 and HistoryManager.estimate_tokens('\n'.join(lines)) > self.max_tokens:
+            lines.pop(0)
+
+        return '\n'.join(lines)
+
+
+class GeminiSummarizer:
+    """Rolling summary written by a (cheap) Gemini model."""
+
+    def __init__(
+        self,
+        client,
+        model_name: str = 'gemini-2.0-flash-001',
+        max_output_tokens: int = 400,
+    ) -> None:
+
+        self.client = client
+        self.model_name = model_name
+        self.max_output_tokens = max_output_tokens
+
+    def __call__(self, previous_summary: str, turns: list[dict]) -> str:
+        prompt = (
+            "Update the summary of a conversation between a bank customer and a "
+            "Bank Misr sales assistant. Keep the customer's needs, constraints and "
+            "language, and every product name that was discussed or recommended.\n\n"
+            f"Current summary:\n{previous_summary or '(empty)'}\n\n"
+            f"New turns:\n{json.dumps(turns, ensure_ascii=False)}"
+        )
+
+        response = self.client.models.generate_content(
+            model=self.model_name,
+            contents=prompt,
+            config={
+                'temperature': 0,
+                'max_output_tokens': self.max_output_tokens,
+            }
+        )
+        return response.text or previous_summary
+
+
+class HistoryManager:
+    """Builds the token-budgeted view of the chat history sent to the model.
+
+    The full ``TurnLog`` is never modified. ``compact`` returns:
+        * a rolling summary of the distant past (one user ``Content``),
+        * older turns with RAG result blocks collapsed to product-id
+          references and model answers reduced to text plus product names,
+        * the newest ``keep_recent_turns`` turns verbatim.
+
+    Turns only ever move towards the summary, so the summary is extended
+    incrementally and never rebuilt.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 6000,
+        keep_recent_turns: int = 2,
+        summarizer: Callable[[str, list[dict]], str] | None = None,
+    ) -> None:
+
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.summarizer = summarizer or ExtractiveSummarizer()
+
+        self.summary = ''
+        self.summarized_turns = 0
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        # ~4 characters per token is close enough for budgeting and needs
+        # no tokenizer round-trip.
+        return len(text) // 4 + 1
+
+    @staticmethod
+    def collapsed(record) -> Content:
+        if isinstance(record, RagTurn):
+            text = "Earlier search results (details omitted): " + \
+                (', '.join(record.product_ids) if record.product_ids else 'no new products')
+            return Content(role='user', parts=[Part(text=text)])
+
+        if isinstance(record, ModelTurn) and record.ok:
+            short = dict(
+                conversational_response=record.conversational_response,
+                conversation_langues=record.conversation_langues,
+                recommended_products=[
+                    prod.product_name for prod in record.recommended_products or ()
+                ],
+            )
+            return Content(
+                role='model', parts=[Part(text=json.dumps(short, ensure_ascii=False))])
+
+        return record.to_content()
+
+    @staticmethod
+    def content_text(content: Content) -> str:
+        return ''.join(part.text or '' for part in content.parts or [])
+
+    @staticmethod
+    def describe_turn(turn: list) -> dict:
+        described = dict(user='', assistant='', products=[], searched=[])
+
+        for record in turn:
+            if isinstance(record, UserTurn):
+                described['user'] = record.text
+            elif isinstance(record, RagTurn):
+                described['searched'] += list(record.product_ids)
+            elif record.ok:
+                described['assistant'] = record.conversational_response
+                described['products'] += [
+                    prod.product_name for prod in record.recommended_products or ()
+                ]
+
+        return described
+
+    def summary_content(self) -> Content:
+        return Content(
+            role='user',
+            parts=[Part(text=f"Summary of the earlier conversation:\n{self.summary}")]
+        )
+
+    def summary_tokens(self) -> int:
+        return self.estimate_tokens(self.content_text(self.summary_content())) if self.summary else 0
+
+    def summarize(self, turns: list[list], end: int) -> None:
+        """Extends the summary with ``turns[self.summarized_turns:end]``."""
+
+        self.summary = self.summarizer(
+            self.summary,
+            [self.describe_turn(turn) for turn in turns[self.summarized_turns:end]]
+        )
+        self.summarized_turns = end
+
+    def compact(self, records) -> list[Content]:
+
+        turns = TurnLog.group_turns(records)
+
+        recent_start = max(len(turns) - self.keep_recent_turns, self.summarized_turns)
+        window: list[list[Content]] = []
+
+        used = 0
+        for turn in turns[recent_start:]:
+            rendered = [record.to_content() for record in turn]
+            used += sum(self.estimate_tokens(self.content_text(c)) for c in rendered)
+            window.append(rendered)
+
+        budget = self.token_budget - self.summary_tokens()
+
+        # walk back from the recent turns and keep collapsed turns while
+        # they fit; everything older goes to the summary.
+        costs: list[int] = []
+        window_start = recent_start
+        for turn_i in range(recent_start - 1, self.summarized_turns - 1, -1):
+            rendered = [self.collapsed(record) for record in turns[turn_i]]
+            cost = sum(self.estimate_tokens(self.content_text(c)) for c in rendered)
+
+            if used + cost > budget:
+                break
+
+            used += cost
+            window.insert(0, rendered)
+            costs.insert(0, cost)
+            window_start = turn_i
+
+        if window_start > self.summarized_turns:
+            self.summarize(turns, window_start)
+
+            # the summary grew; the oldest collapsed turns follow it until
+            # the window fits next to it again.
+            while costs and used + self.summary_tokens() > self.token_budget:
+                moved = 0
+                while costs and used + self.summary_tokens() > self.token_budget:
+                    used -= costs.pop(0)
+                    window.pop(0)
+                    moved += 1
+                self.summarize(turns, self.summarized_turns + moved)
+
+        compacted = [self.summary_content()] if self.summary else []
+        for rendered in window:
+            compacted.extend(rendered)
+
+        return compacted
+
+    def reset(self) -> None:
+        self.summary = ''
+        self.summarized_turns = 0
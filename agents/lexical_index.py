@@ -0,0 +1,173 @@
+import os
+import numpy as np
+
+
+class LexicalIndex:
+    """BM25 inverted index over ``clean_text`` tokens, stored as flat arrays.
+
+    Postings are kept in CSR form: the postings of term ``t`` are
+    ``docs[offsets[t]:offsets[t + 1]]``, each with its precomputed BM25
+    weight (idf times the saturated, length-normalized term frequency).
+    Scoring a query is a gather of its terms' postings and one
+    ``np.bincount``. Rows are the rows of the ``MmapVecStore`` it was built
+    with; ``fingerprint`` ties the two together.
+
+    Persisted as one uncompressed ``lexical.npz`` next to the vector store.
+    """
+
+    FILE = 'lexical.npz'
+
+    def __init__(
+        self,
+        terms: list[str],
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        weights: np.ndarray,
+        n_docs: int,
+        fingerprint: str | None = None,
+    ) -> None:
+
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.weights = weights
+        self.n_docs = n_docs
+        self.fingerprint = fingerprint
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    @staticmethod
+    def tokenize(text: str) -> list[str]:
+        """Tokens of an already cleaned text (see ``agents.text_cleaner``).
+
+        ``clean_text`` space-separates words, numbers and symbols, so this
+        only splits on whitespace and drops punctuation-only tokens; numbers
+        such as "1,000" or "1.5" stay whole.
+        """
+
+        tokens = []
+        for token in text.split():
+            token = token.strip(".,-’'")
+            if token and (len(token) > 1 or token.isalnum()):
+                tokens.append(token)
+        return tokens
+
+    @classmethod
+    def build(
+        cls,
+        texts: list[str],
+        k1: float = 1.2,
+        b: float = 0.75,
+        fingerprint: str | None = None,
+    ) -> "LexicalIndex":
+
+        doc_terms: list[dict[str, int]] = []
+        for text in texts:
+            counts: dict[str, int] = {}
+            for token in cls.tokenize(text):
+                counts[token] = counts.get(token, 0) + 1
+            doc_terms.append(counts)
+
+        doc_len = np.array([sum(counts.values()) for counts in doc_terms], dtype=np.float32)
+        avg_len = float(doc_len.mean()) if len(doc_len) and doc_len.mean() > 0 else 1.0
+
+        terms = sorted({term for counts in doc_terms for term in counts})
+        term_ids = {term: i for i, term in enumerate(terms)}
+
+        postings: list[list[tuple[int, int]]] = [[] for _ in terms]
+        for row, counts in enumerate(doc_terms):
+            for term, tf in counts.items():
+                postings[term_ids[term]].append((row, tf))
+
+        n_docs = len(texts)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(plist) for plist in postings])
+
+        docs = np.zeros(int(offsets[-1]), dtype=np.int32)
+        tfs = np.zeros(int(offsets[-1]), dtype=np.float32)
+        for t, plist in enumerate(postings):
+            if plist:
+                docs[offsets[t]:offsets[t + 1]], tfs[offsets[t]:offsets[t + 1]] = zip(*plist)
+
+        doc_freq = np.diff(offsets).astype(np.float32)
+        idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+        norm = k1 * (1 - b + b * doc_len[docs] / avg_len)
+        weights = np.repeat(idf, np.diff(offsets)) * tfs * (k1 + 1) / (tfs + norm)
+
+        return cls(terms, offsets, docs, weights.astype(np.float32), n_docs, fingerprint)
+
+    @classmethod
+    def exists(cls, persist_directory: str) -> bool:
+        return os.path.isfile(os.path.join(persist_directory, cls.FILE))
+
+    def save(self, persist_directory: str) -> None:
+        terms_blob = '\n'.join(self.terms).encode('utf-8')
+
+        path = os.path.join(persist_directory, self.FILE)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(
+                f,
+                terms=np.frombuffer(terms_blob, dtype=np.uint8),
+                offsets=self.offsets,
+                docs=self.docs,
+                weights=self.weights,
+                n_docs=np.array(self.n_docs),
+                fingerprint=np.array(self.fingerprint or ''),
+            )
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, persist_directory: str) -> "LexicalIndex":
+        with np.load(os.path.join(persist_directory, cls.FILE)) as arrays:
+            terms_blob = arrays['terms'].tobytes().decode('utf-8')
+            return cls(
+                terms=terms_blob.split('\n') if terms_blob else [],
+                offsets=arrays['offsets'],
+                docs=arrays['docs'],
+                weights=arrays['weights'],
+                n_docs=int(arrays['n_docs']),
+                fingerprint=str(arrays['fingerprint']) or None,
+            )
+
+    def scores(self, text: str) -> np.ndarray:
+        """BM25 score of every row for the cleaned query ``text``."""
+
+        term_ids = {
+            self.term_ids[token] for token in self.tokenize(text) if token in self.term_ids}
+        if not term_ids:
+            return np.zeros(self.n_docs, dtype=np.float32)
+
+        spans = [slice(self.offsets[t], self.offsets[t + 1]) for t in term_ids]
+        return np.bincount(
+            np.concatenate([self.docs[s] for s in spans]),
+            weights=np.concatenate([self.weights[s] for s in spans]),
+            minlength=self.n_docs
+        ).astype(np.float32)
+
+    def search(
+        self,
+        text: str,
+        top_k: int,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Rows and scores of the best ``top_k`` rows with a non-zero score,
+        other than the ``exclude`` rows and only among ``rows`` if given."""
+
+        scores = self.scores(text)
+        if rows is not None:
+            partition = np.zeros(self.n_docs, dtype=np.float32)
+            partition[rows] = scores[rows]
+            scores = partition
+        if exclude is not None and len(exclude):
+            scores[exclude] = 0
+
+        rows = np.flatnonzero(scores)
+        if top_k < len(rows):
+            rows = rows[np.argpartition(-scores[rows], max(top_k - 1, 0))[:top_k]]
+        rows = rows[np.argsort(-scores[rows], kind='stable')]
+
+        return rows, scores[rows]
@@ -0,0 +1,174 @@
+import json
+import os
+import re
+import numpy as np
+from agents.text_cleaner import language
+
+
+class ProductMetadata:
+    """Structured fields of every product in the store, and its category partitions.
+
+    ``records[row]`` holds the fields extracted by ``extract`` for that row:
+    ``category`` (the "Credit Card:" style prefix of the description),
+    ``language`` ('en' or 'ar') and ``fees``, the amounts quoted next to a
+    fee, charge or commission ("a fee of EGP 5", "a 1% charge"). ``partitions`` maps each lowercased
+    category to its sorted store rows, so a search filtered by category
+    only reads those rows.
+
+    Persisted as ``metadata.json`` next to the store and tied to it by
+    ``fingerprint``.
+    """
+
+    FILE = 'metadata.json'
+
+    FILTERS = ('category', 'language', 'has_fees', 'max_fee')
+
+    CATEGORY_RE = re.compile(r'^\s*([^:.\n]{1,40}):')
+    # a sentence ends at punctuation followed by whitespace, so the point of
+    # "EGP 150.50" does not end one.
+    SENTENCE_END_RE = re.compile(r'(?<=[.!?\u061f])\s+')
+    FEE_RE = re.compile(r'\b(?:fees?|charges?|commissions?)\b', re.IGNORECASE)
+    AMOUNT_RE = re.compile(
+        r'\b(EGP|USD|EUR|LE)\s?(\d[\d,]*(?:\.\d+)?)'
+        r'|(\d[\d,]*(?:\.\d+)?)\s?(%|(?:EGP|USD|EUR|LE)\b)',
+        re.IGNORECASE
+    )
+
+    # words an amount may be away from its fee word: after it ("fees are
+    # set at 0.5%") or before it ("250 EGP issuance fee"). Further away, e.g.
+    # "4% monthly interest" or "50% discount on fees", it is not the fee.
+    WORDS_AFTER_FEE = 3
+    WORDS_BEFORE_FEE = 1
+
+    def __init__(self, records: list[dict], fingerprint: str | None = None) -> None:
+
+        self.records = records
+        self.fingerprint = fingerprint
+
+        # lowercased category -> sorted rows; 'other' holds the products
+        # without a category prefix.
+        rows_by_category: dict[str, list[int]] = {}
+        for row, record in enumerate(records):
+            rows_by_category.setdefault(record['category'].lower(), []).append(row)
+        self.partitions = {
+            category: np.array(rows, dtype=np.int64)
+            for category, rows in rows_by_category.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def categories(self) -> list[str]:
+        return sorted({record['category'] for record in self.records})
+
+    @classmethod
+    def extract(cls, values: list[str]) -> dict:
+        """Metadata of one product from the values of its doc info columns."""
+
+        category = 'other'
+        for value in values:
+            match = cls.CATEGORY_RE.match(value)
+            if match is not None:
+                category = match.group(1).strip()
+                break
+
+        fees = []
+        for sentence in cls.SENTENCE_END_RE.split(' '.join(values)):
+            for match in cls.fee_amounts(sentence):
+                unit = match.group(1) or match.group(4)
+                amount = match.group(2) or match.group(3)
+                fees.append(dict(
+                    amount=float(amount.replace(',', '')),
+                    unit=unit.upper(),
+                ))
+
+        return dict(
+            category=category,
+            language=language(' '.join(values)),
+            fees=fees,
+        )
+
+    @classmethod
+    def fee_amounts(cls, sentence: str) -> list[re.Match]:
+        """The ``AMOUNT_RE`` matches of ``sentence`` next to a fee word."""
+
+        keywords = list(cls.FEE_RE.finditer(sentence))
+        if not keywords:
+            return []
+
+        amounts = []
+        for match in cls.AMOUNT_RE.finditer(sentence):
+            for keyword in keywords:
+                if keyword.end() <= match.start():
+                    gap, max_words = sentence[keyword.end():match.start()], cls.WORDS_AFTER_FEE
+                else:
+                    gap, max_words = sentence[match.end():keyword.start()], cls.WORDS_BEFORE_FEE
+
+                # a comma or semicolon starts another clause.
+                if len(gap.split()) <= max_words and not re.search(r'[,;]', gap):
+                    amounts.append(match)
+                    break
+
+        return amounts
+
+    @classmethod
+    def from_values(cls, rows: list[list[str]], fingerprint: str | None = None) -> "ProductMetadata":
+        return cls([cls.extract(values) for values in rows], fingerprint)
+
+    @classmethod
+    def exists(cls, persist_directory: str) -> bool:
+        return os.path.isfile(os.path.join(persist_directory, cls.FILE))
+
+    def save(self, persist_directory: str) -> None:
+        path = os.path.join(persist_directory, self.FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(dict(fingerprint=self.fingerprint, records=self.records), f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, persist_directory: str) -> "ProductMetadata":
+        with open(os.path.join(persist_directory, cls.FILE), encoding='utf-8') as f:
+            stored = json.load(f)
+        return cls(stored['records'], stored.get('fingerprint'))
+
+    def rows(self, filters: dict) -> np.ndarray:
+        """Sorted rows of the products matching every filter.
+
+        ``category`` is one category or a list of them (case-insensitive),
+        ``language`` is 'en' or 'ar', ``has_fees`` keeps products with (or
+        without) quoted fees and ``max_fee`` drops products quoting a fee
+        above it (percentages are not compared).
+        """
+
+        unknown = set(filters) - set(self.FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown filters: {sorted(unknown)}, expected some of {self.FILTERS}")
+
+        categories = filters.get('category')
+        if categories is None:
+            rows = np.arange(len(self.records), dtype=np.int64)
+        else:
+            if isinstance(categories, str):
+                categories = [categories]
+            empty = np.zeros(0, dtype=np.int64)
+            partitions = [self.partitions.get(category.lower(), empty) for category in categories]
+            # one partition is already sorted and unique.
+            rows = partitions[0] if len(partitions) == 1 else np.unique(np.concatenate([empty] + partitions))
+
+        checks = []
+        if 'language' in filters:
+            checks.append(lambda record: record['language'] == filters['language'])
+        if 'has_fees' in filters:
+            checks.append(lambda record: bool(record['fees']) == filters['has_fees'])
+        if 'max_fee' in filters:
+            checks.append(lambda record: all(
+                fee['amount'] <= filters['max_fee'] for fee in record['fees'] if fee['unit'] != '%'))
+
+        if checks:
+            rows = np.array([
+                row for row in rows.tolist()
+                if all(check(self.records[row]) for check in checks)
+            ], dtype=np.int64)
+
+        return rows
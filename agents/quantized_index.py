@@ -0,0 +1,215 @@
+import os
+import numpy as np
+from agents.vec_store import MmapVecStore
+from agents.vecdb2 import VectorSearchEngine
+
+
+class QuantizedSearchEngine:
+    """Top-k over compressed codes, re-scored against the full-precision matrix.
+
+    ``kind`` selects the codes kept in memory:
+
+        int8    one byte per dimension, symmetric per-dimension scale
+                (4x smaller than float32); approximate scores are
+                ``codes @ (scale * query)``, computed in row blocks.
+        binary  one bit per dimension, the sign of the vector minus the
+                catalog mean (32x smaller); candidates are the rows with
+                the smallest Hamming distance to the query's code.
+
+    The best ``oversample * top_k`` rows by approximate score are re-scored
+    exactly with ``matrix``, normally the memory-mapped ``vectors.npy`` of
+    the store, so only those rows' pages are read. ``search`` and
+    ``search_many`` return exact cosine scores, like ``VectorSearchEngine``.
+
+    Codes are persisted as ``quantized_<kind>.npz`` next to the store and
+    tied to it by ``fingerprint``.
+    """
+
+    KINDS = ('int8', 'binary')
+    OVERSAMPLE = {'int8': 4, 'binary': 20}
+
+    # rows converted to float32 at a time by the int8 scan; small enough
+    # for the converted block to stay in cache.
+    BLOCK_ROWS = 2048
+
+    def __init__(
+        self,
+        kind: str,
+        codes: np.ndarray,
+        params: np.ndarray,
+        matrix: np.ndarray | None = None,
+        fingerprint: str | None = None,
+        oversample: int | None = None,
+    ) -> None:
+
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown quantization: {kind!r}, expected one of {self.KINDS}")
+
+        self.kind = kind
+        self.codes = codes
+        # int8: per-dimension scale; binary: per-dimension threshold (mean).
+        self.params = params
+        self.matrix = matrix
+        self.fingerprint = fingerprint
+        self.oversample = oversample if oversample is not None else self.OVERSAMPLE[kind]
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.params.nbytes
+
+    @classmethod
+    def file_name(cls, kind: str) -> str:
+        return f'quantized_{kind}.npz'
+
+    @staticmethod
+    def pack_bits(vectors: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+        bits = np.packbits(vectors > thresholds, axis=-1)
+
+        # pad to whole 64-bit words so Hamming distances run on uint64.
+        pad = -bits.shape[-1] % 8
+        if pad:
+            bits = np.pad(bits, [(0, 0)] * (bits.ndim - 1) + [(0, pad)])
+        return np.ascontiguousarray(bits).view(np.uint64)
+
+    @classmethod
+    def build(
+        cls,
+        kind: str,
+        matrix: np.ndarray,
+        fingerprint: str | None = None,
+        oversample: int | None = None,
+    ) -> "QuantizedSearchEngine":
+        """Quantize an L2-normalized float32 ``matrix`` (kept for re-scoring)."""
+
+        if kind not in cls.KINDS:
+            raise ValueError(f"Unknown quantization: {kind!r}, expected one of {cls.KINDS}")
+
+        n_docs, dim = matrix.shape
+        codes = np.zeros((n_docs, dim if kind == 'int8' else -(-dim // 64)),
+                         dtype=np.int8 if kind == 'int8' else np.uint64)
+
+        if kind == 'int8':
+            params = np.zeros(dim, dtype=np.float32)
+            for start in range(0, n_docs, cls.BLOCK_ROWS):
+                block = np.abs(matrix[start:start + cls.BLOCK_ROWS])
+                np.maximum(params, block.max(axis=0), out=params)
+            params = params / 127
+            params[params == 0] = 1.0
+
+            for start in range(0, n_docs, cls.BLOCK_ROWS):
+                block = np.asarray(matrix[start:start + cls.BLOCK_ROWS], dtype=np.float32)
+                codes[start:start + cls.BLOCK_ROWS] = np.clip(
+                    np.rint(block / params), -127, 127)
+        else:
+            params = np.zeros(dim, dtype=np.float64)
+            for start in range(0, n_docs, cls.BLOCK_ROWS):
+                params += matrix[start:start + cls.BLOCK_ROWS].sum(axis=0)
+            params = (params / max(n_docs, 1)).astype(np.float32)
+
+            for start in range(0, n_docs, cls.BLOCK_ROWS):
+                codes[start:start + cls.BLOCK_ROWS] = cls.pack_bits(
+                    matrix[start:start + cls.BLOCK_ROWS], params)
+
+        return cls(kind, codes, params, matrix, fingerprint, oversample)
+
+    @classmethod
+    def exists(cls, persist_directory: str, kind: str) -> bool:
+        return os.path.isfile(os.path.join(persist_directory, cls.file_name(kind)))
+
+    def save(self, persist_directory: str) -> None:
+        path = os.path.join(persist_directory, self.file_name(self.kind))
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(
+                f,
+                codes=self.codes,
+                params=self.params,
+                fingerprint=np.array(self.fingerprint or ''),
+            )
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(
+        cls,
+        persist_directory: str,
+        kind: str,
+        matrix: np.ndarray | None = None,
+        oversample: int | None = None,
+    ) -> "QuantizedSearchEngine":
+
+        with np.load(os.path.join(persist_directory, cls.file_name(kind))) as arrays:
+            return cls(
+                kind,
+                codes=arrays['codes'],
+                params=arrays['params'],
+                matrix=matrix,
+                fingerprint=str(arrays['fingerprint']) or None,
+                oversample=oversample,
+            )
+
+    def approximate_scores(self, query_vecs: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """(n_queries, n_docs) scores, higher is closer; only of ``rows`` if given."""
+
+        codes = self.codes if rows is None else self.codes[rows]
+
+        if self.kind == 'int8':
+            scaled = np.ascontiguousarray((query_vecs * self.params).T)
+            scores = np.empty((len(codes), len(query_vecs)), dtype=np.float32)
+            for start in range(0, len(codes), self.BLOCK_ROWS):
+                block = codes[start:start + self.BLOCK_ROWS].astype(np.float32)
+                np.dot(block, scaled, out=scores[start:start + self.BLOCK_ROWS])
+            return scores.T
+
+        query_codes = self.pack_bits(query_vecs, self.params)
+        distances = np.empty((len(query_vecs), len(codes)), dtype=np.int32)
+        for i, query_code in enumerate(query_codes):
+            distances[i] = np.bitwise_count(codes ^ query_code).sum(axis=1, dtype=np.int32)
+        return -distances
+
+    def rescore(self, query_vec: np.ndarray, rows: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        # sorted rows read the mmapped matrix front to back.
+        rows = np.sort(rows)
+        exact = np.asarray(self.matrix[rows], dtype=np.float32) @ query_vec  # type: ignore
+        best, scores = VectorSearchEngine.top_k(exact, top_k)
+        return rows[best], scores
+
+    def search_many(
+        self,
+        query_vecs,
+        top_k: int,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+
+        query_vecs = MmapVecStore.normalize(np.asarray(query_vecs))
+
+        if rows is not None and exclude is not None and len(exclude):
+            rows = np.setdiff1d(rows, exclude, assume_unique=True)
+
+        approximate = self.approximate_scores(query_vecs, rows)
+        available = VectorSearchEngine.mask(approximate, exclude if rows is None else None)
+        top_k = min(top_k, available)
+
+        candidates, _ = VectorSearchEngine.top_k(
+            approximate, min(top_k * self.oversample, available))
+        if rows is not None:
+            candidates = rows[candidates]
+
+        top_rows = np.zeros((len(query_vecs), top_k), dtype=np.int64)
+        scores = np.zeros((len(query_vecs), top_k), dtype=np.float32)
+        for i, query_vec in enumerate(query_vecs):
+            top_rows[i], scores[i] = self.rescore(query_vec, candidates[i], top_k)
+        return top_rows, scores
+
+    def search(
+        self,
+        query_vec,
+        top_k: int,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+
+        rows_out, scores = self.search_many(query_vec, top_k, exclude, rows)
+        return rows_out[0], scores[0]
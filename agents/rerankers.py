@@ -0,0 +1,221 @@
+from __future__ import annotations
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import NodeWithScore
+
+
+class Reranker:
+    """Reorders retrieved candidates and keeps the best ``top_n``."""
+
+    name = 'base'
+
+    def __init__(self, top_n: int = 2) -> None:
+        self.top_n = top_n
+
+    def rerank(self, query: str, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        raise NotImplementedError
+
+    async def arerank(self, query: str, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        # blocking or CPU-bound backends run off the event loop.
+        return await asyncio.to_thread(self.rerank, query, nodes)
+
+
+class CohereReranker(Reranker):
+    """Remote rerank through Cohere, one network round-trip per call."""
+
+    name = 'cohere'
+
+    def __init__(
+        self,
+        cohere_api_key: str,
+        top_n: int = 2,
+        model: str = "rerank-english-v3.0",
+    ) -> None:
+        super().__init__(top_n)
+
+        from llama_index.postprocessor.cohere_rerank import CohereRerank
+
+        self.model = model
+        self.cohere_api_key = cohere_api_key
+        self.postprocessor = CohereRerank(
+            top_n=top_n,
+            model=model,
+            api_key=cohere_api_key
+        )
+        self.async_client = None
+
+    def rerank(self, query: str, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        return self.postprocessor.postprocess_nodes(
+            nodes=nodes,
+            query_str=query
+        )
+
+    async def arerank(self, query: str, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        # CohereRerank has no async path, so the async Cohere client is
+        # called directly.
+        if not nodes:
+            return []
+
+        if self.async_client is None:
+            from cohere import AsyncClientV2
+            self.async_client = AsyncClientV2(api_key=self.cohere_api_key)
+
+        response = await self.async_client.rerank(
+            model=self.model,
+            query=query,
+            documents=[node.text for node in nodes],
+            top_n=self.top_n,
+        )
+
+        from llama_index.core.schema import NodeWithScore
+
+        return [
+            NodeWithScore(node=nodes[result.index].node, score=result.relevance_score)
+            for result in response.results
+        ]
+
+
+class CosineReranker(Reranker):
+    """Ranks by the retrieval cosine scores, no extra model and no network.
+
+    ``VecDB.search`` scores dense and hybrid candidates alike by their cosine
+    similarity to the query, so this never ranks by RRF score.
+    """
+
+    name = 'cosine'
+
+    def rerank(self, query: str, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        return sorted(
+            nodes,
+            key=lambda node: node.score or 0.0,
+            reverse=True
+        )[:self.top_n]
+
+    async def arerank(self, query: str, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        return self.rerank(query, nodes)
+
+
+class CrossEncoderReranker(Reranker):
+    """Scores (query, doc) pairs with a small sentence-transformers cross-encoder on CPU."""
+
+    name = 'cross-encoder'
+
+    def __init__(
+        self,
+        top_n: int = 2,
+        model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+    ) -> None:
+        super().__init__(top_n)
+
+        from sentence_transformers import CrossEncoder
+
+        self.model = model
+        self.cross_encoder = CrossEncoder(model, device='cpu')
+
+    def rerank(self, query: str, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        if not nodes:
+            return []
+
+        scores = self.cross_encoder.predict(
+            [(query, node.text) for node in nodes]
+        )
+
+        ranked = sorted(
+            zip(nodes, scores),
+            key=lambda pair: pair[1],
+            reverse=True
+        )[:self.top_n]
+
+        from llama_index.core.schema import NodeWithScore
+
+        return [
+            NodeWithScore(node=node.node, score=float(score))
+            for node, score in ranked
+        ]
+
+
+class RerankCache:
+    """LRU cache of rerank results keyed by (backend, query, candidate id set).
+
+    The candidate set is order-independent, so the same query retrieving the
+    same candidates in a different order still hits.
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+
+        self.entries: OrderedDict[tuple, list[tuple[str, float | None]]] = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def make_key(backend: str, query: str, nodes: list[NodeWithScore]) -> tuple:
+        return (backend, query, frozenset(node.node.node_id for node in nodes))
+
+    def get(self, key: tuple, nodes: list[NodeWithScore]) -> list[NodeWithScore] | None:
+        with self.lock:
+            ranked = self.entries.get(key)
+            if ranked is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        from llama_index.core.schema import NodeWithScore
+
+        by_id = {node.node.node_id: node for node in nodes}
+        return [
+            NodeWithScore(node=by_id[node_id].node, score=score)
+            for node_id, score in ranked
+        ]
+
+    def put(self, key: tuple, ranked: list[NodeWithScore]) -> None:
+        with self.lock:
+            self.entries[key] = [
+                (node.node.node_id, node.score) for node in ranked
+            ]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return dict(
+            size=len(self.entries),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+        )
+
+
+def make_reranker(
+    backend: str | Reranker,
+    cohere_api_key: str | None = None,
+    top_n: int = 2,
+) -> Reranker:
+
+    if isinstance(backend, Reranker):
+        return backend
+
+    if backend == CohereReranker.name:
+        if cohere_api_key is None:
+            raise ValueError("The cohere reranker needs a cohere_api_key")
+        return CohereReranker(cohere_api_key=cohere_api_key, top_n=top_n)
+
+    if backend == CosineReranker.name:
+        return CosineReranker(top_n=top_n)
+
+    if backend == CrossEncoderReranker.name:
+        return CrossEncoderReranker(top_n=top_n)
+
+    raise ValueError(f"Unknown reranker backend: {backend}")
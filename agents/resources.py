@@ -0,0 +1,240 @@
+from __future__ import annotations
+import hashlib
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from agents.response_cache import ResponseCache
+from agents.vec_store import MmapVecStore
+from agents.vecdb2 import VecDB
+
+if TYPE_CHECKING:
+    from google import genai
+
+
+class ResourceRegistry:
+    """Process-wide registry of the heavy, session-independent resources.
+
+    Gemini clients (and their HTTP connection pools) are shared per API key,
+    and loaded vector indexes (mmapped store, search engine, query
+    embedding client, reranker and caches) per Cohere key and index
+    settings. Every Streamlit session gets the same objects, so only the
+    per-user chat state is built per session. API keys are only kept as
+    sha256 digests in the registry keys.
+    """
+
+    # imported by ``warm_up`` so the first chat does not pay for them.
+    WARM_MODULES = (
+        'google.genai',
+        'llama_index.core.schema',
+        'llama_index.embeddings.cohere',
+        'llama_index.postprocessor.cohere_rerank',
+    )
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.key_locks: dict[tuple, threading.Lock] = {}
+
+        self.clients: dict[tuple, genai.Client] = {}
+        self.stores: dict[str, MmapVecStore] = {}
+        # manifest mtime of every loaded store, to notice a rewrite.
+        self.store_versions: dict[str, int] = {}
+        self.vecdbs: dict[tuple, VecDB] = {}
+        self.response_caches: dict[tuple, ResponseCache] = {}
+
+        self.warm_thread: threading.Thread | None = None
+
+        # shared by all sessions for background work such as speculative
+        # retrieval; threads are only started when work is submitted.
+        self.executor = ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix='agent-background')
+
+    @staticmethod
+    def key_digest(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+    def key_lock(self, key: tuple) -> threading.Lock:
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def gemini_client(self, api_key: str) -> genai.Client:
+        from google import genai
+
+        key = ('gemini', self.key_digest(api_key))
+
+        with self.key_lock(key):
+            client = self.clients.get(key)
+            if client is None:
+                client = self.clients[key] = genai.Client(api_key=api_key)
+
+        return client
+
+    def store(self, persist_directory: str = "./vec_db") -> MmapVecStore | None:
+        """The mmapped store of ``persist_directory``, shared by every key.
+
+        ``None`` when there is no binary store yet (``VecDB.load_vecdb``
+        then migrates the old JSON storage). A store rewritten since it was
+        loaded (its manifest changed) is loaded again.
+        """
+
+        with self.key_lock(('store', persist_directory)):
+            version = MmapVecStore.modified_at(persist_directory)
+
+            store = self.stores.get(persist_directory)
+            if store is not None and self.store_versions.get(persist_directory) != version:
+                store = None
+                del self.stores[persist_directory]
+
+            if store is None and version is not None:
+                store = self.stores[persist_directory] = \
+                    MmapVecStore.load(persist_directory)
+                self.store_versions[persist_directory] = version
+
+        return store
+
+    def invalidate(self, persist_directory: str = "./vec_db") -> None:
+        """Reload a rewritten store and every shared ``VecDB`` serving it.
+
+        The VecDBs are reloaded in place, so running sessions (which hold
+        them) serve the new store too. Called by ``VecDB.vectorize_db``.
+        """
+
+        with self.lock:
+            keys = [key for key in self.vecdbs if key[2] == persist_directory]
+        if persist_directory not in self.stores and not keys:
+            return
+
+        store = self.store(persist_directory)
+        for key in keys:
+            with self.key_lock(key):
+                self.vecdbs[key].reload(store)
+
+    def vecdb(
+        self,
+        cohere_api_key: str,
+        persist_directory: str = "./vec_db",
+        reranker: str = 'cohere',
+        rerank_top_n: int = 2,
+        retrieval: str = 'hybrid',
+        quantization: str | None = None,
+        index: str = 'flat',
+        ivf_lists: int | None = None,
+        ivf_probes: int = 16,
+        embed_model=None,
+    ) -> VecDB:
+        """A loaded ``VecDB``, built once per key and index settings.
+
+        The first caller loads the index while later callers for the same
+        key wait for it instead of loading their own copy. A given
+        ``embed_model`` (instead of the Cohere query model) is told apart
+        by identity; the VecDB keeps it alive while it is registered.
+        """
+
+        key = ('vecdb', self.key_digest(cohere_api_key),
+               persist_directory, reranker, rerank_top_n, retrieval, quantization, index,
+               ivf_lists, ivf_probes, id(embed_model) if embed_model is not None else None)
+
+        store = self.store(persist_directory)
+
+        with self.key_lock(key):
+            vecdb = self.vecdbs.get(key)
+            if vecdb is not None and store is not None and vecdb.store is not store:
+                # the store was rewritten since this VecDB loaded it.
+                vecdb.reload(store)
+
+            if vecdb is None:
+                vecdb = VecDB(
+                    cohere_api_key=cohere_api_key,
+                    persist_directory=persist_directory,
+                    reranker=reranker,
+                    rerank_top_n=rerank_top_n,
+                    retrieval=retrieval,
+                    quantization=quantization,
+                    index=index,
+                    ivf_lists=ivf_lists,
+                    ivf_probes=ivf_probes,
+                    embed_model=embed_model,
+                )
+                vecdb.ensure_loaded(store)
+                self.vecdbs[key] = vecdb
+
+        return vecdb
+
+    def response_cache(
+        self,
+        gemini_api_key: str,
+        cohere_api_key: str,
+        model_name: str,
+        sys_prompt: str,
+    ) -> ResponseCache:
+        """The turn cache shared by every agent with these API keys, model and system prompt.
+
+        Scoped by the keys, so one tenant's answers are never replayed to another.
+        """
+
+        key = ('response_cache', self.key_digest(gemini_api_key), self.key_digest(cohere_api_key),
+               model_name, self.key_digest(sys_prompt))
+
+        with self.key_lock(key):
+            cache = self.response_caches.get(key)
+            if cache is None:
+                cache = self.response_caches[key] = ResponseCache()
+
+        return cache
+
+    def warm_up(self, persist_directory: str = "./vec_db", modules: tuple[str, ...] = ()) -> None:
+        """Import the heavy client libraries and page in the vector store.
+
+        Needs no API key, so it can run before the user has entered one.
+        ``modules`` are imported too (e.g. the UI module that uses them).
+        """
+
+        for module in self.WARM_MODULES + modules:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                # optional backend; the code path that needs it reports it.
+                pass
+
+        store = self.store(persist_directory)
+        if store is not None and len(store.ids):
+            # touch every page of the mmapped matrix once.
+            float(store.vectors.sum())
+
+    def start_warm_up(self, persist_directory: str = "./vec_db", modules: tuple[str, ...] = ()) -> threading.Thread:
+        """Run ``warm_up`` once per process in a background daemon thread."""
+
+        with self.lock:
+            if self.warm_thread is None:
+                self.warm_thread = threading.Thread(
+                    target=self.warm_up,
+                    args=(persist_directory, modules),
+                    name='resource-warm-up',
+                    daemon=True
+                )
+                self.warm_thread.start()
+
+        return self.warm_thread
+
+    def stats(self) -> dict:
+        return dict(
+            gemini_clients=len(self.clients),
+            stores=len(self.stores),
+            vecdbs=len(self.vecdbs),
+            response_caches={
+                f'{key[3]}:{key[1][:8]}:{key[4][:8]}': cache.stats()
+                for key, cache in self.response_caches.items()
+            },
+        )
+
+    def clear(self) -> None:
+        with self.lock:
+            self.clients.clear()
+            self.stores.clear()
+            self.store_versions.clear()
+            self.vecdbs.clear()
+            self.response_caches.clear()
+            self.key_locks.clear()
+
+
+registry = ResourceRegistry()
@@ -0,0 +1,297 @@
+import threading
+import time
+from collections import OrderedDict, deque
+import numpy as np
+from agents.response_formatter import ResponseFormatter
+from agents.turn_log import ModelTurn, RagTurn
+from agents.vec_store import MmapVecStore
+
+
+class CachedTurn:
+    """The records one prompt produced: model responses and RAG context, in order."""
+
+    __slots__ = (
+        'prompt', 'key', 'lang', 'entities', 'embedding', 'records', 'response', 'created', 'hits')
+
+    def __init__(
+        self,
+        prompt: str,
+        key: str,
+        lang: str,
+        entities: frozenset[str],
+        embedding: np.ndarray,
+        records: tuple[ModelTurn | RagTurn, ...],
+        response: ResponseFormatter,
+    ) -> None:
+
+        self.prompt = prompt
+        self.key = key
+        self.lang = lang
+        self.entities = entities
+        self.embedding = embedding
+        self.records = records
+        self.response = response
+        self.created = time.monotonic()
+        self.hits = 0
+
+    @property
+    def scope(self) -> tuple[str, frozenset[str]]:
+        return self.lang, self.entities
+
+    @property
+    def product_ids(self) -> list[str]:
+        return [
+            product_id
+            for record in self.records if isinstance(record, RagTurn)
+            for product_id in record.product_ids
+        ]
+
+
+class ResponseCache:
+    """Semantic cache of whole turns, shared by the sessions of one API key.
+
+    A prompt is looked up by its normalized (cleaned) text first, which
+    needs no embedding. Otherwise it is compared by the cosine similarity of
+    its query embedding (the same cleaned text and embedding cache retrieval
+    uses) against earlier prompts in the same language that name the same
+    products, categories and numbers (``entities``, see
+    ``VecDB.prompt_entities``); at ``min_similarity`` or above the earlier
+    turn is replayed instead of calling Gemini and Cohere again. The entity
+    guard keeps "gold credit card fees" from replaying the answer about the
+    titanium card, however close the two embeddings are.
+
+    Only turns that start with at most ``max_history_turns`` earlier turns
+    in the chat are stored and served, since later answers depend on the
+    conversation. Entries expire after ``ttl`` seconds, the least recently
+    used are evicted past ``max_entries``, and everything is dropped when
+    the product index fingerprint changes (the catalog was rebuilt).
+    ``max_entries=0`` disables the cache.
+
+    Agents wait for the prompt embedding only when ``can_match`` finds
+    entries it could match, and then for ``embed_wait``: the 90th percentile
+    of the recent prompt embedding latencies they report, at most
+    ``max_embed_wait`` seconds.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600.0,
+        min_similarity: float = 0.95,
+        max_history_turns: int = 0,
+        max_embed_wait: float = 0.5,
+    ) -> None:
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        self.max_history_turns = max_history_turns
+        self.max_embed_wait = max_embed_wait
+
+        self.entries: OrderedDict[int, CachedTurn] = OrderedDict()
+        self.next_id = 0
+        self.fingerprint: str | None = None
+        self.lock = threading.Lock()
+
+        # normalized prompt -> entry id.
+        self.keys: dict[str, int] = {}
+
+        # (lang, entities) -> (entry ids, stacked embeddings), rebuilt after a change.
+        self.matrices: dict[tuple[str, frozenset[str]], tuple[list[int], np.ndarray]] = {}
+
+        # seconds the last prompt embeddings took (see embed_wait).
+        self.embed_latencies: deque[float] = deque(maxlen=64)
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def check_fingerprint(self, fingerprint: str | None) -> None:
+        # callers hold the lock.
+        if fingerprint != self.fingerprint:
+            if self.entries:
+                self.invalidations += 1
+            self.clear()
+            self.fingerprint = fingerprint
+
+    def clear(self) -> None:
+        # callers hold the lock.
+        self.entries.clear()
+        self.keys.clear()
+        self.matrices.clear()
+
+    def hit(self, entry_id: int) -> CachedTurn:
+        # callers hold the lock.
+        entry = self.entries[entry_id]
+        self.entries.move_to_end(entry_id)
+        entry.hits += 1
+        self.hits += 1
+        return entry
+
+    def exact(self, key: str, fingerprint: str | None) -> CachedTurn | None:
+        """The entry stored for the normalized prompt ``key``.
+
+        A miss is not counted: the caller goes on with ``get``.
+        """
+
+        with self.lock:
+            self.check_fingerprint(fingerprint)
+
+            entry_id = self.keys.get(key)
+            if entry_id is None:
+                return None
+
+            if time.monotonic() - self.entries[entry_id].created > self.ttl:
+                self.remove_expired()
+                return None
+
+            return self.hit(entry_id)
+
+    def can_match(self, lang: str, entities: frozenset[str], fingerprint: str | None) -> bool:
+        """Whether ``get`` could find an entry for a prompt of this language and entities."""
+
+        with self.lock:
+            self.check_fingerprint(fingerprint)
+            entry_ids, _ = self.matrix((lang, entities))
+            return bool(entry_ids)
+
+    def observe_embed(self, seconds: float) -> None:
+        self.embed_latencies.append(seconds)
+
+    def embed_wait(self) -> float:
+        """Seconds to wait for a prompt embedding: most of them are ready by then."""
+
+        latencies = list(self.embed_latencies)
+        if not latencies:
+            return self.max_embed_wait
+        return min(float(np.percentile(latencies, 90)), self.max_embed_wait)
+
+    def get(
+        self,
+        embedding,
+        lang: str,
+        entities: frozenset[str],
+        fingerprint: str | None,
+    ) -> CachedTurn | None:
+        """The most similar entry with the same language and entities.
+
+        ``embedding=None`` (the prompt embedding was not ready) counts a miss.
+        """
+
+        if embedding is None:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        embedding = MmapVecStore.normalize(np.asarray(embedding))[0]
+        scope = (lang, entities)
+
+        with self.lock:
+            self.check_fingerprint(fingerprint)
+
+            while True:
+                entry_ids, matrix = self.matrix(scope)
+                if not entry_ids:
+                    self.misses += 1
+                    return None
+
+                scores = matrix @ embedding
+                best = int(np.argmax(scores))
+                entry = self.entries[entry_ids[best]]
+
+                if time.monotonic() - entry.created <= self.ttl:
+                    break
+                # expired entries are only dropped when they would match.
+                self.remove_expired()
+
+            if scores[best] < self.min_similarity:
+                self.misses += 1
+                return None
+
+            return self.hit(entry_ids[best])
+
+    def put(
+        self,
+        prompt: str,
+        key: str,
+        lang: str,
+        entities: frozenset[str],
+        embedding,
+        records,
+        response: ResponseFormatter,
+        fingerprint: str | None,
+    ) -> None:
+
+        if not self.enabled:
+            return
+
+        entry = CachedTurn(
+            prompt,
+            key,
+            lang,
+            entities,
+            MmapVecStore.normalize(np.asarray(embedding))[0],
+            tuple(records),
+            response
+        )
+
+        with self.lock:
+            self.check_fingerprint(fingerprint)
+
+            replaced = self.keys.get(key)
+            if replaced is not None:
+                self.remove(replaced)
+
+            self.entries[self.next_id] = entry
+            self.keys[key] = self.next_id
+            self.next_id += 1
+            self.matrices.pop(entry.scope, None)
+
+            while len(self.entries) > self.max_entries:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, entry_id: int) -> None:
+        # callers hold the lock.
+        entry = self.entries.pop(entry_id)
+        if self.keys.get(entry.key) == entry_id:
+            del self.keys[entry.key]
+        self.matrices.pop(entry.scope, None)
+
+    def matrix(self, scope: tuple[str, frozenset[str]]) -> tuple[list[int], np.ndarray]:
+        cached = self.matrices.get(scope)
+        if cached is None:
+            entry_ids = [
+                entry_id for entry_id, entry in self.entries.items() if entry.scope == scope]
+            matrix = np.stack([self.entries[entry_id].embedding for entry_id in entry_ids]) \
+                if entry_ids else np.zeros((0, 0), dtype=np.float32)
+            cached = self.matrices[scope] = (entry_ids, matrix)
+        return cached
+
+    def remove_expired(self) -> None:
+        expired_before = time.monotonic() - self.ttl
+        for entry_id, entry in list(self.entries.items()):
+            if entry.created < expired_before:
+                self.remove(entry_id)
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return dict(
+            size=len(self.entries),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+            invalidations=self.invalidations,
+            embed_wait=self.embed_wait(),
+        )
@@ -0,0 +1,297 @@
+import asyncio
+from typing import AsyncIterator, Callable, Iterator
+from google.genai.types import Candidate, Content, GenerateContentResponse, Part
+from agents.response_formatter import ResponseFormatter
+
+
+class JsonStringFieldParser:
+    """Incremental JSON scanner that emits one top-level string field as it arrives.
+
+    Chunks of the model's JSON output are fed in order, and ``feed`` returns
+    the decoded characters of ``field`` contained in that chunk, so the UI
+    can show the answer before the JSON object is complete. Escapes
+    (including ``\\uXXXX`` and surrogate pairs) may be split across chunks.
+    """
+
+    ESCAPES = {
+        '"': '"', '\\': '\\', '/': '/',
+        'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t',
+    }
+
+    def __init__(self, field: str = 'conversational_response') -> None:
+        self.field = field
+
+        self.stack: list[str] = []
+        self.expecting_key = False
+        self.last_key: str | None = None
+
+        self.in_string = False
+        self.is_key = False
+        self.capturing = False
+        self.escape = False
+        self.unicode_buf: str | None = None
+        self.high_surrogate: int | None = None
+
+        self.key_chars: list[str] = []
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        out: list[str] = []
+
+        for char in chunk:
+            if self.in_string:
+                self._string_char(char, out)
+                continue
+
+            if char == '{':
+                self.stack.append('{')
+                self.expecting_key = True
+
+            elif char == '[':
+                self.stack.append('[')
+
+            elif char in '}]':
+                if self.stack:
+                    self.stack.pop()
+
+            elif char == ',':
+                self.expecting_key = bool(self.stack) and self.stack[-1] == '{'
+
+            elif char == '"':
+                self.in_string = True
+                self.is_key = self.expecting_key and bool(self.stack) and self.stack[-1] == '{'
+                self.capturing = not self.is_key and len(self.stack) == 1 \
+                    and self.last_key == self.field and not self.done
+                self.key_chars = []
+
+            elif char == ':':
+                self.expecting_key = False
+
+        return ''.join(out)
+
+    def _emit(self, text: str, out: list[str]) -> None:
+        if self.is_key:
+            self.key_chars.append(text)
+        elif self.capturing:
+            out.append(text)
+
+    def _string_char(self, char: str, out: list[str]) -> None:
+
+        if self.unicode_buf is not None:
+            self.unicode_buf += char
+            if len(self.unicode_buf) < 4:
+                return
+
+            code = int(self.unicode_buf, 16)
+            self.unicode_buf = None
+
+            if 0xD800 <= code <= 0xDBFF:
+                self.high_surrogate = code
+                return
+
+            if 0xDC00 <= code <= 0xDFFF and self.high_surrogate is not None:
+                code = 0x10000 + ((self.high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self.high_surrogate = None
+
+            self._emit(chr(code), out)
+            return
+
+        if self.escape:
+            self.escape = False
+            if char == 'u':
+                self.unicode_buf = ''
+            else:
+                self._emit(self.ESCAPES.get(char, char), out)
+            return
+
+        if char == '\\':
+            self.escape = True
+
+        elif char == '"':
+            self.in_string = False
+            if self.is_key:
+                self.last_key = ''.join(self.key_chars)
+                self.expecting_key = False
+            elif self.capturing:
+                self.capturing = False
+                self.done = True
+
+        else:
+            self._emit(char, out)
+
+
+class ResponseStream:
+    """Iterates the ``field`` text of a streamed structured Gemini response.
+
+    Iterating yields text deltas as chunks arrive. Once the stream is
+    exhausted the full JSON is validated into ``parsed`` and a
+    ``GenerateContentResponse`` carrying it is built in ``response`` and
+    passed to ``on_complete`` (the agent uses this to append it to history).
+    """
+
+    def __init__(
+        self,
+        chunks: Iterator[GenerateContentResponse],
+        on_complete: Callable[[GenerateContentResponse], None] | None = None,
+        field: str = 'conversational_response',
+    ) -> None:
+
+        self.chunks = chunks
+        self.on_complete = on_complete
+        self.parser = JsonStringFieldParser(field)
+
+        self.text_parts: list[str] = []
+        self.last_chunk: GenerateContentResponse | None = None
+        self.first_chunk: GenerateContentResponse | None = None
+
+        self.parsed: ResponseFormatter | None = None
+        self.response: GenerateContentResponse | None = None
+        self.completed = False
+
+    @staticmethod
+    def text_chunk(text: str) -> GenerateContentResponse:
+        return GenerateContentResponse(
+            candidates=[Candidate(content=Content(role='model', parts=[Part(text=text)]))]
+        )
+
+    @classmethod
+    def from_text(cls, text: str, field: str = 'conversational_response') -> "ResponseStream":
+        """A stream over an already known response, e.g. a cache hit."""
+        return cls(chunks=iter([cls.text_chunk(text)]), field=field)
+
+    def start(self) -> "ResponseStream":
+        """Block until the first chunk arrives (the request is sent lazily)."""
+
+        if self.first_chunk is None and not self.completed:
+            self.first_chunk = next(self.chunks, None)
+        return self
+
+    def _chunks(self) -> Iterator[GenerateContentResponse]:
+        if self.first_chunk is not None:
+            first_chunk, self.first_chunk = self.first_chunk, None
+            yield first_chunk
+        yield from self.chunks
+
+    def __iter__(self) -> Iterator[str]:
+        if self.completed:
+            return
+
+        for chunk in self._chunks():
+            delta = self.feed(chunk)
+            if delta:
+                yield delta
+
+        self._finish()
+
+    def feed(self, chunk: GenerateContentResponse) -> str:
+        self.last_chunk = chunk
+
+        text = chunk.text or ''
+        self.text_parts.append(text)
+
+        return self.parser.feed(text)
+
+    def consume(self) -> ResponseFormatter | None:
+        for _ in self:
+            pass
+        return self.parsed
+
+    def _finish(self) -> None:
+        self.completed = True
+        full_text = ''.join(self.text_parts)
+
+        try:
+            self.parsed = ResponseFormatter.model_validate_json(full_text)
+        except ValueError:
+            self.parsed = None
+
+        self.response = GenerateContentResponse(
+            candidates=self.text_chunk(full_text).candidates,
+            usage_metadata=self.last_chunk.usage_metadata if self.last_chunk else None,
+            model_version=self.last_chunk.model_version if self.last_chunk else None,
+        )
+        self.response.parsed = self.parsed
+
+        if self.on_complete is not None:
+            self.on_complete(self.response)
+
+
+class AsyncResponseStream(ResponseStream):
+    """``ResponseStream`` over an async chunk iterator (``client.aio``).
+
+    ``chunk_timeout`` bounds the wait for every chunk, including the first.
+    If the stream is cancelled, times out, fails or is abandoned before it
+    completes, ``on_abort`` is called instead of ``on_complete``.
+    """
+
+    def __init__(
+        self,
+        chunks: AsyncIterator[GenerateContentResponse],
+        on_complete: Callable[[GenerateContentResponse], None] | None = None,
+        on_abort: Callable[[], None] | None = None,
+        field: str = 'conversational_response',
+        chunk_timeout: float | None = None,
+    ) -> None:
+
+        super().__init__(iter(()), on_complete, field)
+
+        self.achunks = chunks
+        self.on_abort = on_abort
+        self.chunk_timeout = chunk_timeout
+
+    @classmethod
+    def from_text(cls, text: str, field: str = 'conversational_response') -> "AsyncResponseStream":  # type: ignore
+
+        async def chunks():
+            yield cls.text_chunk(text)
+
+        return cls(chunks=chunks(), field=field)
+
+    async def next_chunk(self) -> GenerateContentResponse | None:
+        try:
+            return await asyncio.wait_for(anext(self.achunks), self.chunk_timeout)
+        except StopAsyncIteration:
+            return None
+
+    async def astart(self) -> "AsyncResponseStream":
+        """Wait for the first chunk (time to first token)."""
+
+        if self.first_chunk is None and not self.completed:
+            try:
+                self.first_chunk = await self.next_chunk()
+            except BaseException:
+                self.abort()
+                raise
+        return self
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        if self.completed:
+            return
+
+        try:
+            chunk, self.first_chunk = self.first_chunk, None
+            if chunk is None:
+                chunk = await self.next_chunk()
+
+            while chunk is not None:
+                delta = self.feed(chunk)
+                if delta:
+                    yield delta
+                chunk = await self.next_chunk()
+
+        except BaseException:
+            self.abort()
+            raise
+
+        self._finish()
+
+    async def aconsume(self) -> ResponseFormatter | None:
+        async for _ in self:
+            pass
+        return self.parsed
+
+    def abort(self) -> None:
+        self.completed = True
+        if self.on_abort is not None:
+            self.on_abort()
+            self.on_abort = None
@@ -1,10 +1,22 @@
+import asyncio
+import contextvars
+import time
+import numpy as np
 from google import genai
 from google.genai.types import Content, Part, ContentListUnion
-from typing import Optional, Union
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, wait as wait_futures
+from typing import Literal, Optional, Union
 from pydantic import Field
 from agents.sys_prompt import sys_prompt
 from agents.response_formatter import ResponseFormatter
-from agents.vecdb2 import VecdbChatRAG
+from agents.vecdb2 import Speculation, VecDB, VecdbChatRAG
+from agents.resources import registry
+from agents.response_stream import AsyncResponseStream, ResponseStream
+from agents.history import HistoryManager
+from agents.response_cache import CachedTurn, ResponseCache
+from agents.text_cleaner import language
+from agents.turn_log import ModelTurn, RagTurn, TurnLog
+from agents.tracing import contents_chars, tracer, usage_attributes
 
 
 class UserContent(Content):
@@ -34,17 +46,84 @@ class SalesAgent:
         gemini_api_key: str,
         cohere_api_key: str,
         model_name: str = 'gemini-2.0-flash-001',
-        sys_prompt: str = sys_prompt
+        sys_prompt: str = sys_prompt,
+        history_token_budget: int = 6000,
+        keep_recent_turns: int = 2,
+        client: genai.Client | None = None,
+        shared_vecdb: VecDB | None = None,
+        speculative: Literal['off', 'prefetch', 'inject'] = 'off',
+        speculation_timeout: float = 0.3,
+        speculation_min_words: int = 4,
+        response_cache: ResponseCache | Literal['shared', 'off'] = 'shared',
+        cache_wait: float | None = None,
+        retrieval: Literal['hybrid', 'dense'] = 'hybrid',
+        quantization: Literal['int8', 'binary'] | None = None,
+        index: Literal['flat', 'ivf'] = 'flat',
+        ivf_lists: int | None = None,
+        ivf_probes: int = 16,
+        embed_model=None,
     ):
 
-        self.client = genai.Client(api_key=gemini_api_key)
+        # the client and the loaded index are process-wide (one per API key),
+        # everything else on the agent is per-session chat state.
+        self.client = client if client is not None \
+            else registry.gemini_client(gemini_api_key)
         self.model = self.client.models.generate_content
+        self.stream_model = self.client.models.generate_content_stream
 
+        # the retrieval and index settings and the query embedding model
+        # select the shared VecDB (see VecDB).
+        index_settings = dict(
+            retrieval=retrieval,
+            quantization=quantization,
+            index=index,
+            ivf_lists=ivf_lists,
+            ivf_probes=ivf_probes,
+            embed_model=embed_model,
+        )
         self.vecdb = VecdbChatRAG(
-            cohere_api_key=cohere_api_key
+            cohere_api_key=cohere_api_key,
+            shared=shared_vecdb if shared_vecdb is not None
+            else registry.vecdb(cohere_api_key, **index_settings),
+            **index_settings,
         )
 
-        self.contents = []
+        # full history, used for rendering; only the compacted view of it
+        # is sent to the model.
+        self.contents = TurnLog()
+
+        self.history = HistoryManager(
+            token_budget=history_token_budget,
+            keep_recent_turns=keep_recent_turns,
+        )
+
+        # 'prefetch' retrieves on the raw prompt while the first model call
+        # runs and reuses the result if the model's search query finds the
+        # same candidates; 'inject' waits up to ``speculation_timeout`` for
+        # it before the first call (so it runs before, not alongside, that
+        # call) and sends the results with it, so the model can recommend
+        # without a second round-trip. Either costs a query embed and a
+        # rerank call on every turn it runs, hence off by default and
+        # skipped for prompts under ``speculation_min_words`` words
+        # (greetings, short follow-ups).
+        self.speculative = speculative
+        self.speculation_timeout = speculation_timeout
+        self.speculation_min_words = speculation_min_words
+        self.speculation: Future | None = None
+
+        # whole early turns are replayed from a semantic cache shared by the
+        # sessions of these API keys (see ResponseCache); ``pending_cache``
+        # is the lookup of the current turn, stored once the turn's final
+        # response arrives. The prompt is embedded in the background; when
+        # a cached turn could match it, the lookup waits for the embedding
+        # up to ``cache_wait`` (None: the cache's measured ``embed_wait``)
+        # before the first model call. Speculation reuses the embedding.
+        if response_cache == 'shared':
+            response_cache = registry.response_cache(
+                gemini_api_key, cohere_api_key, model_name, sys_prompt)
+        self.response_cache = response_cache if response_cache != 'off' else None
+        self.cache_wait = cache_wait
+        self.pending_cache: dict | None = None
 
         self.all_model_config = dict(
             model=model_name,
@@ -57,32 +136,561 @@ class SalesAgent:
 
     def generate_response(self, text: str) -> ResponseFormatter:
 
-        self.contents.append(UserContent(text=text))  # type: ignore
+        with tracer.span('agent.generate_response', request_chars=len(text)):
+            cached = self.lookup_cached_turn(text)
+            self.contents.append_user(text)
 
-        return self.invoke()
+            if cached is not None:
+                self.replay_cached_turn(cached)
+                return cached.response
 
-    def invoke(self) -> ResponseFormatter:
+            self.start_speculation(text)
+
+            return self.invoke()
+
+    def cacheable_turn(self) -> bool:
+        cache = self.response_cache
+        return cache is not None and cache.enabled and \
+            len(self.contents.turns()) <= cache.max_history_turns
+
+    def exact_lookup(self, key: str) -> CachedTurn | None:
+        # the fingerprint is unknown until the index is loaded.
+        fingerprint = self.vecdb.index_fingerprint
+        return self.response_cache.exact(key, fingerprint) \
+            if fingerprint is not None else None  # type: ignore
+
+    @staticmethod
+    def embedding_result(embedding) -> np.ndarray | None:
+        """The prompt embedding if it is ready and did not fail."""
+
+        if not embedding.done() or embedding.cancelled() or embedding.exception() is not None:
+            return None
+        return embedding.result()
+
+    def semantic_wait(self, text: str, lang: str) -> float:
+        """How long the lookup waits for the prompt embedding.
+
+        Not at all when no cached turn has the prompt's language and
+        entities, since none could match it.
+        """
+
+        cache = self.response_cache
+        fingerprint = self.vecdb.index_fingerprint
+        if fingerprint is not None and \
+                not cache.can_match(lang, self.vecdb.prompt_entities(text), fingerprint):  # type: ignore
+            return 0.0
+        return self.cache_wait if self.cache_wait is not None else cache.embed_wait()  # type: ignore
+
+    def timed_prompt_embedding(self, text: str) -> np.ndarray:
+        start = time.perf_counter()
+        embedding = self.vecdb.prompt_embedding(text)
+        self.response_cache.observe_embed(time.perf_counter() - start)  # type: ignore
+        return embedding
+
+    def cache_lookup(self, text: str, lang: str, key: str, embedding) -> CachedTurn | None:
+        """The semantic lookup, with ``embedding`` (a future) if it is ready.
+
+        On a miss the turn is remembered for storing.
+        """
+
+        query_vec = self.embedding_result(embedding)
+        entities = self.vecdb.prompt_entities(text) if query_vec is not None else frozenset()
+        cached = self.response_cache.get(  # type: ignore
+            query_vec, lang, entities, self.vecdb.index_fingerprint)
+
+        if cached is None:
+            self.pending_cache = dict(
+                start=len(self.contents),
+                prompt=text,
+                key=key,
+                lang=lang,
+                embedding=embedding,
+                fingerprint=self.vecdb.index_fingerprint,
+            )
+        return cached
+
+    def lookup_cached_turn(self, text: str) -> CachedTurn | None:
+        """A cached turn for ``text``; on a miss the turn is remembered for storing.
+
+        Best-effort: if the prompt is not embedded within ``semantic_wait``
+        or can not be embedded, only the exact lookup is made and the turn
+        runs uncached.
+        """
+
+        self.pending_cache = None
+        if not self.cacheable_turn():
+            return None
+
+        lang = language(text)
+        key = self.vecdb.clean_text(text)
+        with tracer.span('cache.response', lang=lang) as span:
+            cached = self.exact_lookup(key)
+
+            if cached is None:
+                embedding = registry.executor.submit(
+                    contextvars.copy_context().run, self.timed_prompt_embedding, text)
+                wait_futures([embedding], timeout=self.semantic_wait(text, lang))
+                cached = self.cache_lookup(text, lang, key, embedding)
+
+            span.set(cache_hit=cached is not None)
+
+        return cached
+
+    def replay_cached_turn(self, cached: CachedTurn) -> None:
+        self.contents.extend(cached.records)
+
+        product_ids = cached.product_ids
+        if product_ids:
+            self.vecdb.retrieved_node_ids.update(product_ids)
+            self.vecdb.last_result_ids = product_ids
+
+    def append_response(self, response) -> ModelTurn:
+        """Append a model response, and cache the turn if it ended with it."""
+
+        record = self.contents.append_model(response.parsed, response.text or '')
+
+        pending = self.pending_cache
+        if pending is None or (record.ok and record.user_search_query is not None):
+            # a search query means the turn goes on with a RAG round.
+            return record
+
+        self.pending_cache = None
+        if record.ok and record.conversation_langues == pending['lang']:
+            self.store_turn(
+                pending, tuple(self.contents.records[pending['start'] + 1:]), response.parsed)
+
+        return record
+
+    def store_turn(self, pending: dict, records: tuple, response: ResponseFormatter) -> None:
+        """Cache a finished turn once its prompt embedding is ready (it usually is)."""
+
+        cache = self.response_cache
+        fingerprint = pending['fingerprint'] or self.vecdb.index_fingerprint
 
-        response = self.model(
-            contents=self.contents,
-            **self.all_model_config  # type: ignore
+        def put(embedding) -> None:
+            query_vec = self.embedding_result(embedding)
+            if query_vec is None:
+                return
+
+            cache.put(  # type: ignore
+                pending['prompt'],
+                pending['key'],
+                pending['lang'],
+                self.vecdb.prompt_entities(pending['prompt']),
+                query_vec,
+                records,
+                response,
+                fingerprint,
+            )
+
+        pending['embedding'].add_done_callback(put)
+
+    def should_speculate(self, text: str) -> bool:
+        return self.speculative != 'off' and \
+            len(text.split()) >= self.speculation_min_words
+
+    def start_speculation(self, text: str) -> None:
+        if not self.should_speculate(text):
+            return
+
+        if self.speculation is not None:
+            self.speculation.cancel()
+
+        # the products shown so far, read here rather than on the executor
+        # thread; the copied context keeps the speculation spans in the turn's trace.
+        exclude_ids = frozenset(self.vecdb.retrieved_node_ids)
+        self.speculation = registry.executor.submit(
+            contextvars.copy_context().run,
+            self.speculate, text, exclude_ids, self.prompt_embedding())
+
+        if self.speculative == 'inject':
+            speculation = self.take_speculation(wait=self.speculation_timeout)
+            if speculation is not None:
+                self.contents.append_rag(
+                    self.vecdb.format_results(text, speculation.ranked),
+                    self.vecdb.last_result_ids
+                )
+
+    def prompt_embedding(self):
+        """The future prompt embedding of the cache lookup, if this turn made one."""
+
+        return self.pending_cache['embedding'] if self.pending_cache is not None else None
+
+    def speculate(self, text: str, exclude_ids: frozenset[str], embedding: Future | None) -> Speculation:
+        query_vec = None
+        if embedding is not None:
+            try:
+                query_vec = embedding.result()
+            except Exception:
+                # speculation embeds the prompt itself.
+                pass
+        return self.vecdb.speculate(text, exclude_ids, query_vec)
+
+    def take_speculation(self, wait: float = 0.0) -> Speculation | None:
+        """The finished speculation, or ``None`` if it is not ready in ``wait`` s.
+
+        Speculation is best-effort: a failed or late one is dropped and the
+        caller takes the normal retrieval path.
+        """
+
+        future, self.speculation = self.speculation, None
+        if future is None:
+            return None
+
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeoutError:
+            future.cancel()
+            return None
+        except Exception:
+            return None
+
+    def model_contents(self) -> list[Content]:
+        with tracer.span('agent.history', records=len(self.contents)) as span:
+            contents = self.history.compact(self.contents)
+            span.set(contents=len(contents))
+            return contents
+
+    def llm_span_attributes(self, contents: list[Content]) -> dict:
+        return dict(
+            model=self.all_model_config['model'],
+            request_chars=contents_chars(contents),
         )
 
-        self.contents.append(response)
+    def invoke(self) -> ResponseFormatter:
+
+        contents = self.model_contents()
+
+        with tracer.span('llm.generate', **self.llm_span_attributes(contents)) as span:
+            response = self.model(
+                contents=contents,
+                **self.all_model_config  # type: ignore
+            )
+            span.set(
+                response_chars=len(response.text or ''),
+                **usage_attributes(response.usage_metadata)
+            )
+
+        self.append_response(response)
 
         return response.parsed  # type: ignore
 
-    def rag_on(self, user_search_query: str):
+    def invoke_stream(self) -> ResponseStream:
+        """Like ``invoke`` but streams ``conversational_response`` as it is generated.
+
+        The returned ``ResponseStream`` yields text deltas; the full
+        response is appended to the history when the stream is exhausted.
+        """
+
+        contents = self.model_contents()
 
-        rag_results_context = self.vecdb.query(
-            text=user_search_query
+        # the span stays open until the stream is exhausted or dropped.
+        span = tracer.start_span('llm.stream', **self.llm_span_attributes(contents))
+        try:
+            chunks = self.stream_model(
+                contents=contents,
+                **self.all_model_config  # type: ignore
+            )
+        except BaseException:
+            tracer.end_span(span, 'error')
+            raise
+
+        return ResponseStream(
+            chunks=tracer.traced_chunks(span, chunks),
+            on_complete=self.append_response
         )
 
-        self.contents.append(
-            Part(text=rag_results_context)
+    def generate_response_stream(self, text: str) -> ResponseStream:
+
+        cached = self.lookup_cached_turn(text)
+        self.contents.append_user(text)
+
+        if cached is not None:
+            self.replay_cached_turn(cached)
+            return ResponseStream.from_text(cached.records[-1].to_json())
+
+        self.start_speculation(text)
+
+        return self.invoke_stream()
+
+    def add_rag_context(self, user_search_query: str) -> str:
+
+        with tracer.span('agent.rag_context', request_chars=len(user_search_query)) as span:
+            rag_results_context = self.vecdb.query(
+                text=user_search_query,
+                prefetched=self.take_speculation()
+            )
+            span.set(
+                products=len(self.vecdb.last_result_ids),
+                response_chars=len(rag_results_context)
+            )
+
+        self.contents.append_rag(
+            rag_results_context,
+            self.vecdb.last_result_ids
         )
 
-        return rag_results_context, self.invoke()
+        return rag_results_context
+
+    def rag_on(self, user_search_query: str):
+
+        with tracer.span('agent.rag_on'):
+            rag_results_context = self.add_rag_context(user_search_query)
+
+            return rag_results_context, self.invoke()
+
+    def rag_on_stream(self, user_search_query: str):
+
+        rag_results_context = self.add_rag_context(user_search_query)
+
+        return rag_results_context, self.invoke_stream()
 
     def get_chat_hist(self):
         return self.contents
+
+
+class AsyncSalesAgent(SalesAgent):
+    """``SalesAgent`` with coroutine methods for async servers.
+
+    Model calls go through ``client.aio`` and retrieval through the async
+    Cohere embedding and rerank calls, so one event loop serves many chats
+    without a thread per request. Speculative retrieval runs as a task.
+
+    Each request (``generate_response``, ``rag_on`` and their ``_stream``
+    variants) is bounded by ``timeout`` (default ``request_timeout``). If a
+    request is cancelled, times out or fails, the records it added are
+    removed, so the chat history stays consistent. One agent holds one chat,
+    and its requests are expected to run one after another.
+    """
+
+    def __init__(self, *args, request_timeout: float | None = 60.0, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        self.request_timeout = request_timeout
+        self.amodel = self.client.aio.models.generate_content
+        self.astream_model = self.client.aio.models.generate_content_stream
+
+        self.speculation: asyncio.Task | None = None  # type: ignore
+
+    def timeout_for(self, timeout: float | None) -> float | None:
+        return timeout if timeout is not None else self.request_timeout
+
+    def rollback(self, length: int) -> None:
+        """Undo an unfinished request: drop its records and speculation."""
+
+        if self.pending_cache is not None:
+            self.pending_cache['embedding'].cancel()
+        self.pending_cache = None
+
+        if self.speculation is not None:
+            self.speculation.cancel()
+            self.speculation = None
+
+        for record in self.contents.truncate(length):
+            if isinstance(record, RagTurn):
+                self.vecdb.retrieved_node_ids.difference_update(record.product_ids)
+
+    async def guarded(self, coro, timeout: float | None):
+        length = len(self.contents)
+        try:
+            return await asyncio.wait_for(coro, self.timeout_for(timeout))
+        except BaseException:
+            self.rollback(length)
+            raise
+
+    async def astart_speculation(self, text: str) -> None:
+        if not self.should_speculate(text):
+            return
+
+        if self.speculation is not None:
+            self.speculation.cancel()
+
+        self.speculation = asyncio.ensure_future(self.aspeculate(
+            text, frozenset(self.vecdb.retrieved_node_ids), self.prompt_embedding()))
+
+        if self.speculative == 'inject':
+            speculation = await self.atake_speculation(wait=self.speculation_timeout)
+            if speculation is not None:
+                self.contents.append_rag(
+                    self.vecdb.format_results(text, speculation.ranked),
+                    self.vecdb.last_result_ids
+                )
+
+    async def aspeculate(
+        self,
+        text: str,
+        exclude_ids: frozenset[str],
+        embedding: asyncio.Task | None,
+    ) -> Speculation:
+        query_vec = None
+        if embedding is not None:
+            try:
+                # shielded: the turn is still stored with it if speculation is cancelled.
+                query_vec = await asyncio.shield(embedding)
+            except Exception:
+                pass
+        return await self.vecdb.aspeculate(text, exclude_ids, query_vec)
+
+    async def atimed_prompt_embedding(self, text: str) -> np.ndarray:
+        start = time.perf_counter()
+        embedding = await self.vecdb.aprompt_embedding(text)
+        self.response_cache.observe_embed(time.perf_counter() - start)  # type: ignore
+        return embedding
+
+    async def alookup_cached_turn(self, text: str) -> CachedTurn | None:
+        self.pending_cache = None
+        if not self.cacheable_turn():
+            return None
+
+        lang = language(text)
+        key = self.vecdb.clean_text(text)
+        with tracer.span('cache.response', lang=lang) as span:
+            cached = self.exact_lookup(key)
+
+            if cached is None:
+                embedding = asyncio.ensure_future(self.atimed_prompt_embedding(text))
+                # a failure is retrieved, even if the turn is never stored.
+                embedding.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+                await asyncio.wait([embedding], timeout=self.semantic_wait(text, lang))
+                cached = self.cache_lookup(text, lang, key, embedding)
+
+            span.set(cache_hit=cached is not None)
+
+        return cached
+
+    async def atake_speculation(self, wait: float = 0.0) -> Speculation | None:
+        task, self.speculation = self.speculation, None
+        if task is None:
+            return None
+
+        if not task.done():
+            if not wait:
+                task.cancel()
+                return None
+
+            await asyncio.wait([task], timeout=wait)
+            if not task.done():
+                task.cancel()
+                return None
+
+        if task.cancelled() or task.exception() is not None:
+            return None
+        return task.result()
+
+    async def invoke(self) -> ResponseFormatter:  # type: ignore
+
+        contents = self.model_contents()
+
+        with tracer.span('llm.generate', **self.llm_span_attributes(contents)) as span:
+            response = await self.amodel(
+                contents=contents,
+                **self.all_model_config  # type: ignore
+            )
+            span.set(
+                response_chars=len(response.text or ''),
+                **usage_attributes(response.usage_metadata)
+            )
+
+        self.append_response(response)
+
+        return response.parsed  # type: ignore
+
+    async def generate_response(self, text: str, timeout: float | None = None) -> ResponseFormatter:  # type: ignore
+
+        async def request():
+            cached = await self.alookup_cached_turn(text)
+            self.contents.append_user(text)
+
+            if cached is not None:
+                self.replay_cached_turn(cached)
+                return cached.response
+
+            await self.astart_speculation(text)
+            return await self.invoke()
+
+        with tracer.span('agent.generate_response', request_chars=len(text)):
+            return await self.guarded(request(), timeout)
+
+    async def add_rag_context(self, user_search_query: str) -> str:  # type: ignore
+
+        with tracer.span('agent.rag_context', request_chars=len(user_search_query)) as span:
+            rag_results_context = await self.vecdb.aquery(
+                text=user_search_query,
+                prefetched=await self.atake_speculation()
+            )
+            span.set(
+                products=len(self.vecdb.last_result_ids),
+                response_chars=len(rag_results_context)
+            )
+
+        self.contents.append_rag(
+            rag_results_context,
+            self.vecdb.last_result_ids
+        )
+
+        return rag_results_context
+
+    async def rag_on(self, user_search_query: str, timeout: float | None = None):  # type: ignore
+
+        async def request():
+            rag_results_context = await self.add_rag_context(user_search_query)
+            return rag_results_context, await self.invoke()
+
+        with tracer.span('agent.rag_on'):
+            return await self.guarded(request(), timeout)
+
+    async def invoke_stream(self, timeout: float | None = None, length: int | None = None) -> AsyncResponseStream:  # type: ignore
+        """Open a streamed model call; ``timeout`` bounds the wait for every chunk.
+
+        ``length`` is the history length to roll back to if the stream
+        does not complete.
+        """
+
+        length = len(self.contents) if length is None else length
+
+        contents = self.model_contents()
+
+        span = tracer.start_span('llm.stream', **self.llm_span_attributes(contents))
+        try:
+            chunks = await self.astream_model(
+                contents=contents,
+                **self.all_model_config  # type: ignore
+            )
+        except BaseException:
+            tracer.end_span(span, 'error')
+            raise
+
+        return AsyncResponseStream(
+            chunks=tracer.atraced_chunks(span, chunks),
+            on_complete=self.append_response,
+            on_abort=lambda: self.rollback(length),
+            chunk_timeout=self.timeout_for(timeout),
+        )
+
+    async def generate_response_stream(self, text: str, timeout: float | None = None) -> AsyncResponseStream:  # type: ignore
+
+        length = len(self.contents)
+
+        async def request():
+            cached = await self.alookup_cached_turn(text)
+            self.contents.append_user(text)
+
+            if cached is not None:
+                self.replay_cached_turn(cached)
+                return AsyncResponseStream.from_text(cached.records[-1].to_json())
+
+            await self.astart_speculation(text)
+            return await self.invoke_stream(timeout, length)
+
+        return await self.guarded(request(), timeout)
+
+    async def rag_on_stream(self, user_search_query: str, timeout: float | None = None):  # type: ignore
+
+        length = len(self.contents)
+
+        async def request():
+            rag_results_context = await self.add_rag_context(user_search_query)
+            return rag_results_context, await self.invoke_stream(timeout, length)
+
+        return await self.guarded(request(), timeout)
@@ -0,0 +1,55 @@
+import re
+
+# characters the cleaner keeps as part of a token: ascii lowercase letters,
+# ascii digits, ``string.whitespace`` and the two apostrophes.
+_VALID = "a-z0-9 \\t\\n\\r\\x0b\\x0c’'"
+_VALID_NO_DIGIT = "a-z \\t\\n\\r\\x0b\\x0c’'"
+_JOINERS = ".,\\-"
+
+# every zero-width position where a separating space is inserted. the three
+# groups are disjoint, so each position gets at most one space:
+#   1. invalid -> valid, except a joiner followed by a digit ("-5", ".5")
+#   2. digit <-> letter ("250egp" -> "250 egp")
+#   3. valid -> invalid, except digit joiner digit ("1.5", "1,000", "1-6")
+_SEPARATOR_RE = re.compile(
+    f"(?<=[^{_VALID}{_JOINERS}])(?=[{_VALID}])"
+    f"|(?<=[{_JOINERS}])(?=[{_VALID_NO_DIGIT}])"
+    "|(?<=[0-9])(?=[a-z])"
+    "|(?<=[a-z])(?=[0-9])"
+    f"|(?<=[{_VALID_NO_DIGIT}])(?=[^{_VALID}])"
+    f"|(?<=[0-9])(?=[^{_VALID}])(?![{_JOINERS}][0-9])"
+)
+
+_INVALID_RE = re.compile(f"[^{_VALID}]")
+
+# Arabic, Arabic Supplement and Arabic Extended-A.
+_ARABIC_RE = re.compile("[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF]")
+
+
+def clean_text(text: str) -> str:
+    """Lowercase ``text`` and space-separate words, numbers and symbols.
+
+    Linear-time equivalent of the original character loop: the separator
+    positions are found by one precompiled regex instead of per-character
+    Python checks, and the output is identical for every input.
+    """
+
+    text = text.replace('\n', ' ').lower().strip()
+    if not text:
+        return ''
+
+    clean_text_str = _SEPARATOR_RE.sub(' ', text)
+
+    # the original loop compared the first character with ``text[-1]``, so
+    # an invalid first character is prefixed with a space unless the last
+    # character is invalid too.
+    if _INVALID_RE.match(text) and not _INVALID_RE.match(text[-1]):
+        clean_text_str = ' ' + clean_text_str
+
+    return clean_text_str.replace('  ', ' ').replace(" _ ", ' ')
+
+
+def language(text: str) -> str:
+    """'ar' if ``text`` has Arabic letters, else 'en' (``conversation_langues`` terms)."""
+
+    return 'ar' if _ARABIC_RE.search(text) else 'en'
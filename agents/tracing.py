@@ -0,0 +1,493 @@
+import contextvars
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Span:
+    """One timed stage of a turn, with free-form numeric/str attributes.
+
+    Attribute conventions picked up by ``PrometheusExporter``: ``*_tokens``
+    are token counts, ``*_chars`` payload sizes and ``cache_hit`` a bool.
+    """
+
+    __slots__ = (
+        'name', 'trace', 'span_id', 'parent_id', 'start_time',
+        'start', 'end', 'attributes', 'status',
+    )
+
+    def __init__(self, name: str, trace: "Trace", parent_id: int | None, attributes: dict) -> None:
+        self.name = name
+        self.trace = trace
+        self.span_id = next(Tracer.ids)
+        self.parent_id = parent_id
+
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.end: float | None = None
+
+        self.attributes = attributes
+        self.status = 'ok'
+
+    @property
+    def duration(self) -> float:
+        """Seconds, up to now if the span is still open."""
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, value: float = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        return dict(
+            name=self.name,
+            span_id=self.span_id,
+            parent_id=self.parent_id,
+            start_time=self.start_time,
+            duration_ms=round(self.duration * 1000, 3),
+            status=self.status,
+            attributes=self.attributes,
+        )
+
+
+class Trace:
+    """The spans of one turn; exported once its root span ends."""
+
+    __slots__ = ('trace_id', 'spans', 'root')
+
+    def __init__(self) -> None:
+        self.trace_id = os.urandom(16).hex()
+        self.spans: list[Span] = []
+        self.root: Span | None = None
+
+    def stage_totals(self) -> dict[str, float]:
+        """Span name -> summed seconds, excluding the root."""
+
+        totals: dict[str, float] = {}
+        for span in self.spans:
+            if span is not self.root:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        return totals
+
+    def to_dict(self) -> dict:
+        return dict(trace_id=self.trace_id, spans=[span.to_dict() for span in self.spans])
+
+
+class Tracer:
+    """Records nested spans per turn and hands finished traces to exporters.
+
+    The current span lives in a ``ContextVar``, so nesting follows threads,
+    asyncio tasks and ``contextvars.copy_context().run`` across executors.
+    A span opened with no current span starts a new trace. Without
+    exporters spans are still timed (the sidebar panel reads them from the
+    trace) but go nowhere.
+    """
+
+    ids = itertools.count(1)
+
+    def __init__(self) -> None:
+        self.current: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+            'current_span', default=None)
+        self.exporters: list = []
+        self.lock = threading.Lock()
+
+    def add_exporter(self, exporter) -> None:
+        with self.lock:
+            if exporter not in self.exporters:
+                self.exporters.append(exporter)
+
+    def remove_exporter(self, exporter) -> None:
+        with self.lock:
+            if exporter in self.exporters:
+                self.exporters.remove(exporter)
+
+    def exporter(self, kind: type):
+        """The first registered exporter of type ``kind``, if any."""
+        return next((exp for exp in self.exporters if isinstance(exp, kind)), None)
+
+    def start_span(self, name: str, **attributes) -> Span:
+        """Open a span under the current one without making it current.
+
+        For work that outlives the calling frame, e.g. a model stream that
+        is consumed later; close it with ``end_span``.
+        """
+
+        parent = self.current.get()
+        trace = parent.trace if parent is not None else Trace()
+
+        span = Span(name, trace, parent.span_id if parent is not None else None, attributes)
+        trace.spans.append(span)
+        if parent is None:
+            trace.root = span
+        return span
+
+    def end_span(self, span: Span, status: str | None = None) -> None:
+        if span.end is not None:
+            return
+
+        span.end = time.perf_counter()
+        if status is not None:
+            span.status = status
+
+        if span is span.trace.root:
+            for child in span.trace.spans:
+                if child.end is None:
+                    # e.g. an abandoned stream or a speculation still running.
+                    child.end = span.end
+                    child.status = 'incomplete'
+            self.export(span.trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = self.start_span(name, **attributes)
+        token = self.current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            self.current.reset(token)
+            self.end_span(span, 'error')
+            raise
+
+        self.current.reset(token)
+        self.end_span(span)
+
+    def export(self, trace: Trace) -> None:
+        for exporter in list(self.exporters):
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                # tracing must never break a turn.
+                print(f"Trace exporter {type(exporter).__name__} failed: {e}")
+
+    def traced_chunks(self, span: Span, chunks):
+        """Iterate model stream ``chunks`` inside ``span`` and close it at the end.
+
+        Records time to first chunk, chunk count, output size and the
+        token usage reported on the last chunk.
+        """
+
+        last, status = None, 'incomplete'
+        try:
+            for chunk in chunks:
+                if last is None:
+                    span.set(ttft_ms=round(span.duration * 1000, 3))
+                last = chunk
+                span.add('chunks')
+                span.add('response_chars', len(chunk.text or ''))
+                yield chunk
+            status = 'ok'
+
+        except Exception as e:
+            span.set(error=type(e).__name__)
+            status = 'error'
+            raise
+
+        finally:
+            if last is not None:
+                span.set(**usage_attributes(last.usage_metadata))
+            self.end_span(span, status)
+
+    async def atraced_chunks(self, span: Span, chunks):
+        last, status = None, 'incomplete'
+        try:
+            async for chunk in chunks:
+                if last is None:
+                    span.set(ttft_ms=round(span.duration * 1000, 3))
+                last = chunk
+                span.add('chunks')
+                span.add('response_chars', len(chunk.text or ''))
+                yield chunk
+            status = 'ok'
+
+        except Exception as e:
+            span.set(error=type(e).__name__)
+            status = 'error'
+            raise
+
+        finally:
+            if last is not None:
+                span.set(**usage_attributes(last.usage_metadata))
+            self.end_span(span, status)
+
+
+def usage_attributes(usage_metadata) -> dict:
+    """Token counts of a Gemini ``usage_metadata`` as span attributes."""
+
+    if usage_metadata is None:
+        return {}
+
+    fields = dict(
+        prompt_tokens='prompt_token_count',
+        output_tokens='candidates_token_count',
+        cached_tokens='cached_content_token_count',
+        thoughts_tokens='thoughts_token_count',
+        total_tokens='total_token_count',
+    )
+    return {
+        name: count
+        for name, field in fields.items()
+        if (count := getattr(usage_metadata, field, None)) is not None
+    }
+
+
+def contents_chars(contents) -> int:
+    return sum(
+        len(part.text or '')
+        for content in contents
+        for part in content.parts or ()
+    )
+
+
+class LogExporter:
+    """One log line per trace: total time and time per stage."""
+
+    def __init__(self, logger: logging.Logger | None = None, level: int = logging.INFO, spans: bool = False) -> None:
+        if logger is None:
+            logger = logging.getLogger('agents.tracing')
+            if not logger.handlers:
+                # a handler of its own, so trace lines show up without
+                # turning on INFO logging for every library.
+                logger.addHandler(logging.StreamHandler())
+                logger.setLevel(level)
+                logger.propagate = False
+
+        self.logger = logger
+        self.level = level
+        self.spans = spans
+
+    def export(self, trace: Trace) -> None:
+        if not self.logger.isEnabledFor(self.level):
+            return
+
+        if self.spans:
+            self.logger.log(self.level, json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+            return
+
+        stages = ' '.join(
+            f'{name}={seconds * 1000:.1f}ms' for name, seconds in trace.stage_totals().items())
+        self.logger.log(
+            self.level,
+            f'{trace.root.name} {trace.root.duration * 1000:.1f}ms '  # type: ignore
+            f'status={trace.root.status} {stages}'  # type: ignore
+        )
+
+
+class MemoryExporter:
+    """Keeps the last ``max_traces`` traces, e.g. for a debug panel."""
+
+    def __init__(self, max_traces: int = 50) -> None:
+        self.traces: deque[Trace] = deque(maxlen=max_traces)
+
+    def export(self, trace: Trace) -> None:
+        self.traces.append(trace)
+
+
+class PrometheusExporter:
+    """Aggregates spans into Prometheus metrics; ``render`` gives the text format.
+
+    Exposes a duration histogram per span name and counters for tokens
+    (``*_tokens`` attributes), payload sizes (``*_chars``) and cache
+    lookups (``cache_hit``).
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, namespace: str = 'sales_agent') -> None:
+        self.namespace = namespace
+        self.lock = threading.Lock()
+
+        # span -> (bucket counts, sum, count)
+        self.durations: dict[str, list] = {}
+        self.statuses: dict[tuple[str, str], int] = {}
+        self.tokens: dict[tuple[str, str], float] = {}
+        self.payload: dict[tuple[str, str], float] = {}
+        self.cache: dict[tuple[str, str], int] = {}
+
+    def export(self, trace: Trace) -> None:
+        with self.lock:
+            for span in trace.spans:
+                self.observe(span)
+
+    def observe(self, span: Span) -> None:
+        seconds = span.duration
+
+        histogram = self.durations.setdefault(span.name, [[0] * len(self.BUCKETS), 0.0, 0])
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                histogram[0][i] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+        key = (span.name, span.status)
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+
+        for name, value in span.attributes.items():
+            if name == 'cache_hit':
+                key = (span.name, 'hit' if value else 'miss')
+                self.cache[key] = self.cache.get(key, 0) + 1
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            elif name.endswith('_tokens'):
+                key = (span.name, name[:-len('_tokens')])
+                self.tokens[key] = self.tokens.get(key, 0) + value
+            elif name.endswith('_chars'):
+                key = (span.name, name[:-len('_chars')])
+                self.payload[key] = self.payload.get(key, 0) + value
+
+    @staticmethod
+    def labels(**labels) -> str:
+        return '{' + ','.join(
+            f'{name}="{str(value)}"' for name, value in labels.items()) + '}'
+
+    def render(self) -> str:
+        ns = self.namespace
+        lines = []
+
+        with self.lock:
+            lines += [
+                f'# HELP {ns}_span_duration_seconds Duration of turn pipeline stages.',
+                f'# TYPE {ns}_span_duration_seconds histogram',
+            ]
+            for span, (buckets, total, count) in sorted(self.durations.items()):
+                for bound, bucket_count in zip(self.BUCKETS, buckets):
+                    lines.append(
+                        f'{ns}_span_duration_seconds_bucket{self.labels(span=span, le=bound)} {bucket_count}')
+                lines.append(
+                    f'{ns}_span_duration_seconds_bucket{self.labels(span=span, le="+Inf")} {count}')
+                lines.append(f'{ns}_span_duration_seconds_sum{self.labels(span=span)} {total}')
+                lines.append(f'{ns}_span_duration_seconds_count{self.labels(span=span)} {count}')
+
+            counters = (
+                ('spans_total', 'Finished spans by status.', 'status', self.statuses),
+                ('tokens_total', 'Gemini tokens by kind.', 'kind', self.tokens),
+                ('payload_chars_total', 'Request and response payload size in characters.', 'direction', self.payload),
+                ('cache_lookups_total', 'Embedding and rerank cache lookups.', 'result', self.cache),
+            )
+            for name, help_text, label, values in counters:
+                lines += [f'# HELP {ns}_{name} {help_text}', f'# TYPE {ns}_{name} counter']
+                for (span, value_label), value in sorted(values.items()):
+                    lines.append(f'{ns}_{name}{self.labels(span=span, **{label: value_label})} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int = 9464, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+        """Serve ``render`` on ``/metrics`` from a daemon thread.
+
+        For processes without their own HTTP server (the Streamlit app);
+        ``server.py`` exposes the same text on its ``/metrics`` route.
+        """
+
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = exporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', exporter.CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        return server
+
+
+class OTelExporter:
+    """Replays finished traces into OpenTelemetry (``opentelemetry-sdk``).
+
+    Uses the global tracer provider unless one is given; configure it with
+    the OTLP (or any other) span exporter as usual.
+    """
+
+    def __init__(self, tracer_provider=None, name: str = 'sales_agent') -> None:
+        try:
+            from opentelemetry import trace as otel_trace
+        except ImportError as e:
+            raise ImportError(
+                "The otel exporter needs opentelemetry: pip install opentelemetry-sdk"
+            ) from e
+
+        self.otel_trace = otel_trace
+        self.tracer = otel_trace.get_tracer(name, tracer_provider=tracer_provider)
+
+    def export(self, trace: Trace) -> None:
+        otel_spans = {}
+        for span in trace.spans:
+            parent = otel_spans.get(span.parent_id)
+            context = self.otel_trace.set_span_in_context(parent) if parent is not None else None
+
+            start_ns = int(span.start_time * 1e9)
+            otel_span = self.tracer.start_span(
+                span.name,
+                context=context,
+                start_time=start_ns,
+                attributes={
+                    name: value for name, value in span.attributes.items()
+                    if isinstance(value, (str, bool, int, float))
+                },
+            )
+            if span.status != 'ok':
+                otel_span.set_status(self.otel_trace.Status(
+                    self.otel_trace.StatusCode.ERROR, span.status))
+
+            otel_spans[span.span_id] = otel_span
+
+        for span in reversed(trace.spans):
+            otel_spans[span.span_id].end(
+                end_time=int((span.start_time + span.duration) * 1e9))
+
+
+def make_exporter(kind: str):
+    if kind == 'log':
+        return LogExporter()
+
+    if kind == 'prometheus':
+        return PrometheusExporter()
+
+    if kind == 'otel':
+        return OTelExporter()
+
+    if kind == 'memory':
+        return MemoryExporter()
+
+    raise ValueError(f"Unknown trace exporter: {kind}")
+
+
+def configure(kinds: str | None = None) -> list:
+    """Register exporters from a comma-separated list (default ``$AGENT_TRACE_EXPORTERS``).
+
+    Exporters of a kind that is already registered are not added twice.
+    """
+
+    kinds = os.environ.get('AGENT_TRACE_EXPORTERS', '') if kinds is None else kinds
+
+    exporters = []
+    for kind in filter(None, (kind.strip() for kind in kinds.split(','))):
+        exporter = make_exporter(kind)
+        existing = tracer.exporter(type(exporter))
+        if existing is None:
+            tracer.add_exporter(exporter)
+        exporters.append(existing or exporter)
+
+    return exporters
+
+
+tracer = Tracer()
@@ -0,0 +1,188 @@
+import json
+from google.genai.types import Content, Part
+from agents.response_formatter import ResponseFormatter
+
+
+class UserTurn:
+    __slots__ = ('text',)
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def to_content(self) -> Content:
+        return Content(role='user', parts=[Part(text=self.text)])
+
+
+class RagTurn:
+    """A RAG result block: the context text sent to the model and the ids it returned."""
+
+    __slots__ = ('text', 'product_ids')
+
+    def __init__(self, text: str, product_ids: tuple[str, ...] = ()) -> None:
+        self.text = text
+        self.product_ids = tuple(product_ids)
+
+    def to_content(self) -> Content:
+        return Content(role='user', parts=[Part(text=self.text)])
+
+
+class ProductRecord:
+    __slots__ = ('product_name', 'product_description', 'product_info_lang')
+
+    def __init__(self, product_name: str, product_description: str, product_info_lang: str) -> None:
+        self.product_name = product_name
+        self.product_description = product_description
+        self.product_info_lang = product_info_lang
+
+
+class ModelTurn:
+    """The fields of a parsed ``ResponseFormatter``, without the response envelope.
+
+    Exposes the same attribute names as ``ResponseFormatter`` so rendering
+    code can use either. ``raw_text`` is only kept when the model output
+    could not be parsed.
+    """
+
+    __slots__ = (
+        'conversational_response',
+        'conversation_langues',
+        'user_search_query',
+        'recommended_products',
+        'followup_questions',
+        'raw_text',
+    )
+
+    def __init__(
+        self,
+        conversational_response: str = '',
+        conversation_langues: str = 'en',
+        user_search_query: str | None = None,
+        recommended_products: tuple[ProductRecord, ...] | None = None,
+        followup_questions: tuple[str, ...] | None = None,
+        raw_text: str | None = None,
+    ) -> None:
+
+        self.conversational_response = conversational_response
+        self.conversation_langues = conversation_langues
+        self.user_search_query = user_search_query
+        self.recommended_products = recommended_products
+        self.followup_questions = followup_questions
+        self.raw_text = raw_text
+
+    @classmethod
+    def from_parsed(cls, parsed: ResponseFormatter | None, raw_text: str = '') -> "ModelTurn":
+        if parsed is None:
+            return cls(raw_text=raw_text)
+
+        products = None
+        if parsed.recommended_products is not None:
+            products = tuple(
+                ProductRecord(
+                    prod.product_name,
+                    prod.product_description,
+                    prod.product_info_lang
+                )
+                for prod in parsed.recommended_products
+            )
+
+        return cls(
+            conversational_response=parsed.conversational_response,
+            conversation_langues=parsed.conversation_langues,
+            user_search_query=parsed.user_search_query,
+            recommended_products=products,
+            followup_questions=tuple(parsed.followup_questions)
+            if parsed.followup_questions is not None else None,
+        )
+
+    @property
+    def ok(self) -> bool:
+        return self.raw_text is None
+
+    def to_dict(self) -> dict:
+        return dict(
+            conversational_response=self.conversational_response,
+            conversation_langues=self.conversation_langues,
+            user_search_query=self.user_search_query,
+            recommended_products=[
+                dict(
+                    product_name=prod.product_name,
+                    product_description=prod.product_description,
+                    product_info_lang=prod.product_info_lang,
+                )
+                for prod in self.recommended_products
+            ] if self.recommended_products is not None else None,
+            followup_questions=list(self.followup_questions)
+            if self.followup_questions is not None else None,
+        )
+
+    def to_json(self) -> str:
+        if not self.ok:
+            return self.raw_text  # type: ignore
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    def to_content(self) -> Content:
+        return Content(role='model', parts=[Part(text=self.to_json())])
+
+
+class TurnLog:
+    """Per-session chat history as compact ``__slots__`` records.
+
+    Nothing here holds SDK response objects; records are turned into
+    ``Content`` only when a request is built (see ``to_contents``).
+    """
+
+    def __init__(self) -> None:
+        self.records: list[UserTurn | RagTurn | ModelTurn] = []
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, i):
+        return self.records[i]
+
+    def append_user(self, text: str) -> UserTurn:
+        record = UserTurn(text)
+        self.records.append(record)
+        return record
+
+    def append_rag(self, text: str, product_ids=()) -> RagTurn:
+        record = RagTurn(text, product_ids)
+        self.records.append(record)
+        return record
+
+    def append_model(self, parsed: ResponseFormatter | None, raw_text: str = '') -> ModelTurn:
+        record = ModelTurn.from_parsed(parsed, raw_text)
+        self.records.append(record)
+        return record
+
+    def extend(self, records) -> None:
+        """Appends already built records (e.g. a cached turn; they are never mutated)."""
+        self.records.extend(records)
+
+    def truncate(self, length: int) -> list:
+        """Drops the records after the first ``length`` and returns them."""
+
+        removed = self.records[length:]
+        del self.records[length:]
+        return removed
+
+    def to_contents(self) -> list[Content]:
+        return [record.to_content() for record in self.records]
+
+    @staticmethod
+    def group_turns(records) -> list[list]:
+        """Groups records into turns, each starting at a ``UserTurn``."""
+
+        turns: list[list] = []
+        for record in records:
+            if isinstance(record, UserTurn) or not turns:
+                turns.append([])
+            turns[-1].append(record)
+
+        return turns
+
+    def turns(self) -> list[list]:
+        return self.group_turns(self.records)
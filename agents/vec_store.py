@@ -0,0 +1,331 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import time
+import numpy as np
+
+
+class MmapVecStore:
+    """Binary product store that is memory-mapped instead of parsed.
+
+    Files of one written version, in its ``store-<ns>`` subdirectory:
+        vectors.npy    float32 (n_docs, dim) matrix of L2-normalized embeddings
+        table.npy      int64 (n_docs, 4) table: id start/end, text start/end
+        ids.bin        utf-8 blob of all doc ids, addressed by the table
+        texts.bin      utf-8 blob of all doc texts, addressed by the table
+        hashes.npy     uint8 (n_docs, 32) sha256 digests of the doc texts
+
+    and ``manifest.json`` in the persist directory itself: format version,
+    counts, embedding model name, content fingerprint, the doc info columns
+    the texts were joined from and ``files``, the subdirectory of the
+    current version. Replacing the manifest is the one atomic step that
+    publishes a new version, so a reader that loads the manifest always
+    opens files of that same version. Version 1 stores keep their files
+    next to the manifest and are still read.
+
+    The matrix and the text blob are opened read-only with ``mmap``, so a
+    cold start only touches the pages a query needs and every worker process
+    on the host shares one page-cache copy of them.
+    """
+
+    VERSION = 2
+    READ_VERSIONS = (1, 2)
+
+    # version subdirectories, the newest is named by the manifest.
+    FILES_PREFIX = 'store-'
+
+    VECTORS_FILE = 'vectors.npy'
+    TABLE_FILE = 'table.npy'
+    IDS_FILE = 'ids.bin'
+    TEXTS_FILE = 'texts.bin'
+    HASHES_FILE = 'hashes.npy'
+    MANIFEST_FILE = 'manifest.json'
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        table: np.ndarray,
+        ids: list[str],
+        texts_blob,
+        manifest: dict,
+        hashes: np.ndarray | None = None,
+    ) -> None:
+
+        self.vectors = vectors
+        self.table = table
+        self.ids = ids
+        self.texts_blob = texts_blob
+        self.manifest = manifest
+
+        # stores written before hashes.npy existed get them on first use.
+        self._hashes = hashes
+
+        self.id_to_row = {doc_id: row for row, doc_id in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self.manifest['dim'])
+
+    def text(self, row: int) -> str:
+        start, end = self.table[row, 2:4]
+        return bytes(self.texts_blob[start:end]).decode('utf-8')
+
+    def texts(self, rows) -> list[str]:
+        return [self.text(int(row)) for row in rows]
+
+    @property
+    def hashes(self) -> np.ndarray:
+        if self._hashes is None:
+            self._hashes = self.hash_texts(self.texts(range(len(self))))
+        return self._hashes
+
+    def content_hash(self, row: int) -> bytes:
+        return self.hashes[row].tobytes()
+
+    @staticmethod
+    def hash_text(text: str) -> bytes:
+        return hashlib.sha256(text.encode('utf-8')).digest()
+
+    @classmethod
+    def hash_texts(cls, texts: list[str]) -> np.ndarray:
+        hashes = np.zeros((len(texts), 32), dtype=np.uint8)
+        for row, text in enumerate(texts):
+            hashes[row] = np.frombuffer(cls.hash_text(text), dtype=np.uint8)
+        return hashes
+
+    @staticmethod
+    def fingerprint_of(ids: list[str], hashes: np.ndarray, embed_model_name: str | None) -> str:
+        """Digest of the ids, doc text hashes and embedding model.
+
+        Changes with any catalog edit or re-embedding, but not when an
+        unchanged catalog is written again.
+        """
+
+        digest = hashlib.sha256(str(embed_model_name).encode('utf-8') + b'\0')
+        for doc_id in ids:
+            digest.update(doc_id.encode('utf-8') + b'\0')
+        digest.update(np.ascontiguousarray(hashes).tobytes())
+        return digest.hexdigest()
+
+    @property
+    def fingerprint(self) -> str:
+        # stores written before the manifest had one compute it on first use.
+        if 'fingerprint' not in self.manifest:
+            self.manifest['fingerprint'] = self.fingerprint_of(
+                self.ids, self.hashes, self.manifest.get('embed_model_name'))
+        return self.manifest['fingerprint']
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @classmethod
+    def exists(cls, persist_directory: str) -> bool:
+        return os.path.isfile(os.path.join(persist_directory, cls.MANIFEST_FILE))
+
+    @classmethod
+    def files_directory(cls, persist_directory: str, manifest: dict) -> str:
+        return os.path.join(persist_directory, manifest.get('files') or '')
+
+    @classmethod
+    def modified_at(cls, persist_directory: str) -> int | None:
+        """mtime (ns) of the manifest, which ``write`` replaces to publish a version."""
+        try:
+            return os.stat(os.path.join(persist_directory, cls.MANIFEST_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def write(
+        cls,
+        persist_directory: str,
+        ids: list[str],
+        texts: list[str],
+        vectors,
+        embed_model_name: str | None = None,
+        doc_columns: list[str] | None = None,
+    ) -> dict:
+        """Write a new version of the store, publish it and return its manifest.
+
+        The previous version's files are kept, since readers that loaded the
+        old manifest may still be opening them; older ones are removed.
+        """
+
+        if not (len(ids) == len(texts) == len(vectors)):
+            raise ValueError("ids, texts and vectors must have the same length")
+
+        os.makedirs(persist_directory, exist_ok=True)
+
+        previous = None
+        if cls.exists(persist_directory):
+            with open(os.path.join(persist_directory, cls.MANIFEST_FILE)) as f:
+                previous = json.load(f).get('files') or ''
+
+        vectors = cls.normalize(np.asarray(vectors, dtype=np.float32)) \
+            if len(vectors) else np.zeros((0, 0), dtype=np.float32)
+
+        id_bytes = [doc_id.encode('utf-8') for doc_id in ids]
+        text_bytes = [text.encode('utf-8') for text in texts]
+
+        id_ends = np.cumsum([len(b) for b in id_bytes], dtype=np.int64)
+        text_ends = np.cumsum([len(b) for b in text_bytes], dtype=np.int64)
+
+        table = np.zeros((len(ids), 4), dtype=np.int64)
+        if len(ids):
+            table[:, 1] = id_ends
+            table[1:, 0] = id_ends[:-1]
+            table[:, 3] = text_ends
+            table[1:, 2] = text_ends[:-1]
+
+        hashes = cls.hash_texts(texts)
+
+        manifest = dict(
+            version=cls.VERSION,
+            count=len(ids),
+            dim=int(vectors.shape[1]) if len(ids) else 0,
+            dtype='float32',
+            normalized=True,
+            embed_model_name=embed_model_name,
+            fingerprint=cls.fingerprint_of(ids, hashes, embed_model_name),
+            doc_columns=doc_columns,
+            files=f'{cls.FILES_PREFIX}{time.time_ns()}',
+        )
+
+        # the data files go to a new subdirectory no reader knows of yet,
+        # then replacing the manifest publishes all of them at once.
+        files_directory = cls.files_directory(persist_directory, manifest)
+        os.makedirs(files_directory)
+
+        np.save(os.path.join(files_directory, cls.VECTORS_FILE), vectors)
+        np.save(os.path.join(files_directory, cls.TABLE_FILE), table)
+        np.save(os.path.join(files_directory, cls.HASHES_FILE), hashes)
+        with open(os.path.join(files_directory, cls.IDS_FILE), 'wb') as f:
+            f.write(b''.join(id_bytes))
+        with open(os.path.join(files_directory, cls.TEXTS_FILE), 'wb') as f:
+            f.write(b''.join(text_bytes))
+
+        path = os.path.join(persist_directory, cls.MANIFEST_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(path + '.tmp', path)
+
+        cls.remove_old_versions(persist_directory, keep={manifest['files'], previous})
+        return manifest
+
+    @classmethod
+    def remove_old_versions(cls, persist_directory: str, keep: set) -> None:
+        """Delete the version subdirectories (and version 1 files, ``''``) not in ``keep``."""
+
+        for name in os.listdir(persist_directory):
+            if name.startswith(cls.FILES_PREFIX) and name not in keep:
+                shutil.rmtree(os.path.join(persist_directory, name), ignore_errors=True)
+
+        if '' not in keep:
+            for file_name in (cls.VECTORS_FILE, cls.TABLE_FILE, cls.HASHES_FILE,
+                              cls.IDS_FILE, cls.TEXTS_FILE):
+                path = os.path.join(persist_directory, file_name)
+                if os.path.isfile(path):
+                    os.remove(path)
+
+    @classmethod
+    def read_manifest(cls, persist_directory: str) -> dict:
+        with open(os.path.join(persist_directory, cls.MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+
+        if manifest.get('version') not in cls.READ_VERSIONS:
+            raise ValueError(
+                f"Unsupported vector store version: {manifest.get('version')}")
+        return manifest
+
+    @classmethod
+    def load(cls, persist_directory: str) -> "MmapVecStore":
+
+        manifest = cls.read_manifest(persist_directory)
+        while True:
+            try:
+                return cls.load_version(persist_directory, manifest)
+            except FileNotFoundError:
+                # two newer versions were published while loading and this
+                # one was removed, the manifest names the current one.
+                current = cls.read_manifest(persist_directory)
+                if current.get('files') == manifest.get('files'):
+                    raise
+                manifest = current
+
+    @classmethod
+    def load_version(cls, persist_directory: str, manifest: dict) -> "MmapVecStore":
+        # only files of the version this manifest names are opened.
+        persist_directory = cls.files_directory(persist_directory, manifest)
+
+        if manifest['count'] == 0:
+            return cls(
+                vectors=np.zeros((0, 0), dtype=np.float32),
+                table=np.zeros((0, 4), dtype=np.int64),
+                ids=[],
+                texts_blob=b'',
+                manifest=manifest,
+                hashes=np.zeros((0, 32), dtype=np.uint8)
+            )
+
+        vectors = np.load(
+            os.path.join(persist_directory, cls.VECTORS_FILE), mmap_mode='r')
+        table = np.load(
+            os.path.join(persist_directory, cls.TABLE_FILE), mmap_mode='r')
+
+        hashes_path = os.path.join(persist_directory, cls.HASHES_FILE)
+        hashes = np.load(hashes_path, mmap_mode='r') \
+            if os.path.isfile(hashes_path) else None
+
+        with open(os.path.join(persist_directory, cls.IDS_FILE), 'rb') as f:
+            ids_blob = f.read()
+        ids = [
+            ids_blob[start:end].decode('utf-8')
+            for start, end in table[:, 0:2].tolist()
+        ]
+
+        with open(os.path.join(persist_directory, cls.TEXTS_FILE), 'rb') as f:
+            texts_blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                if os.fstat(f.fileno()).st_size else b''
+
+        return cls(
+            vectors=vectors,
+            table=table,
+            ids=ids,
+            texts_blob=texts_blob,
+            manifest=manifest,
+            hashes=hashes
+        )
+
+    @classmethod
+    def from_llama_storage(
+        cls,
+        persist_directory: str,
+        embed_model_name: str | None = None,
+    ) -> None:
+        """Convert a llama_index JSON ``StorageContext`` in place."""
+
+        with open(os.path.join(persist_directory, 'default__vector_store.json')) as f:
+            vector_store = json.load(f)
+
+        with open(os.path.join(persist_directory, 'docstore.json')) as f:
+            docstore = json.load(f)['docstore/data']
+
+        ids, texts, vectors = [], [], []
+        for node_id, embedding in vector_store['embedding_dict'].items():
+            ids.append(
+                vector_store['text_id_to_ref_doc_id'].get(node_id, node_id))
+            texts.append(docstore[node_id]['__data__']['text'])
+            vectors.append(embedding)
+
+        cls.write(persist_directory, ids, texts, vectors, embed_model_name)
@@ -1,14 +1,14 @@
-from llama_index.core import Document
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
-from llama_index.core.indices.vector_store.retrievers import (
-    VectorIndexRetriever,
-)
-import nest_asyncio
-import pandas as pd
-from tqdm.notebook import tqdm
-from concurrent.futures import ThreadPoolExecutor
-import string
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from agents.text_cleaner import clean_text
+from agents.embed_pipeline import EmbeddingPipeline, LlamaIndexEmbedder
+
+# llama_index, sentence-transformers and pandas are imported on first use.
+if TYPE_CHECKING:
+    import pandas as pd
+    from llama_index.core.indices.vector_store.retrievers import (
+        VectorIndexRetriever,
+    )
 
 
 class VecDB:
@@ -22,85 +22,33 @@ class VecDB:
         self.persist_directory = persist_directory
 
         self.retriever: None | VectorIndexRetriever = None
-        self.embed_model = HuggingFaceEmbedding(model_name="all-MiniLM-L6-v2")
+        self._embed_model = None
+
+    @property
+    def embed_model(self):
+        # building the sentence-transformers model is slow, so it is only
+        # done when something is embedded.
+        if self._embed_model is None:
+            from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+            self._embed_model = HuggingFaceEmbedding(model_name=self.embedding_model)
+        return self._embed_model
 
     @staticmethod
     def clean_text(text: str) -> str:
-        clean_text_str = ''
-        text = text.replace('\n', ' ').lower().strip()
-        text_len = len(text)
-
-        def is_valid_char(
-            char) -> bool: return char in (string.ascii_lowercase + string.digits) or char in string.whitespace or char in '’\''
-
-        for i, char in enumerate(text):
-
-            in_range = i in range(1, len(text))
-            is_char_valid = is_valid_char(char)
-
-            is_prev_num = text[i-1] in string.digits
-            is_prev_valid = is_valid_char(text[i-1])
-            is_prev_space = text[i-1] == ' '
-
-            if is_char_valid:
-                is_char_num = char in string.digits
-                is_char_alpha = char in string.ascii_lowercase
-                is_prev_char = text[i-1] in string.ascii_lowercase
-
-                if in_range and not is_prev_space:
-                    if text[i-1] in '.-,' and is_char_num:
-                        pass
-
-                    elif (is_prev_num and is_char_alpha) | \
-                        (is_char_num and is_prev_char) | \
-                            (not is_prev_valid):
-                        clean_text_str += ' '
-
-                clean_text_str += char
-
-            else:
-                is_next_num = text[min(i+1, text_len-1)] in string.digits
-
-                if char in '.-,':
-
-                    if in_range:
-                        if is_prev_num and is_next_num:
-                            clean_text_str += char
-                            continue
-
-                if not is_prev_space and not is_prev_valid:
-                    clean_text_str += char
-                    continue
-
-                clean_text_str += ' ' + char
-
-        return clean_text_str.replace('  ', ' ').replace(" _ ", ' ')
-
-    def split_into_chunks(self, data_recs, chunk_size):
-        for i in range(0, len(data_recs), chunk_size):
-            yield data_recs[i: i+chunk_size]
-
-    def process_chunk(self, chunk):
-        chunk_docs = []
-        for prod in tqdm(chunk, desc="Embedding Chunk", position=1):
-            chunk_docs.append(
-                Document(
-                    doc_id=prod['id'],
-                    text=prod['doc_text'],
-                    embedding=self.embed_model.get_text_embedding(
-                        prod['doc_text'])
-                )
-            )
-        return chunk_docs
+        return clean_text(text)
 
     def vectorize_db(
         self,
         data: pd.DataFrame,
         product_id_col: str,
         product_doc_info_cols: list[str],
-        chunk_size=20,
-        max_workers=4
+        batch_size=20,
+        max_in_flight=4,
+        requests_per_second: float | None = None,
     ) -> None:
+        import pandas as pd
+        from llama_index.core import VectorStoreIndex
+        from llama_index.core.schema import TextNode
 
         clean_data = pd.DataFrame()
         clean_data['id'] = data[product_id_col]
@@ -112,33 +60,30 @@ class VecDB:
 
         clean_data['doc_text'] = clean_data['doc_text'].apply(self.clean_text)
 
-        data_recs = clean_data.to_dict('records')
-
-        data_chunks = list(self.split_into_chunks(data_recs, chunk_size))
-
-        self.docs = []
+        pipeline = EmbeddingPipeline(
+            LlamaIndexEmbedder(self.embed_model),
+            batch_size=batch_size,
+            max_in_flight=max_in_flight,
+            requests_per_second=requests_per_second,
+        )
+        embeddings = pipeline.run(
+            zip(clean_data['id'], clean_data['doc_text']),
+            total=len(clean_data)
+        )
 
-        with ThreadPoolExecutor(
-            max_workers=max_workers
-        ) as executor:
-            chunks_docs = list(
-                tqdm(
-                    executor.map(self.process_chunk, data_chunks),
-                    position=0,
-                    total=len(data_chunks),
-                    desc="Embedding Texts"
-                )
+        # nodes that already carry an embedding are not embedded again.
+        self.docs = [
+            TextNode(
+                id_=doc['id'],
+                text=doc['doc_text'],
+                embedding=embeddings[doc['id']].tolist()
             )
-        for chunk_docs in chunks_docs:
-            self.docs .extend(chunk_docs)
+            for doc in clean_data.to_dict('records')
+        ]
 
-        nest_asyncio.apply()
-
-        index = VectorStoreIndex.from_documents(
-            documents=self.docs,
+        index = VectorStoreIndex(
+            nodes=self.docs,
             embed_model=self.embed_model,
-            insert_batch=30,
-            use_async=True,
             show_progress=True,
         )
 
@@ -151,14 +96,14 @@ class VecDB:
         print("VecDB Storing Done.")
 
     def load_vecdb(self):
+        from llama_index.core import StorageContext, load_index_from_storage
+
         storage_context = StorageContext.from_defaults(
             persist_dir=self.persist_directory)
 
-        embed_model = HuggingFaceEmbedding(model_name="all-MiniLM-L6-v2")
-
         index = load_index_from_storage(
             storage_context=storage_context,
-            embed_model=embed_model
+            embed_model=self.embed_model
         )  # type: ignore
 
         self.retriever = index.as_retriever()  # type: ignore
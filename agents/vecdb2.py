@@ -1,85 +1,330 @@
-from llama_index.core import Document
-from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
-from llama_index.core.indices.vector_store.retrievers import (
-    VectorIndexRetriever,
-)
-import nest_asyncio
-import pandas as pd
-import string
-from llama_index.embeddings.cohere import CohereEmbedding
+from __future__ import annotations
+import asyncio
+import os
+import threading
+from collections.abc import Collection
+from typing import TYPE_CHECKING
+import numpy as np
+from agents.text_cleaner import clean_text
+from agents.vec_store import MmapVecStore
+from agents.embed_cache import EmbeddingCache
+from agents.embed_pipeline import EmbeddingPipeline, LlamaIndexEmbedder
+from agents.lexical_index import LexicalIndex
+from agents.rerankers import Reranker, RerankCache, make_reranker
+from agents.tracing import tracer
 
+# llama_index and pandas take seconds to import; they are only imported on
+# the code paths that use them (see also ResourceRegistry.warm_up).
+if TYPE_CHECKING:
+    import pandas as pd
+    from llama_index.core.schema import NodeWithScore
+    from agents.quantized_index import QuantizedSearchEngine
+    from agents.ann_index import IVFIndex
+    from agents.product_metadata import ProductMetadata
+
+
+class VectorSearchEngine:
+    """Brute-force top-k over one contiguous, L2-normalized float32 matrix.
+
+    A query is a single matrix-vector product followed by ``argpartition``,
+    so only the ``top_k`` winners are ever sorted; ``search_many`` scores a
+    whole batch of queries with one matrix-matrix product.
+
+    ``exclude`` (sorted, unique rows) are masked out before the top-k, so
+    they never take one of its slots. ``rows`` (sorted, unique) restricts a
+    search to a partition of the catalog; only those rows are read.
+    """
+
+    def __init__(self, matrix: np.ndarray, normalized: bool = True) -> None:
+
+        if not normalized:
+            matrix = MmapVecStore.normalize(matrix)
+
+        # mmapped .npy matrices are already C-contiguous float32, so this
+        # is a no-op for them and they stay shared through the page cache.
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Indices and values of the ``k`` largest scores along the last axis."""
+
+        k = min(k, scores.shape[-1])
+        if k <= 0:
+            empty_shape = scores.shape[:-1] + (0,)
+            return np.zeros(empty_shape, dtype=np.int64), np.zeros(empty_shape, dtype=np.float32)
+
+        if k < scores.shape[-1]:
+            rows = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        else:
+            rows = np.broadcast_to(
+                np.arange(k), scores.shape[:-1] + (k,)).copy()
+
+        top_scores = np.take_along_axis(scores, rows, axis=-1)
+        order = np.argsort(-top_scores, axis=-1, kind='stable')
+
+        return (
+            np.take_along_axis(rows, order, axis=-1),
+            np.take_along_axis(top_scores, order, axis=-1)
+        )
+
+    @staticmethod
+    def mask(scores: np.ndarray, exclude: np.ndarray | None) -> int:
+        """Push the ``exclude`` columns below every other score, in place.
+
+        Returns the number of columns left.
+        """
+
+        if exclude is None or not len(exclude):
+            return scores.shape[-1]
+
+        # ``top_k`` ranks by ``-scores``: the integer minimum would wrap to
+        # itself under negation and rank first, one above it negates to max.
+        scores[..., exclude] = -np.inf if scores.dtype.kind == 'f' \
+            else np.iinfo(scores.dtype).min + 1
+        return scores.shape[-1] - len(exclude)
+
+    def search(
+        self,
+        query_vec,
+        top_k: int,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+
+        if rows is not None:
+            rows_out, scores = self.search_many(query_vec, top_k, exclude, rows)
+            return rows_out[0], scores[0]
+
+        query_vec = MmapVecStore.normalize(np.asarray(query_vec))[0]
+        scores = self.matrix @ query_vec
+        return self.top_k(scores, min(top_k, self.mask(scores, exclude)))
+
+    def search_many(
+        self,
+        query_vecs,
+        top_k: int,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+
+        query_vecs = MmapVecStore.normalize(np.asarray(query_vecs))
+
+        if rows is None:
+            scores = query_vecs @ self.matrix.T
+            return self.top_k(scores, min(top_k, self.mask(scores, exclude)))
+
+        if exclude is not None and len(exclude):
+            rows = np.setdiff1d(rows, exclude, assume_unique=True)
+
+        best, scores = self.top_k(query_vecs @ self.matrix[rows].T, top_k)
+        return rows[best], scores
+
+
+class Speculation:
+    """Retrieval results computed ahead of time for a not-yet-known query.
+
+    ``candidates`` are the vector-search hits and ``ranked`` the reranked
+    top-n for ``text``. ``VecDB.query`` reuses ``ranked`` when the real
+    query retrieves (nearly) the same candidates.
+    """
+
+    __slots__ = ('text', 'candidates', 'ranked')
+
+    def __init__(self, text: str, candidates: list[NodeWithScore], ranked: list[NodeWithScore]) -> None:
+        self.text = text
+        self.candidates = candidates
+        self.ranked = ranked
+
+    def covers(self, nodes: list[NodeWithScore], min_overlap: float) -> bool:
+        ids = {node.node.node_id for node in nodes}
+        candidate_ids = {node.node.node_id for node in self.candidates}
+
+        if not ids or not candidate_ids:
+            return False
+
+        # every reranked product must be a candidate of the real query too.
+        if any(node.node.node_id not in ids for node in self.ranked):
+            return False
+
+        return len(ids & candidate_ids) / len(ids | candidate_ids) >= min_overlap
+
+
+class LoadedIndex:
+    """Everything ``VecDB.load_vecdb`` loads for one version of the store.
+
+    ``engine`` searches the vectors of ``store``; ``lexical`` is its BM25
+    index (None for dense retrieval); ``metadata`` the category / language /
+    fee fields extracted by vectorize_db (None until then), which
+    ``query(filters=...)`` narrows the search with; ``entity_words`` the
+    words of the product names and categories, which with the numbers of a
+    prompt are its ``prompt_entities``.
+
+    Never modified: a reload builds a new one and swaps it in with one
+    assignment, and each query reads ``VecDB.loaded`` once, so rows of one
+    store are never looked up in another.
+    """
+
+    __slots__ = ('store', 'engine', 'lexical', 'metadata', 'entity_words')
+
+    def __init__(
+        self,
+        store: MmapVecStore,
+        engine: VectorSearchEngine | QuantizedSearchEngine | IVFIndex,
+        lexical: LexicalIndex | None,
+        metadata: ProductMetadata | None,
+        entity_words: frozenset[str],
+    ) -> None:
+        self.store = store
+        self.engine = engine
+        self.lexical = lexical
+        self.metadata = metadata
+        self.entity_words = entity_words
 
 
 class VecDB:
+
+    CHECKPOINT_FILE = 'embed_checkpoint.sqlite'
+
     def __init__(
         self,
         cohere_api_key: str,
         persist_directory="./vec_db",
+        query_cache: EmbeddingCache | None = None,
+        reranker: str | Reranker = 'cohere',
+        rerank_top_n: int = 2,
+        rerank_cache: RerankCache | None = None,
+        embed_model=None,
+        retrieval: str = 'hybrid',
+        quantization: str | None = None,
+        index: str = 'flat',
+        ivf_lists: int | None = None,
+        ivf_probes: int = 16,
     ) -> None:
 
+        if index not in ('flat', 'ivf'):
+            raise ValueError(f"Unknown index: {index!r}, expected 'flat' or 'ivf'")
+        if index == 'ivf' and quantization is not None:
+            raise ValueError("quantization is only supported with index='flat'")
+
         self.cohere_api_key = cohere_api_key
         self.persist_directory = persist_directory
 
-        self.retriever: None | VectorIndexRetriever = None
+        # query embedding model; defaults to Cohere "search_query" on load.
+        self.embed_model = embed_model
 
-    @staticmethod
-    def clean_text(text: str) -> str:
-        clean_text_str = ''
-        text = text.replace('\n', ' ').lower().strip()
-        text_len = len(text)
+        self.query_cache = query_cache if query_cache is not None \
+            else EmbeddingCache()
 
-        def is_valid_char(
-            char) -> bool: return char in (string.ascii_lowercase + string.digits) or char in string.whitespace or char in '’\''
+        # 'cohere' (remote), 'cosine' or 'cross-encoder' (local), or any Reranker.
+        self.reranker_backend = reranker
+        self.rerank_top_n = rerank_top_n
+        self.rerank_cache = rerank_cache if rerank_cache is not None \
+            else RerankCache()
+        self.reranker: None | Reranker = None
 
-        for i, char in enumerate(text):
+        self.similarity_top_k = 10
 
-            in_range = i in range(1, len(text))
-            is_char_valid = is_valid_char(char)
+        # 'dense' searches the embeddings only; 'hybrid' fuses them with a
+        # BM25 index (reciprocal rank fusion over the top ``fusion_depth``
+        # of each). When both put the same products in their top
+        # ``rerank_top_n`` those are returned without a rerank call,
+        # otherwise ``hybrid_candidates`` fused products are reranked.
+        self.retrieval = retrieval
+        self.fusion_depth = 50
+        self.rrf_k = 60
+        self.hybrid_candidates = 6
 
-            is_prev_num = text[i-1] in string.digits
-            is_prev_valid = is_valid_char(text[i-1])
-            is_prev_space = text[i-1] == ' '
+        # None searches the float32 matrix; 'int8' or 'binary' keeps only
+        # quantized codes in memory and re-scores their best candidates
+        # against the memory-mapped float32 vectors (see QuantizedSearchEngine).
+        self.quantization = quantization
 
-            if is_char_valid:
-                is_char_num = char in string.digits
-                is_char_alpha = char in string.ascii_lowercase
-                is_prev_char = text[i-1] in string.ascii_lowercase
+        # 'flat' scans every product; 'ivf' scans the ``ivf_probes`` closest
+        # of ``ivf_lists`` k-means clusters (default 2 * sqrt(n_docs)).
+        # More probes trade latency for recall (see IVFIndex).
+        self.index = index
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
 
-                if in_range and not is_prev_space:
-                    if text[i-1] in '.-,' and is_char_num:
-                        pass
+        # Jaccard overlap of the candidate sets above which a Speculation
+        # is reused instead of reranking again.
+        self.speculation_overlap = 0.5
 
-                    elif (is_prev_num and is_char_alpha) | \
-                        (is_char_num and is_prev_char) | \
-                            (not is_prev_valid):
-                        clean_text_str += ' '
+        # the store and everything built from it (see LoadedIndex).
+        self.loaded: None | LoadedIndex = None
+        self.load_lock = threading.Lock()
 
-                clean_text_str += char
+    @property
+    def store(self) -> MmapVecStore | None:
+        return getattr(self.loaded, 'store', None)
 
-            else:
-                is_next_num = text[min(i+1, text_len-1)] in string.digits
+    @property
+    def engine(self) -> VectorSearchEngine | QuantizedSearchEngine | IVFIndex | None:
+        return getattr(self.loaded, 'engine', None)
 
-                if char in '.-,':
+    @property
+    def lexical(self) -> LexicalIndex | None:
+        return getattr(self.loaded, 'lexical', None)
 
-                    if in_range:
-                        if is_prev_num and is_next_num:
-                            clean_text_str += char
-                            continue
+    @property
+    def metadata(self) -> ProductMetadata | None:
+        return getattr(self.loaded, 'metadata', None)
 
-                if not is_prev_space and not is_prev_valid:
-                    clean_text_str += char
-                    continue
+    @property
+    def entity_words(self) -> frozenset[str]:
+        return getattr(self.loaded, 'entity_words', frozenset())
 
-                clean_text_str += ' ' + char
+    @staticmethod
+    def clean_text(text: str) -> str:
+        return clean_text(text)
+
+    @classmethod
+    def lexical_texts(cls, texts: list[str], doc_columns: list[str] | None = None) -> list[str]:
+        """The BM25 texts of stored doc texts, for vectorize_db and load alike.
+
+        In ``doc_text`` the end of a value runs into the next column name
+        ("cardproduct description :"); the names of ``doc_columns`` are
+        split off again.
+        """
 
-        return clean_text_str.replace('  ', ' ').replace(" _ ", ' ')
+        labels = [cls.clean_text(column + ':') for column in (doc_columns or [])[1:]]
+        lexical_texts = []
+        for text in texts:
+            for label in labels:
+                text = text.replace(label, ' ' + label)
+            lexical_texts.append(text)
+        return lexical_texts
 
     def vectorize_db(
         self,
         data: pd.DataFrame,
         product_id_col: str,
         product_doc_info_cols: list[str],
+        incremental: bool = True,
+        batch_size: int = 96,
+        max_in_flight: int = 4,
+        requests_per_second: float | None = None,
+        embedder=None,
     ) -> None:
+        """Embed and persist the catalog.
+
+        With ``incremental`` only products whose cleaned ``doc_text`` hash
+        changed (or that are new) are sent to the embedding model; the
+        vectors of unchanged products are reused and removed products are
+        dropped from the store.
+
+        Embedding goes through ``EmbeddingPipeline``: ``batch_size`` docs per
+        request, ``max_in_flight`` concurrent requests, an optional request
+        rate limit, and a checkpoint in the persist directory that lets an
+        interrupted run resume. ``embedder`` replaces the Cohere model, e.g.
+        with a ``LocalEmbedder`` for offline runs.
+        """
+
+        import pandas as pd
+        from llama_index.embeddings.cohere import CohereEmbedding
 
         clean_data = pd.DataFrame()
         clean_data['id'] = data[product_id_col]
@@ -91,90 +336,837 @@ class VecDB:
 
         clean_data['doc_text'] = clean_data['doc_text'].apply(self.clean_text)
 
-        self.docs = []
-        for doc in clean_data.to_dict('records'):
-            self.docs.append(
-                Document(
-                    doc_id=doc['id'],
-                    text=doc['doc_text']
+        ids = clean_data['id'].astype(str).tolist()
+        texts = clean_data['doc_text'].tolist()
+
+        if embedder is None:
+            embedder = LlamaIndexEmbedder(
+                CohereEmbedding(
+                    cohere_api_key=self.cohere_api_key,
+                    input_type="search_document"
                 )
             )
 
-        nest_asyncio.apply()
+        old_store = None
+        if incremental and MmapVecStore.exists(self.persist_directory):
+            old_store = MmapVecStore.load(self.persist_directory)
+
+            # vectors from another embedding model can not be mixed in.
+            if old_store.manifest.get('embed_model_name') != embedder.model_name:
+                old_store = None
+
+        vectors: list = [None] * len(ids)
+        to_embed = []
+        # new row -> old row of the products whose vector is reused.
+        reused: dict[int, int] = {}
+        for i, (doc_id, text) in enumerate(zip(ids, texts)):
+            row = old_store.id_to_row.get(doc_id) if old_store else None
+
+            if row is not None and \
+                    old_store.content_hash(row) == MmapVecStore.hash_text(text):  # type: ignore
+                vectors[i] = old_store.vectors[row]  # type: ignore
+                reused[i] = row  # type: ignore
+            else:
+                to_embed.append(i)
+
+        os.makedirs(self.persist_directory, exist_ok=True)
+        checkpoint_path = os.path.join(
+            self.persist_directory, self.CHECKPOINT_FILE)
+
+        if to_embed:
+            pipeline = EmbeddingPipeline(
+                embedder,
+                batch_size=batch_size,
+                max_in_flight=max_in_flight,
+                requests_per_second=requests_per_second,
+                checkpoint_path=checkpoint_path,
+            )
+            embeddings = pipeline.run(
+                ((ids[i], texts[i]) for i in to_embed),
+                total=len(to_embed)
+            )
+            for i in to_embed:
+                vectors[i] = embeddings[ids[i]]
+
+        removed = len(set(old_store.ids) - set(ids)) if old_store else 0
 
-        embed_model = CohereEmbedding(
-            cohere_api_key=self.cohere_api_key,
-            input_type="search_document"
+        manifest = MmapVecStore.write(
+            persist_directory=self.persist_directory,
+            ids=ids,
+            texts=texts,
+            vectors=vectors,
+            embed_model_name=embedder.model_name,
+            doc_columns=product_doc_info_cols,
         )
 
-        index = VectorStoreIndex.from_documents(
-            documents=self.docs,
-            embed_model=embed_model,
-            insert_batch=100,
-            use_async=True,
-            show_progress=True,
+        LexicalIndex.build(
+            self.lexical_texts(texts, product_doc_info_cols),
+            fingerprint=manifest['fingerprint']
+        ).save(self.persist_directory)
+
+        from agents.product_metadata import ProductMetadata
+
+        ProductMetadata.from_values(
+            [[str(value) for value in values]
+             for values in data[product_doc_info_cols].itertuples(index=False)],
+            fingerprint=manifest['fingerprint']
+        ).save(self.persist_directory)
+
+        if self.quantization is not None:
+            self.build_quantized(MmapVecStore.load(self.persist_directory))
+
+        if self.index == 'ivf':
+            self.update_ivf(
+                MmapVecStore.load(self.persist_directory),
+                old_store,
+                reused
+            )
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        # drop the old mmaps, the next query loads the new store.
+        self.loaded = None
+
+        # and the shared copies loaded by running sessions.
+        from agents.resources import registry
+        registry.invalidate(self.persist_directory)
+
+        print(
+            f"VecDB Storing Done. embedded: {len(to_embed)}, "
+            f"unchanged: {len(ids) - len(to_embed)}, removed: {removed}"
         )
 
-        index.storage_context.persist(
-            persist_dir=self.persist_directory
+    def load_vecdb(self, store: MmapVecStore | None = None) -> LoadedIndex:
+        """Load the index; ``store`` reuses an already loaded (shared) store."""
+
+        if self.embed_model is None:
+            from llama_index.embeddings.cohere import CohereEmbedding
+
+            self.embed_model = CohereEmbedding(
+                cohere_api_key=self.cohere_api_key,
+                input_type="search_query"
+            )
+
+        if store is None:
+            if not MmapVecStore.exists(self.persist_directory):
+                # one-off migration of the old llama_index JSON storage.
+                MmapVecStore.from_llama_storage(
+                    self.persist_directory,
+                    embed_model_name=self.embed_model.model_name
+                )
+
+            store = MmapVecStore.load(self.persist_directory)
+
+        if self.index == 'ivf' and len(store):
+            engine = self.load_ivf(store)
+        elif self.quantization is not None and len(store):
+            engine = self.load_quantized(store)
+        else:
+            engine = VectorSearchEngine(
+                store.vectors,
+                normalized=store.manifest.get('normalized', False)
+            )
+
+        lexical = self.load_lexical(store) if self.retrieval == 'hybrid' else None
+        metadata = self.load_metadata(store)
+        entity_words = self.catalog_words(store, metadata)
+
+        if self.reranker is None:
+            self.reranker = make_reranker(
+                self.reranker_backend,
+                cohere_api_key=self.cohere_api_key,
+                top_n=self.rerank_top_n
+            )
+
+        # one assignment, so a reload never pairs an engine with the other store.
+        loaded = LoadedIndex(store, engine, lexical, metadata, entity_words)
+        self.loaded = loaded
+
+        print("VecDB Loading Done.")
+        return loaded
+
+    def load_lexical(self, store: MmapVecStore) -> LexicalIndex | None:
+        """The BM25 index of ``store``, built from its texts if missing or stale."""
+
+        if LexicalIndex.exists(self.persist_directory):
+            lexical = LexicalIndex.load(self.persist_directory)
+            if lexical.fingerprint == store.fingerprint:
+                return lexical
+
+        if not len(store):
+            return None
+
+        lexical = LexicalIndex.build(
+            self.lexical_texts(store.texts(range(len(store))), store.manifest.get('doc_columns')),
+            fingerprint=store.fingerprint
         )
+        try:
+            lexical.save(self.persist_directory)
+        except OSError:
+            # read-only deployment; keep the in-memory index.
+            pass
 
-        print("VecDB Storing Done.")
+        print("VecDB Lexical Index Built.")
+        return lexical
 
-    def load_vecdb(self):
+    def load_metadata(self, store: MmapVecStore) -> ProductMetadata | None:
+        """Product metadata of ``store``; None until vectorize_db extracted it."""
 
-        from llama_index.postprocessor.cohere_rerank import CohereRerank
+        from agents.product_metadata import ProductMetadata
 
-        storage_context = StorageContext.from_defaults(
-            persist_dir=self.persist_directory)
+        if ProductMetadata.exists(self.persist_directory):
+            metadata = ProductMetadata.load(self.persist_directory)
+            if metadata.fingerprint == store.fingerprint:
+                return metadata
+        return None
 
-        embed_model = CohereEmbedding(
-            cohere_api_key=self.cohere_api_key,
-            input_type="search_query"
+    # words of product names that do not tell products apart.
+    NAME_STOP_WORDS = frozenset(('and', 'for', 'the', 'your'))
+
+    @classmethod
+    def catalog_words(cls, store: MmapVecStore, metadata: ProductMetadata | None) -> frozenset[str]:
+        names = list(store.ids) + (metadata.categories if metadata is not None else [])
+        return frozenset(
+            word
+            for name in names
+            for word in cls.clean_text(name).split()
+            if word.isalpha() and len(word) > 2 and word not in cls.NAME_STOP_WORDS
         )
 
-        index = load_index_from_storage(
-            storage_context=storage_context,
-            embed_model=embed_model
-        )  # type: ignore
+    def prompt_entities(self, text: str) -> frozenset[str]:
+        """The product-name and category words and the numbers of a prompt.
+
+        Two prompts naming different products ("gold" vs "titanium" card)
+        or figures ("56 days" vs "90 days") differ here however close their
+        embeddings are; ``ResponseCache`` only matches equal entities.
+        """
 
-        self.postprocessor = CohereRerank(
-            top_n=2,
-            model="rerank-english-v3.0",
-            api_key=self.cohere_api_key
+        return frozenset(
+            word for word in self.clean_text(text).split()
+            if word in self.entity_words or word[0].isdigit()
         )
 
-        self.retriever = index.as_retriever(  # type: ignore
-            similarity_top_k=10,
+    def filter_rows(self, filters: dict | None, loaded: LoadedIndex | None = None) -> np.ndarray | None:
+        """Sorted rows matching ``filters`` (see ``ProductMetadata.rows``)."""
+
+        if not filters:
+            return None
+
+        metadata = (loaded if loaded is not None else self.loaded).metadata  # type: ignore
+        if metadata is None:
+            raise ValueError(
+                f"No product metadata for {self.persist_directory}; "
+                "run vectorize_db to extract it before filtering."
+            )
+        return metadata.rows(filters)
+
+    def build_quantized(self, store: MmapVecStore) -> QuantizedSearchEngine:
+        from agents.quantized_index import QuantizedSearchEngine
+
+        engine = QuantizedSearchEngine.build(
+            self.quantization, store.vectors, fingerprint=store.fingerprint)  # type: ignore
+        try:
+            engine.save(self.persist_directory)
+        except OSError:
+            # read-only deployment; keep the in-memory codes.
+            pass
+        return engine
+
+    def load_quantized(self, store: MmapVecStore) -> QuantizedSearchEngine:
+        """Quantized codes of ``store``, built from its vectors if missing or stale."""
+
+        from agents.quantized_index import QuantizedSearchEngine
+
+        if QuantizedSearchEngine.exists(self.persist_directory, self.quantization):  # type: ignore
+            engine = QuantizedSearchEngine.load(
+                self.persist_directory, self.quantization, store.vectors)  # type: ignore
+            if engine.fingerprint == store.fingerprint:
+                return engine
+
+        engine = self.build_quantized(store)
+        print(f"VecDB {self.quantization} Codes Built.")
+        return engine
+
+    def ivf_matches(self, ivf: IVFIndex, store: MmapVecStore) -> bool:
+        # a saved index trained with another ``ivf_lists`` is retrained.
+        return self.ivf_lists is None or ivf.n_lists == min(self.ivf_lists, len(store))
+
+    def update_ivf(
+        self,
+        store: MmapVecStore,
+        old_store: MmapVecStore | None,
+        reused: dict[int, int],
+    ) -> IVFIndex | None:
+        """Insert the new rows of ``store`` into the saved IVF index of ``old_store``."""
+
+        from agents.ann_index import IVFIndex
+
+        if not len(store):
+            return None
+
+        old_index = None
+        if old_store is not None and IVFIndex.exists(self.persist_directory):
+            old_index = IVFIndex.load(self.persist_directory, nprobe=self.ivf_probes)
+            if old_index.fingerprint != old_store.fingerprint or \
+                    not self.ivf_matches(old_index, old_store):
+                old_index = None
+
+        if old_index is None:
+            ivf = IVFIndex.build(
+                store.vectors, self.ivf_lists, self.ivf_probes, store.fingerprint)
+        else:
+            ivf = old_index.update(store.vectors, reused, store.fingerprint)
+
+        ivf.save(self.persist_directory)
+        return ivf
+
+    def load_ivf(self, store: MmapVecStore) -> IVFIndex:
+        """IVF index of ``store``, trained from its vectors if missing or stale."""
+
+        from agents.ann_index import IVFIndex
+
+        if IVFIndex.exists(self.persist_directory):
+            ivf = IVFIndex.load(self.persist_directory, store.vectors, self.ivf_probes)
+            if ivf.fingerprint == store.fingerprint and self.ivf_matches(ivf, store):
+                return ivf
+
+        ivf = IVFIndex.build(
+            store.vectors, self.ivf_lists, self.ivf_probes, store.fingerprint)
+        try:
+            ivf.save(self.persist_directory)
+        except OSError:
+            # read-only deployment; keep the in-memory index.
+            pass
+
+        print("VecDB IVF Index Built.")
+        return ivf
+
+    def ensure_loaded(self, store: MmapVecStore | None = None) -> LoadedIndex:
+        """The loaded index; queries use the one returned throughout."""
+
+        # a VecDB may be shared by several sessions; only one of them loads.
+        loaded = self.loaded
+        if loaded is not None:
+            return loaded
+
+        with self.load_lock:
+            loaded = self.loaded
+            if loaded is None:
+                loaded = self.load_vecdb(store)
+            return loaded
+
+    def reload(self, store: MmapVecStore | None = None) -> None:
+        """Load a rewritten store in place of the current one.
+
+        Sessions sharing this VecDB serve the new store from their next query.
+        """
+
+        with self.load_lock:
+            self.load_vecdb(store)
+
+    @property
+    def index_fingerprint(self) -> str | None:
+        store = self.store
+        return store.fingerprint if store is not None else None
+
+    def prompt_embedding(self, text: str) -> np.ndarray:
+        """Query embedding of a raw prompt (cleaned like ``query`` does)."""
+
+        self.ensure_loaded()
+        return self.embed_query(self.traced_clean_text(text))
+
+    def to_nodes(self, rows, scores, loaded: LoadedIndex | None = None) -> list[NodeWithScore]:
+        from llama_index.core.schema import NodeWithScore, TextNode
+
+        store = (loaded if loaded is not None else self.loaded).store  # type: ignore
+        return [
+            NodeWithScore(
+                node=TextNode(
+                    id_=store.ids[row],
+                    text=store.text(row)
+                ),
+                score=float(score)
+            )
+            for row, score in zip(rows.tolist(), scores.tolist())
+        ]
+
+    def embed_query(self, text: str) -> np.ndarray:
+        model_name = self.embed_model.model_name
+
+        with tracer.span('vecdb.embed', request_chars=len(text)) as span:
+            embedding = self.query_cache.get(model_name, text)
+            span.set(cache_hit=embedding is not None)
+
+            if embedding is None:
+                embedding = self.query_cache.put(
+                    model_name, text, self.embed_model.get_query_embedding(text))
+
+        return embedding
+
+    def embed_queries(self, texts: list[str]) -> list[np.ndarray]:
+        model_name = self.embed_model.model_name
+
+        embeddings = [self.query_cache.get(model_name, text) for text in texts]
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+
+        if missing:
+            new_embeddings = self.embed_model.get_text_embedding_batch(
+                [texts[i] for i in missing])
+
+            for i, emb in zip(missing, new_embeddings):
+                embeddings[i] = self.query_cache.put(model_name, texts[i], emb)
+
+        return embeddings  # type: ignore
+
+    def excluded_rows(self, ids: Collection[str], loaded: LoadedIndex | None = None) -> np.ndarray | None:
+        """Sorted store rows of the product ``ids`` (unknown ids are skipped)."""
+
+        if not ids:
+            return None
+
+        id_to_row = (loaded if loaded is not None else self.loaded).store.id_to_row  # type: ignore
+        return np.array(
+            sorted(id_to_row[doc_id] for doc_id in ids if doc_id in id_to_row), dtype=np.int64)
+
+    def retrieve(
+        self,
+        text: str,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+        loaded: LoadedIndex | None = None,
+    ) -> list[NodeWithScore]:
+        return self.search(self.embed_query(text), text, exclude, rows, loaded)
+
+    @property
+    def hybrid(self) -> bool:
+        return self.lexical is not None
+
+    def search(
+        self,
+        query_vec,
+        text: str | None = None,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+        loaded: LoadedIndex | None = None,
+    ) -> list[NodeWithScore]:
+        """Top candidates for a query vector, fused with BM25 on ``text`` if hybrid.
+
+        The ``exclude`` rows are masked before the top-k, so every candidate
+        (and every rerank slot) goes to a product not in it. ``rows`` limits
+        the search to a partition of the catalog (see ``filter_rows``).
+        Hybrid candidates come in fused order but are scored by their cosine
+        similarity, like dense ones, so the "cosine" reranker ranks them by
+        similarity rather than by RRF score. ``loaded`` is the index the
+        rows were computed for, by default the current one.
+        """
+
+        if loaded is None:
+            loaded = self.loaded
+        hybrid = loaded.lexical is not None and text is not None  # type: ignore
+        partition = rows
+
+        with tracer.span('vecdb.search', mode='hybrid' if hybrid else 'dense') as span:
+            rows, scores = loaded.engine.search(  # type: ignore
+                query_vec,
+                top_k=self.fusion_depth if hybrid else self.similarity_top_k,
+                exclude=exclude,
+                rows=partition
+            )
+            if hybrid:
+                rows, _ = self.fuse(loaded, rows, text, exclude, partition)  # type: ignore
+                scores = self.cosine_scores(loaded, query_vec, rows)  # type: ignore
+
+            if exclude is not None:
+                span.set(excluded=len(exclude))
+            if partition is not None:
+                span.set(partition=len(partition))
+
+            span.set(candidates=len(rows))
+            return self.to_nodes(rows, scores, loaded)
+
+    def fuse(
+        self,
+        loaded: LoadedIndex,
+        dense_rows: np.ndarray,
+        text: str,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Reciprocal rank fusion of the dense ranking and the BM25 ranking of ``text``."""
+
+        lexical_rows, _ = loaded.lexical.search(text, self.fusion_depth, exclude, rows)  # type: ignore
+        dense_rows = dense_rows.tolist()
+        lexical_rows = lexical_rows.tolist()
+
+        fused: dict[int, float] = {}
+        for ranking in (dense_rows, lexical_rows):
+            for rank, row in enumerate(ranking):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        order = sorted(fused, key=fused.__getitem__, reverse=True)
+
+        n = self.reranker.top_n  # type: ignore
+        agreed = len(lexical_rows) >= n and set(dense_rows[:n]) == set(lexical_rows[:n])
+        order = order[:n if agreed else self.hybrid_candidates]
+
+        return (
+            np.array(order, dtype=np.int64),
+            np.array([fused[row] for row in order], dtype=np.float32)
         )
 
-        print("VecDB Loading Done.")
+    def cosine_scores(self, loaded: LoadedIndex, query_vec, rows: np.ndarray) -> np.ndarray:
+        """Exact cosine similarity of the query to the ``rows`` of the store."""
 
-    def query(self, text: str):
-        if self.retriever is None:
-            self.load_vecdb()
+        vectors = MmapVecStore.normalize(loaded.store.vectors[rows])
+        return vectors @ MmapVecStore.normalize(np.asarray(query_vec))[0]
 
-        text = self.clean_text(text)
-        nodes = self.retriever.retrieve(text)  # type: ignore
-        nodes = self.postprocessor.postprocess_nodes(
-            nodes=nodes,
-            query_str=text
+    def retrieve_many(self, texts: list[str]) -> list[list[NodeWithScore]]:
+
+        loaded = self.ensure_loaded()
+        hybrid = loaded.lexical is not None
+        query_vecs = self.embed_queries(texts)
+        rows, scores = loaded.engine.search_many(
+            query_vecs,
+            top_k=self.fusion_depth if hybrid else self.similarity_top_k
         )
-        return nodes
+
+        results = []
+        for text, query_vec, q_rows, q_scores in zip(texts, query_vecs, rows, scores):
+            if hybrid:
+                q_rows, _ = self.fuse(loaded, q_rows, text)
+                q_scores = self.cosine_scores(loaded, query_vec, q_rows)
+            results.append(self.to_nodes(q_rows, q_scores, loaded))
+        return results
+
+    def rerank(self, text: str, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+
+        key = RerankCache.make_key(self.reranker.name, text, nodes)  # type: ignore
+
+        with tracer.span('vecdb.rerank', backend=self.reranker.name, candidates=len(nodes)) as span:  # type: ignore
+            if len(nodes) <= self.reranker.top_n:  # type: ignore
+                # nothing to choose between (e.g. hybrid retrieval agreed).
+                span.set(skipped=True)
+                return nodes
+
+            ranked = self.rerank_cache.get(key, nodes)
+            span.set(cache_hit=ranked is not None)
+
+            if ranked is None:
+                ranked = self.reranker.rerank(text, nodes)  # type: ignore
+                self.rerank_cache.put(key, ranked)
+
+        return ranked
+
+    def traced_clean_text(self, text: str) -> str:
+        with tracer.span('vecdb.clean_text', request_chars=len(text)):
+            return self.clean_text(text)
+
+    def query(
+        self,
+        text: str,
+        prefetched: Speculation | None = None,
+        exclude_ids: Collection[str] = (),
+        filters: dict | None = None,
+    ):
+        """Retrieve and rerank ``text``, skipping the products in ``exclude_ids``.
+
+        ``filters`` (e.g. ``{'category': 'Credit Card'}``) restricts the
+        search to the matching products; see ``ProductMetadata.rows``.
+        """
+
+        loaded = self.ensure_loaded()
+
+        with tracer.span('vecdb.query') as span:
+            text = self.traced_clean_text(text)
+            nodes = self.retrieve(
+                text,
+                self.excluded_rows(exclude_ids, loaded),
+                self.filter_rows(filters, loaded),
+                loaded
+            )
+
+            if prefetched is not None and prefetched.covers(nodes, self.speculation_overlap):
+                span.set(speculation='hit')
+                return prefetched.ranked
+
+            span.set(speculation='none' if prefetched is None else 'miss')
+            return self.rerank(text, nodes)
+
+    def speculate(
+        self,
+        text: str,
+        exclude_ids: Collection[str] = (),
+        query_vec: np.ndarray | None = None,
+    ) -> Speculation:
+        """Retrieve and rerank ``text`` ahead of time (see ``Speculation``).
+
+        ``query_vec`` is the ``prompt_embedding`` of ``text`` if the caller
+        already has it.
+        """
+
+        loaded = self.ensure_loaded()
+
+        with tracer.span('vecdb.speculate'):
+            text = self.traced_clean_text(text)
+            if query_vec is None:
+                query_vec = self.embed_query(text)
+            nodes = self.search(query_vec, text, self.excluded_rows(exclude_ids, loaded), loaded=loaded)
+            return Speculation(text, nodes, self.rerank(text, nodes))
+
+    async def aensure_loaded(self) -> LoadedIndex:
+        loaded = self.loaded
+        return loaded if loaded is not None else await asyncio.to_thread(self.ensure_loaded)
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        model_name = self.embed_model.model_name
+
+        with tracer.span('vecdb.embed', request_chars=len(text)) as span:
+            embedding = self.query_cache.get(model_name, text)
+            span.set(cache_hit=embedding is not None)
+
+            if embedding is None:
+                embedding = self.query_cache.put(
+                    model_name, text, await self.embed_model.aget_query_embedding(text))
+
+        return embedding
+
+    async def aprompt_embedding(self, text: str) -> np.ndarray:
+        await self.aensure_loaded()
+        return await self.aembed_query(self.traced_clean_text(text))
+
+    async def aretrieve(
+        self,
+        text: str,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+        loaded: LoadedIndex | None = None,
+    ) -> list[NodeWithScore]:
+        return self.search(await self.aembed_query(text), text, exclude, rows, loaded)
+
+    async def arerank(self, text: str, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+
+        key = RerankCache.make_key(self.reranker.name, text, nodes)  # type: ignore
+
+        with tracer.span('vecdb.rerank', backend=self.reranker.name, candidates=len(nodes)) as span:  # type: ignore
+            if len(nodes) <= self.reranker.top_n:  # type: ignore
+                span.set(skipped=True)
+                return nodes
+
+            ranked = self.rerank_cache.get(key, nodes)
+            span.set(cache_hit=ranked is not None)
+
+            if ranked is None:
+                ranked = await self.reranker.arerank(text, nodes)  # type: ignore
+                self.rerank_cache.put(key, ranked)
+
+        return ranked
+
+    async def aquery(
+        self,
+        text: str,
+        prefetched: Speculation | None = None,
+        exclude_ids: Collection[str] = (),
+        filters: dict | None = None,
+    ):
+        loaded = await self.aensure_loaded()
+
+        with tracer.span('vecdb.query') as span:
+            text = self.traced_clean_text(text)
+            nodes = await self.aretrieve(
+                text,
+                self.excluded_rows(exclude_ids, loaded),
+                self.filter_rows(filters, loaded),
+                loaded
+            )
+
+            if prefetched is not None and prefetched.covers(nodes, self.speculation_overlap):
+                span.set(speculation='hit')
+                return prefetched.ranked
+
+            span.set(speculation='none' if prefetched is None else 'miss')
+            return await self.arerank(text, nodes)
+
+    async def aspeculate(
+        self,
+        text: str,
+        exclude_ids: Collection[str] = (),
+        query_vec: np.ndarray | None = None,
+    ) -> Speculation:
+        loaded = await self.aensure_loaded()
+
+        with tracer.span('vecdb.speculate'):
+            text = self.traced_clean_text(text)
+            if query_vec is None:
+                query_vec = await self.aembed_query(text)
+            nodes = self.search(query_vec, text, self.excluded_rows(exclude_ids, loaded), loaded=loaded)
+            return Speculation(text, nodes, await self.arerank(text, nodes))
+
+    def query_many(self, texts: list[str]):
+        self.ensure_loaded()
+
+        texts = [self.clean_text(text) for text in texts]
+        return [
+            self.rerank(text, nodes)
+            for text, nodes in zip(texts, self.retrieve_many(texts))
+        ]
 
 
 class VecdbChatRAG(VecDB):
-    def __init__(self, cohere_api_key, persist_directory="./vec_db") -> None:
-        super().__init__(cohere_api_key, persist_directory)
+    def __init__(
+        self,
+        cohere_api_key,
+        persist_directory="./vec_db",
+        query_cache: EmbeddingCache | None = None,
+        reranker: str | Reranker = 'cohere',
+        rerank_top_n: int = 2,
+        rerank_cache: RerankCache | None = None,
+        shared: VecDB | None = None,
+        retrieval: str = 'hybrid',
+        quantization: str | None = None,
+        index: str = 'flat',
+        ivf_lists: int | None = None,
+        ivf_probes: int = 16,
+        embed_model=None,
+    ) -> None:
+        super().__init__(
+            cohere_api_key,
+            persist_directory,
+            query_cache,
+            reranker,
+            rerank_top_n,
+            rerank_cache,
+            embed_model=embed_model,
+            retrieval=retrieval,
+            quantization=quantization,
+            index=index,
+            ivf_lists=ivf_lists,
+            ivf_probes=ivf_probes,
+        )
+
+        # a loaded VecDB shared across sessions (see agents.resources);
+        # only the per-session retrieval state below lives here.
+        self.shared = shared
+
+        # products already shown in this chat; searches mask them out
+        # before rerank (see VecDB.search).
+        self.retrieved_node_ids: set[str] = set()
+        self.last_result_ids: list[str] = []
+
+        self.speculation_hits = 0
+        self.speculation_misses = 0
+
+    @property
+    def index_fingerprint(self) -> str | None:
+        return self.shared.index_fingerprint if self.shared is not None \
+            else super().index_fingerprint
+
+    def prompt_embedding(self, text: str) -> np.ndarray:
+        return self.shared.prompt_embedding(text) if self.shared is not None \
+            else super().prompt_embedding(text)
+
+    async def aprompt_embedding(self, text: str) -> np.ndarray:
+        return await self.shared.aprompt_embedding(text) if self.shared is not None \
+            else await super().aprompt_embedding(text)
+
+    def prompt_entities(self, text: str) -> frozenset[str]:
+        return self.shared.prompt_entities(text) if self.shared is not None \
+            else super().prompt_entities(text)
+
+    def retrieve(
+        self,
+        text: str,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+        loaded: LoadedIndex | None = None,
+    ) -> list[NodeWithScore]:
+        owner = self.shared if self.shared is not None else super()
+        if loaded is None:
+            loaded = owner.ensure_loaded()
+        return owner.retrieve(text, exclude, rows, loaded)
+
+    async def aretrieve(
+        self,
+        text: str,
+        exclude: np.ndarray | None = None,
+        rows: np.ndarray | None = None,
+        loaded: LoadedIndex | None = None,
+    ) -> list[NodeWithScore]:
+        owner = self.shared if self.shared is not None else super()
+        if loaded is None:
+            loaded = await owner.aensure_loaded()
+        return await owner.aretrieve(text, exclude, rows, loaded)
 
-        self.retrieved_node_ids = set()
+    def retrieve_many(self, texts: list[str]) -> list[list[NodeWithScore]]:
+        return self.shared.retrieve_many(texts) if self.shared is not None \
+            else super().retrieve_many(texts)
 
-    def query(self, text: str):  # type: ignore
+    def query_many(self, texts: list[str]):
+        return self.shared.query_many(texts) if self.shared is not None \
+            else super().query_many(texts)
+
+    def speculate(
+        self,
+        text: str,
+        exclude_ids: Collection[str] = (),
+        query_vec: np.ndarray | None = None,
+    ) -> Speculation:
+        # ``exclude_ids`` is a snapshot of ``retrieved_node_ids`` taken by the
+        # caller: speculation runs on another thread while the chat goes on.
+        return self.shared.speculate(text, exclude_ids, query_vec) if self.shared is not None \
+            else super().speculate(text, exclude_ids, query_vec)
+
+    def query(  # type: ignore
+        self,
+        text: str,
+        prefetched: Speculation | None = None,
+        filters: dict | None = None,
+    ):
+
+        exclude_ids = frozenset(self.retrieved_node_ids)
+        nodes = self.shared.query(text, prefetched, exclude_ids, filters) if self.shared is not None \
+            else super().query(text, prefetched, exclude_ids, filters)
+
+        self.count_speculation(prefetched, nodes)
+        return self.format_results(text, nodes)
+
+    async def aspeculate(
+        self,
+        text: str,
+        exclude_ids: Collection[str] = (),
+        query_vec: np.ndarray | None = None,
+    ) -> Speculation:
+        return await self.shared.aspeculate(text, exclude_ids, query_vec) if self.shared is not None \
+            else await super().aspeculate(text, exclude_ids, query_vec)
+
+    async def aquery(  # type: ignore
+        self,
+        text: str,
+        prefetched: Speculation | None = None,
+        filters: dict | None = None,
+    ):
+
+        exclude_ids = frozenset(self.retrieved_node_ids)
+        nodes = await self.shared.aquery(text, prefetched, exclude_ids, filters) if self.shared is not None \
+            else await super().aquery(text, prefetched, exclude_ids, filters)
+
+        self.count_speculation(prefetched, nodes)
+        return self.format_results(text, nodes)
+
+    def count_speculation(self, prefetched: Speculation | None, nodes) -> None:
+        if prefetched is None:
+            return
+
+        if nodes is prefetched.ranked:
+            self.speculation_hits += 1
+        else:
+            self.speculation_misses += 1
 
-        nodes = super().query(text)
+    def format_results(self, text: str, nodes: list[NodeWithScore]) -> str:
 
         i = 0
         ret_prods = ''
+        self.last_result_ids = []
         for node in nodes:
             node_id = node.node.node_id
 
@@ -182,6 +1174,7 @@ class VecdbChatRAG(VecDB):
                 continue
 
             self.retrieved_node_ids.add(node_id)
+            self.last_result_ids.append(node_id)
 
             prod_text = node.text
             ret_prods += f'{(i:=i+1)}. {prod_text}\n'
@@ -1,6 +1,14 @@
 import streamlit as st
 
 
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    # imports the agent stack and pages in the index in the background while
+    # the user is still typing the API keys; runs once per process.
+    from agents.resources import registry
+    return registry.start_warm_up(modules=('chat_ui_handler',))
+
+
 # Page configuration
 st.set_page_config(
     page_title="Sales Agent Chatbot - Bank Misr",
@@ -8,6 +16,23 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource(show_spinner=False)
+def configure_tracing():
+    # exporters from $AGENT_TRACE_EXPORTERS (log, prometheus, otel); with
+    # prometheus, $AGENT_METRICS_PORT serves /metrics. Once per process.
+    import os
+    from agents import tracing
+
+    exporters = tracing.configure()
+    prometheus = tracing.tracer.exporter(tracing.PrometheusExporter)
+    if prometheus is not None and os.environ.get('AGENT_METRICS_PORT'):
+        prometheus.serve(int(os.environ['AGENT_METRICS_PORT']))
+    return exporters
+
+
+start_warm_up()
+configure_tracing()
+
 
 st.html(
     """
@@ -89,4 +114,5 @@ if fuq:
         prompt=fuq
     )
 
-# st.session_state.ui_agent.track_hist()
+if st.sidebar.toggle("Show Turn Traces"):
+    st.session_state.ui_agent.render_trace_panel()
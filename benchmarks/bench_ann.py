@@ -0,0 +1,148 @@
+"""Recall / latency sweep of the IVF index against exact search.
+
+Builds an ``IVFIndex`` over a synthetic catalog (noisy copies of the
+data.json product embeddings, memory-mapped from a temporary ``.npy``)
+for every ``--lists`` value and searches it with every ``--probes`` value.
+Also times an incremental insert of the last ``--insert-fraction`` of the
+catalog into an index trained without it, against a full rebuild.
+
+No API key needed.
+
+    python -m benchmarks.bench_ann --docs 100000 --lists 316 632 1264 --probes 4 8 16 32 64
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from agents.ann_index import IVFIndex
+from agents.vec_store import MmapVecStore
+from agents.vecdb2 import VectorSearchEngine
+from benchmarks.bench_quantized import make_queries, synthetic_matrix, timed_search
+
+
+def recall(rows: list[np.ndarray], exact_rows: list[np.ndarray], top_k: int) -> float:
+    return float(np.mean([
+        len(set(got[:top_k].tolist()) & set(want[:top_k].tolist())) / top_k
+        for got, want in zip(rows, exact_rows)
+    ]))
+
+
+def sweep(matrix: np.ndarray, queries: np.ndarray, args) -> dict:
+    top_k = max(args.top_k)
+    exact_rows, exact_ms = timed_search(VectorSearchEngine(matrix), queries, top_k)
+
+    results = dict(
+        docs=len(matrix),
+        exact=dict(p50_ms=round(float(np.percentile(exact_ms, 50)), 3)),
+        runs=[],
+    )
+    print(f"exact: p50 {results['exact']['p50_ms']:.2f} ms")
+    print(f"{'lists':>6}{'probes':>8}{'scanned':>9}" +
+          "".join(f"{f'recall@{k}':>11}" for k in args.top_k) + f"{'p50 ms':>9}{'p95 ms':>9}")
+
+    for n_lists in args.lists:
+        start = time.perf_counter()
+        ivf = IVFIndex.build(matrix, n_lists)
+        build_s = time.perf_counter() - start
+        print(f"{n_lists:>6} lists built in {build_s:.2f} s")
+
+        for nprobe in args.probes:
+            if nprobe > n_lists:
+                continue
+            ivf.nprobe = nprobe
+            rows, latencies = timed_search(ivf, queries, top_k)
+
+            run = dict(
+                lists=n_lists,
+                probes=nprobe,
+                build_s=round(build_s, 3),
+                scanned=round(float(np.mean([
+                    len(ivf.candidates(ivf.centroids @ query, top_k)) for query in queries
+                ])) / len(matrix), 4),
+                p50_ms=round(float(np.percentile(latencies, 50)), 3),
+                p95_ms=round(float(np.percentile(latencies, 95)), 3),
+                **{f'recall@{k}': round(recall(rows, exact_rows, k), 4) for k in args.top_k},
+            )
+            results['runs'].append(run)
+            print(
+                f"{n_lists:>6}{nprobe:>8}{run['scanned'] * 100:>8.1f}%" +
+                "".join(f"{run[f'recall@{k}']:>11.3f}" for k in args.top_k) +
+                f"{run['p50_ms']:>9.2f}{run['p95_ms']:>9.2f}"
+            )
+
+    return results
+
+
+def insert(matrix: np.ndarray, queries: np.ndarray, args) -> dict:
+    """Train on the head of the catalog, then insert the tail."""
+
+    top_k = max(args.top_k)
+    n_lists = args.lists[len(args.lists) // 2]
+    nprobe = args.probes[len(args.probes) // 2]
+    head = int(len(matrix) * (1 - args.insert_fraction))
+
+    ivf = IVFIndex.build(matrix[:head], n_lists, nprobe)
+
+    start = time.perf_counter()
+    updated = ivf.update(matrix, {row: row for row in range(head)})
+    insert_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rebuilt = IVFIndex.build(matrix, n_lists, nprobe)
+    rebuild_s = time.perf_counter() - start
+
+    exact_rows, _ = timed_search(VectorSearchEngine(matrix), queries, top_k)
+    result = dict(
+        lists=n_lists,
+        probes=nprobe,
+        inserted=len(matrix) - head,
+        insert_s=round(insert_s, 3),
+        rebuild_s=round(rebuild_s, 3),
+        insert_recall=round(recall(timed_search(updated, queries, top_k)[0], exact_rows, top_k), 4),
+        rebuild_recall=round(recall(timed_search(rebuilt, queries, top_k)[0], exact_rows, top_k), 4),
+    )
+    print(
+        f"insert {result['inserted']} rows: {insert_s:.2f} s (recall@{top_k} "
+        f"{result['insert_recall']:.3f}) vs rebuild {rebuild_s:.2f} s "
+        f"(recall@{top_k} {result['rebuild_recall']:.3f})"
+    )
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--persist-directory', default='./vec_db')
+    parser.add_argument('--docs', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--lists', type=int, nargs='+', default=[316, 632, 1264])
+    parser.add_argument('--probes', type=int, nargs='+', default=[4, 8, 16, 32, 64])
+    parser.add_argument('--insert-fraction', type=float, default=0.1)
+    parser.add_argument('--doc-noise', type=float, default=0.6)
+    parser.add_argument('--query-noise', type=float, default=0.4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help="optional JSON results path")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    base = np.asarray(MmapVecStore.load(args.persist_directory).vectors)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, MmapVecStore.VECTORS_FILE)
+        np.save(path, synthetic_matrix(base, args.docs, args.doc_noise, rng))
+        matrix = np.load(path, mmap_mode='r')
+        queries = make_queries(matrix, args.queries, args.query_noise, rng)
+
+        results = sweep(matrix, queries, args)
+        results['insert'] = insert(matrix, queries, args)
+        del matrix
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
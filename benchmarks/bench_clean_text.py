@@ -0,0 +1,138 @@
+"""Check and time ``clean_text`` against the original character loop.
+
+First runs a differential check: every product text in data.json (name,
+description and the joined ``doc_text`` that ``vectorize_db`` builds) plus
+random fuzz strings must clean to the exact same output with both
+implementations. Then times both on long (30+ word) search queries.
+
+    python -m benchmarks.bench_clean_text [--fuzz 20000] [--repeat 2000]
+"""
+import argparse
+import json
+import random
+import string
+import timeit
+from agents.text_cleaner import clean_text
+
+
+def legacy_clean_text(text: str) -> str:
+    """The original per-character implementation, kept as the reference."""
+    clean_text_str = ''
+    text = text.replace('\n', ' ').lower().strip()
+    text_len = len(text)
+
+    def is_valid_char(
+        char) -> bool: return char in (string.ascii_lowercase + string.digits) or char in string.whitespace or char in '’\''
+
+    for i, char in enumerate(text):
+
+        in_range = i in range(1, len(text))
+        is_char_valid = is_valid_char(char)
+
+        is_prev_num = text[i-1] in string.digits
+        is_prev_valid = is_valid_char(text[i-1])
+        is_prev_space = text[i-1] == ' '
+
+        if is_char_valid:
+            is_char_num = char in string.digits
+            is_char_alpha = char in string.ascii_lowercase
+            is_prev_char = text[i-1] in string.ascii_lowercase
+
+            if in_range and not is_prev_space:
+                if text[i-1] in '.-,' and is_char_num:
+                    pass
+
+                elif (is_prev_num and is_char_alpha) | \
+                    (is_char_num and is_prev_char) | \
+                        (not is_prev_valid):
+                    clean_text_str += ' '
+
+            clean_text_str += char
+
+        else:
+            is_next_num = text[min(i+1, text_len-1)] in string.digits
+
+            if char in '.-,':
+
+                if in_range:
+                    if is_prev_num and is_next_num:
+                        clean_text_str += char
+                        continue
+
+            if not is_prev_space and not is_prev_valid:
+                clean_text_str += char
+                continue
+
+            clean_text_str += ' ' + char
+
+    return clean_text_str.replace('  ', ' ').replace(" _ ", ' ')
+
+
+SEARCH_QUERIES = [
+    "Looking for a credit card with low annual fees around EGP 250, a grace period of up to 56 days, "
+    "contactless payments, installment options for purchases and access to airport lounges when "
+    "travelling abroad, preferably with cashback or reward points on international transactions.",
+    "A savings certificate in Egyptian pounds with a fixed 3-year term, monthly interest payout of at "
+    "least 22.5% annually, minimum investment of 1,000 EGP, no early redemption penalty after 6 months, "
+    "available for individuals and minors with a national ID.",
+    "Small business loan for working capital between 100 thousand and 2 million pounds, repayment over "
+    "1-6 months, for manufacturing or retail enterprises with yearly revenues of 1-50 million EGP, "
+    "needing commercial registry, tax card and P.O.S. statements.",
+]
+
+
+def fuzz_strings(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + string.whitespace + \
+        string.punctuation + "’_ـاأب٠١" + "İ"
+    return [
+        ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        for _ in range(count)
+    ]
+
+
+def differential_check(data_path: str, fuzz: int) -> int:
+    with open(data_path) as f:
+        products = json.load(f)
+
+    cases = []
+    for prod in products:
+        cases.append(prod['product_name'])
+        cases.append(prod['product_description'])
+        cases.append(
+            'product_name:' + prod['product_name'] +
+            'product_description:' + prod['product_description']
+        )
+
+    cases += SEARCH_QUERIES + fuzz_strings(fuzz)
+
+    for case in cases:
+        expected, got = legacy_clean_text(case), clean_text(case)
+        if expected != got:
+            raise AssertionError(
+                f"clean_text mismatch for {case!r}:\n  legacy: {expected!r}\n  new:    {got!r}")
+
+    return len(cases)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data.json')
+    parser.add_argument('--fuzz', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    checked = differential_check(args.data, args.fuzz)
+    print(f"differential check: {checked} inputs identical")
+
+    for query in SEARCH_QUERIES:
+        legacy = timeit.timeit(lambda: legacy_clean_text(query), number=args.repeat)
+        new = timeit.timeit(lambda: clean_text(query), number=args.repeat)
+        print(
+            f"{len(query.split())} words: legacy {legacy / args.repeat * 1e6:8.1f} us, "
+            f"new {new / args.repeat * 1e6:8.1f} us, speedup {legacy / new:5.1f}x"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Offline throughput benchmark for ``EmbeddingPipeline``.
+
+Replicates the data.json catalog up to ``--docs`` documents and embeds it
+with ``LocalEmbedder`` (simulated network latency, no API key) for every
+combination of batch size and in-flight requests.
+
+    python -m benchmarks.bench_embed_pipeline --docs 5000 --latency 0.2
+"""
+import argparse
+import itertools
+import json
+import time
+from agents.embed_pipeline import EmbeddingPipeline, LocalEmbedder
+from agents.text_cleaner import clean_text
+
+
+def load_records(data_path: str, docs: int) -> list[tuple[str, str]]:
+    with open(data_path) as f:
+        products = json.load(f)
+
+    texts = [
+        clean_text(
+            'product_name:' + prod['product_name'] +
+            'product_description:' + prod['product_description']
+        )
+        for prod in products
+    ]
+    return [
+        (f'doc-{i}', f'{texts[i % len(texts)]} copy {i // len(texts)}')
+        for i in range(docs)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data.json')
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help="simulated seconds per embedding request")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16, 96])
+    parser.add_argument('--in-flight', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--requests-per-second', type=float, default=None)
+    parser.add_argument('--out', default=None, help="optional JSON results path")
+    args = parser.parse_args()
+
+    records = load_records(args.data, args.docs)
+    results = []
+
+    print(f"{'batch':>6}{'in-flight':>11}{'requests':>10}{'seconds':>10}{'docs/s':>10}")
+    for batch_size, in_flight in itertools.product(args.batch_sizes, args.in_flight):
+        pipeline = EmbeddingPipeline(
+            LocalEmbedder(latency=args.latency),
+            batch_size=batch_size,
+            max_in_flight=in_flight,
+            requests_per_second=args.requests_per_second,
+            show_progress=False,
+        )
+
+        start = time.perf_counter()
+        pipeline.run(records, total=len(records))
+        seconds = time.perf_counter() - start
+
+        results.append(dict(
+            batch_size=batch_size,
+            max_in_flight=in_flight,
+            requests=pipeline.requests,
+            seconds=seconds,
+            docs_per_second=len(records) / seconds,
+        ))
+        print(
+            f"{batch_size:>6}{in_flight:>11}{pipeline.requests:>10}"
+            f"{seconds:>10.2f}{len(records) / seconds:>10.0f}"
+        )
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(dict(docs=len(records), latency=args.latency, results=results), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Category-filtered vs whole-catalog search.
+
+Synthetic catalogs of every ``--docs`` size are made of noisy copies of the
+data.json product embeddings, each copy keeping the category of its
+product (from ``vec_db/metadata.json``). Every query is a noisy copy of a
+catalog vector, searched over the whole catalog and over its category's
+partition, with the flat scan and the IVF index. On the real catalog the
+hybrid ``VecDB.search`` also reports the candidates and text sent to
+rerank, and how often rerank is skipped, with and without the filter.
+
+No API key needed.
+
+    python -m benchmarks.bench_filters --docs 10000 100000 --out filters.json
+"""
+import argparse
+import json
+import time
+import numpy as np
+from agents.ann_index import IVFIndex
+from agents.product_metadata import ProductMetadata
+from agents.vec_store import MmapVecStore
+from agents.vecdb2 import VecDB, VectorSearchEngine
+from benchmarks.bench_quantized import make_queries
+from benchmarks.fakes import FakeQueryEmbedding
+
+
+def percentiles(latencies: list[float]) -> dict:
+    return dict(
+        p50_ms=round(float(np.percentile(latencies, 50)), 3),
+        p95_ms=round(float(np.percentile(latencies, 95)), 3),
+    )
+
+
+def synthetic_catalog(base: np.ndarray, metadata: ProductMetadata, n_docs: int, noise: float, rng):
+    products = rng.integers(0, len(base), size=n_docs)
+    matrix = base[products] + rng.normal(
+        0, noise / np.sqrt(base.shape[1]), (n_docs, base.shape[1])).astype(np.float32)
+    return MmapVecStore.normalize(matrix), ProductMetadata(
+        [metadata.records[product] for product in products.tolist()])
+
+
+def bench_engines(matrix: np.ndarray, metadata: ProductMetadata, args, rng) -> dict:
+    queries = make_queries(matrix, args.queries, args.query_noise, rng)
+    categories = [
+        metadata.records[row]['category']
+        for row in np.argmax(queries @ matrix.T, axis=1).tolist()
+    ]
+
+    engines = dict(flat=VectorSearchEngine(matrix), ivf=IVFIndex.build(matrix))
+    results: dict = dict(
+        docs=len(matrix),
+        mean_partition=round(float(np.mean([
+            len(metadata.rows(dict(category=category))) for category in categories])), 1),
+    )
+
+    for name, engine in engines.items():
+        for scope in ('catalog', 'category'):
+            latencies = []
+            for query, category in zip(queries, categories):
+                start = time.perf_counter()
+                rows = metadata.rows(dict(category=category)) if scope == 'category' else None
+                engine.search(query, args.top_k, rows=rows)
+                latencies.append((time.perf_counter() - start) * 1000)
+            results[f'{name}_{scope}'] = percentiles(latencies)
+
+    print(
+        f"{len(matrix):>8} docs (partition ~{results['mean_partition']:.0f}): " +
+        "  ".join(
+            f"{key} p50 {value['p50_ms']:.2f} ms"
+            for key, value in results.items() if isinstance(value, dict)
+        )
+    )
+    return results
+
+
+def bench_rerank_payload(persist_directory: str, args, rng) -> dict:
+    """Candidates a hybrid search sends to rerank, with and without the category filter."""
+
+    # query vectors are passed in directly, the embedding model is never called.
+    vecdb = VecDB('offline', persist_directory, reranker='cosine', embed_model=FakeQueryEmbedding())
+    vecdb.ensure_loaded()
+    if vecdb.metadata is None:
+        raise SystemExit(f"no metadata.json for {persist_directory}; run vectorize_db first")
+
+    store = vecdb.store
+    rows = rng.integers(0, len(store), size=args.queries)  # type: ignore
+    queries = make_queries(store.vectors[np.sort(rows)], args.queries, args.query_noise, rng)  # type: ignore
+
+    results = {}
+    for scope in ('catalog', 'category'):
+        candidates, chars, skipped = [], [], 0
+        for query in queries:
+            row = int(np.argmax(store.vectors @ query))  # type: ignore
+            text = vecdb.clean_text(store.ids[row])  # type: ignore
+            filters = dict(category=vecdb.metadata.records[row]['category']) \
+                if scope == 'category' else None
+
+            nodes = vecdb.search(query, text, rows=vecdb.filter_rows(filters))
+            candidates.append(len(nodes))
+            chars.append(sum(len(node.node.get_content()) for node in nodes))
+            skipped += len(nodes) <= vecdb.reranker.top_n  # type: ignore
+
+        results[scope] = dict(
+            mean_candidates=round(float(np.mean(candidates)), 2),
+            mean_payload_chars=round(float(np.mean(chars)), 1),
+            rerank_skipped=round(skipped / len(queries), 3),
+        )
+        print(
+            f"rerank payload, {scope:<8}: {results[scope]['mean_candidates']:.2f} candidates, "
+            f"{results[scope]['mean_payload_chars']:.0f} chars, "
+            f"{results[scope]['rerank_skipped'] * 100:.1f}% skipped"
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--persist-directory', default='./vec_db')
+    parser.add_argument('--docs', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--doc-noise', type=float, default=0.6)
+    parser.add_argument('--query-noise', type=float, default=0.4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help="optional JSON results path")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    store = MmapVecStore.load(args.persist_directory)
+    metadata = ProductMetadata.load(args.persist_directory)
+    base = np.asarray(store.vectors)
+
+    results: dict = dict(rerank=bench_rerank_payload(args.persist_directory, args, rng), catalogs=[])
+    for n_docs in args.docs:
+        matrix, synthetic_metadata = synthetic_catalog(base, metadata, n_docs, args.doc_noise, rng)
+        results['catalogs'].append(bench_engines(matrix, synthetic_metadata, args, rng))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
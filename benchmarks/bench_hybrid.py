@@ -0,0 +1,118 @@
+"""Dense vs hybrid (BM25 + dense, reciprocal rank fusion) retrieval on data.json.
+
+Two query sets per product: "precise" queries made of the product name and
+an exact figure from its description ("56 days", "EGP 250"), and the
+descriptive first-sentence queries of ``bench_rerank``. For each retrieval
+mode it reports how often the product is among the candidates and in the
+final top-n, how many candidates are sent to rerank, how many rerank calls
+are skipped because both rankings agreed, and the local search time.
+
+Query embeddings are computed once and shared by both modes.
+
+    COHERE_API_KEY=... python -m benchmarks.bench_hybrid --out hybrid.json
+"""
+import argparse
+import json
+import os
+import re
+import time
+import numpy as np
+from agents.vecdb2 import VecDB
+from benchmarks.bench_rerank import build_queries
+
+FIGURE_RE = re.compile(
+    r'(?:EGP|USD|EUR)\s?[\d,.]+|[\d,.]+\s?(?:%|days|months|years|EGP|USD|EUR)', re.IGNORECASE)
+
+
+def precise_queries(data_path: str, limit: int) -> list[tuple[str, str]]:
+    with open(data_path) as f:
+        products = json.load(f)
+
+    queries = []
+    for prod in products[:limit]:
+        figure = FIGURE_RE.search(prod['product_description'])
+        if figure is not None:
+            queries.append((prod['product_name'], f"{prod['product_name']} {figure.group(0)}"))
+    return queries
+
+
+def evaluate(vecdb: VecDB, queries: list[tuple[str, str]], embeddings) -> dict:
+    candidate_hits = final_hits = skipped = 0
+    candidates, search_ms = [], []
+
+    for (target, text), embedding in zip(queries, embeddings):
+        start = time.perf_counter()
+        nodes = vecdb.search(embedding, text)
+        search_ms.append((time.perf_counter() - start) * 1000)
+
+        ids = [node.node.node_id for node in nodes]
+        candidates.append(len(nodes))
+        candidate_hits += target in ids
+
+        if len(nodes) <= vecdb.reranker.top_n:  # type: ignore
+            skipped += 1
+        final = vecdb.rerank(text, nodes)
+        final_hits += target in [node.node.node_id for node in final]
+
+    return dict(
+        queries=len(queries),
+        candidate_recall=round(candidate_hits / len(queries), 3),
+        final_recall=round(final_hits / len(queries), 3),
+        mean_candidates=round(float(np.mean(candidates)), 2),
+        rerank_skipped=round(skipped / len(queries), 3),
+        search_ms_mean=round(float(np.mean(search_ms)), 3),
+        search_ms_p95=round(float(np.percentile(search_ms, 95)), 3),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data.json')
+    parser.add_argument('--persist-directory', default='./vec_db')
+    parser.add_argument('--limit', type=int, default=92)
+    parser.add_argument('--reranker', default='cohere')
+    parser.add_argument('--out', default=None, help="optional JSON results path")
+    args = parser.parse_args()
+
+    cohere_api_key = os.environ['COHERE_API_KEY']
+
+    dense = VecDB(cohere_api_key, args.persist_directory, reranker=args.reranker, retrieval='dense')
+    dense.ensure_loaded()
+
+    hybrid = VecDB(cohere_api_key, args.persist_directory, reranker=args.reranker, retrieval='hybrid')
+    hybrid.ensure_loaded(dense.store)
+
+    with open(args.data) as f:
+        names = [prod['product_name'] for prod in json.load(f)][:args.limit]
+
+    query_sets = dict(
+        precise=precise_queries(args.data, args.limit),
+        descriptive=list(zip(names, build_queries(args.data, args.limit))),
+    )
+
+    results = {}
+    for set_name, queries in query_sets.items():
+        queries = [(target, dense.clean_text(text)) for target, text in queries]
+        embeddings = dense.embed_queries([text for _, text in queries])
+
+        results[set_name] = {
+            mode: evaluate(vecdb, queries, embeddings)
+            for mode, vecdb in (('dense', dense), ('hybrid', hybrid))
+        }
+
+        for mode, result in results[set_name].items():
+            print(
+                f"{set_name:<12} {mode:<7} candidates recall {result['candidate_recall']:.3f}  "
+                f"final recall {result['final_recall']:.3f}  "
+                f"{result['mean_candidates']:5.2f} to rerank  "
+                f"{result['rerank_skipped'] * 100:5.1f}% rerank skipped  "
+                f"search {result['search_ms_mean']:.2f} ms"
+            )
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
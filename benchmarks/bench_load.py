@@ -0,0 +1,519 @@
+"""Offline load test: scripted multi-turn chats against fake Gemini/Cohere.
+
+Builds a temporary index from data.json (``--catalog-copies`` times the
+catalog, ``LocalEmbedder`` vectors) and runs ``--sessions`` scripted
+conversations, ``--concurrency`` at a time, through ``SalesAgent`` (threads)
+or ``AsyncSalesAgent`` (one event loop). Gemini, the Cohere query embedding
+and the Cohere rerank are replaced by the latency-configurable fakes in
+``benchmarks.fakes``; streamed answers go through ``StreamRenderer`` into a
+null Streamlit container.
+
+Reports turn latency and time-to-first-token percentiles, the per-stage
+breakdown on each turn's critical path (clean_text, embed, retrieve,
+fuse, rerank, history, llm, render; ``fuse`` is the BM25 search and
+reciprocal rank fusion of hybrid retrieval, speculative retrieval is
+listed separately as background work) and the memory a finished session keeps alive.
+``--out`` writes the results as JSON, ``--baseline`` compares against an
+earlier file and exits 1 when p95 turn latency regressed by more than
+``--tolerance``.
+
+    python -m benchmarks.bench_load --sessions 200 --concurrency 32 --out load.json
+    python -m benchmarks.bench_load --mode async --baseline load.json
+"""
+import argparse
+import asyncio
+import contextvars
+import gc
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from agents.embed_pipeline import LocalEmbedder
+from agents.response_cache import ResponseCache
+from agents.sales_agent import AsyncSalesAgent, SalesAgent
+from agents.vecdb2 import VecDB
+from benchmarks.fakes import FakeGeminiClient, FakeQueryEmbedding, FakeReranker, NullElement
+from stream_renderer import StreamRenderer
+
+STAGES = ('clean_text', 'embed', 'retrieve', 'fuse', 'rerank', 'history', 'llm', 'render')
+
+# stage -> seconds for the turn running in the current thread / task;
+# None for background work (speculative retrieval).
+current_turn: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+    'current_turn', default=None)
+
+
+class StageRecorder:
+    def __init__(self) -> None:
+        self.calls: dict[str, list[float]] = {stage: [] for stage in STAGES}
+        self.background: dict[str, list[float]] = {stage: [] for stage in STAGES}
+        self.lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        turn = current_turn.get()
+        with self.lock:
+            if turn is None:
+                self.background[stage].append(seconds)
+                return
+
+            self.calls[stage].append(seconds)
+            turn[stage] = turn.get(stage, 0.0) + seconds
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_async(self, stage: str, fn):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def background_only(self, fn):
+        def detached(*args, **kwargs):
+            current_turn.set(None)
+            return fn(*args, **kwargs)
+        return detached
+
+    def background_only_async(self, fn):
+        async def detached(*args, **kwargs):
+            # runs in its own task (a copy of the context), so this does
+            # not leak into the turn that started it.
+            current_turn.set(None)
+            return await fn(*args, **kwargs)
+        return detached
+
+    def timed_chunks(self, chunks):
+        """Time spent blocked on the model stream counts as ``llm``."""
+
+        iterator = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                self.record('llm', time.perf_counter() - start)
+                return
+            self.record('llm', time.perf_counter() - start)
+            yield chunk
+
+    async def atimed_chunks(self, chunks):
+        iterator = chunks.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                self.record('llm', time.perf_counter() - start)
+                return
+            self.record('llm', time.perf_counter() - start)
+            yield chunk
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return dict(count=0)
+
+    ms = np.asarray(values) * 1000
+    return dict(
+        count=len(values),
+        mean=round(float(ms.mean()), 2),
+        p50=round(float(np.percentile(ms, 50)), 2),
+        p95=round(float(np.percentile(ms, 95)), 2),
+        p99=round(float(np.percentile(ms, 99)), 2),
+        max=round(float(ms.max()), 2),
+    )
+
+
+def build_index(data_path: str, copies: int, directory: str) -> pd.DataFrame:
+    products = pd.read_json(data_path)
+    catalog = pd.concat(
+        [
+            products.assign(product_name=products['product_name'] + (f' {copy}' if copy else ''))
+            for copy in range(copies)
+        ],
+        ignore_index=True
+    )
+
+    VecDB('offline', persist_directory=directory).vectorize_db(
+        catalog,
+        product_id_col='product_name',
+        product_doc_info_cols=['product_name', 'product_description'],
+        embedder=LocalEmbedder(latency=0),
+    )
+    return products
+
+
+def scripts(products: pd.DataFrame, sessions: int, turns: int) -> list[list[str]]:
+    """One deterministic conversation per session, built from data.json."""
+
+    conversations = []
+    for i in range(sessions):
+        product = products.iloc[i % len(products)]
+        description = ' '.join(str(product['product_description']).split()[:40])
+
+        greeting = "مرحبا، أريد مساعدة في اختيار منتج بنكي" if i % 4 == 3 \
+            else "Hello, I need some help choosing a bank product."
+        script = [
+            greeting,
+            f"I am looking for {product['product_name']}: {description}",
+            "What are the fees, and how do I apply?",
+            "Can you compare it with a similar product you recommended?",
+        ]
+        conversations.append([script[t % len(script)] for t in range(turns)])
+
+    return conversations
+
+
+class LoadTest:
+
+    def __init__(self, args, shared: VecDB, client: FakeGeminiClient, recorder: StageRecorder) -> None:
+        self.args = args
+        self.shared = shared
+        self.client = client
+        self.recorder = recorder
+
+        # one cache for the run, shared by every session like in the app.
+        self.response_cache = ResponseCache() if args.response_cache == 'on' else 'off'
+
+        self.turn_latencies: list[float] = []
+        self.first_token: list[float] = []
+        self.turn_stages: list[dict] = []
+        self.errors = 0
+        self.searches = 0
+
+    def agent_kwargs(self) -> dict:
+        return dict(
+            gemini_api_key='offline',
+            cohere_api_key='offline',
+            client=self.client,
+            shared_vecdb=self.shared,
+            speculative=self.args.speculative,
+            response_cache=self.response_cache,
+        )
+
+    def instrument(self, agent) -> None:
+        recorder = self.recorder
+
+        agent.model_contents = recorder.wrap('history', agent.model_contents)
+
+        if isinstance(agent, AsyncSalesAgent):
+            model = agent.astream_model
+
+            async def astream_model(**kwargs):
+                return recorder.atimed_chunks(await model(**kwargs))
+
+            agent.astream_model = astream_model
+            agent.vecdb.aspeculate = recorder.background_only_async(agent.vecdb.aspeculate)
+        else:
+            model = agent.stream_model
+            agent.stream_model = lambda **kwargs: recorder.timed_chunks(model(**kwargs))
+            agent.vecdb.speculate = recorder.background_only(agent.vecdb.speculate)
+
+    def finish_turn(self, stages: dict, start: float, first: float | None) -> None:
+        self.turn_latencies.append(time.perf_counter() - start)
+        if first is not None:
+            self.first_token.append(first - start)
+        self.turn_stages.append(stages)
+
+    def run_sync_session(self, script: list[str]) -> SalesAgent:
+        agent = SalesAgent(**self.agent_kwargs())
+        self.instrument(agent)
+
+        for prompt in script:
+            stages: dict = {}
+            current_turn.set(stages)
+            start, first = time.perf_counter(), None
+
+            try:
+                stream = agent.generate_response_stream(prompt).start()
+                renderer = StreamRenderer(NullElement())
+                for delta in stream:
+                    first = first or time.perf_counter()
+                    self.timed_push(renderer, delta)
+
+                response = stream.parsed
+                if response is not None and response.user_search_query is not None:
+                    self.searches += 1
+                    _, stream = agent.rag_on_stream(response.user_search_query)
+                    for delta in stream.start():
+                        self.timed_push(renderer, delta)
+                    response = stream.parsed
+
+                self.timed_finish(renderer)
+                if response is None:
+                    self.errors += 1
+
+            except Exception:
+                self.errors += 1
+
+            current_turn.set(None)
+            self.finish_turn(stages, start, first)
+            time.sleep(self.args.think_time)
+
+        return agent
+
+    async def run_async_session(self, script: list[str]) -> AsyncSalesAgent:
+        agent = AsyncSalesAgent(**self.agent_kwargs())
+        self.instrument(agent)
+
+        for prompt in script:
+            stages: dict = {}
+            current_turn.set(stages)
+            start, first = time.perf_counter(), None
+
+            try:
+                stream = await (await agent.generate_response_stream(prompt)).astart()
+                renderer = StreamRenderer(NullElement())
+                async for delta in stream:
+                    first = first or time.perf_counter()
+                    self.timed_push(renderer, delta)
+
+                response = stream.parsed
+                if response is not None and response.user_search_query is not None:
+                    self.searches += 1
+                    _, stream = await agent.rag_on_stream(response.user_search_query)
+                    async for delta in await stream.astart():
+                        self.timed_push(renderer, delta)
+                    response = stream.parsed
+
+                self.timed_finish(renderer)
+                if response is None:
+                    self.errors += 1
+
+            except Exception:
+                self.errors += 1
+
+            current_turn.set(None)
+            self.finish_turn(stages, start, first)
+            await asyncio.sleep(self.args.think_time)
+
+        return agent
+
+    def timed_push(self, renderer: StreamRenderer, delta: str) -> None:
+        start = time.perf_counter()
+        renderer.push(delta)
+        self.recorder.record('render', time.perf_counter() - start)
+
+    def timed_finish(self, renderer: StreamRenderer) -> None:
+        start = time.perf_counter()
+        renderer.finish()
+        self.recorder.record('render', time.perf_counter() - start)
+
+    def run(self, conversations: list[list[str]]) -> list:
+        if self.args.mode == 'sync':
+            with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+                # each session starts from an empty context.
+                return list(pool.map(
+                    lambda script: contextvars.Context().run(self.run_sync_session, script),
+                    conversations
+                ))
+
+        async def main():
+            semaphore = asyncio.Semaphore(self.args.concurrency)
+
+            async def session(script):
+                async with semaphore:
+                    return await self.run_async_session(script)
+
+            return await asyncio.gather(*(session(script) for script in conversations))
+
+        return asyncio.run(main())
+
+    def stage_report(self) -> dict:
+        total_turn = sum(self.turn_latencies) or 1.0
+        report = {}
+        for stage in STAGES:
+            per_turn = [turn.get(stage, 0.0) for turn in self.turn_stages]
+            report[stage] = dict(
+                per_call_ms=percentiles(self.recorder.calls[stage]),
+                per_turn_ms=percentiles(per_turn),
+                share_of_turn=round(sum(per_turn) / total_turn, 4),
+            )
+        return report
+
+
+def measure_session_memory(args, shared: VecDB, client: FakeGeminiClient, conversations) -> dict:
+    """Memory retained by finished sessions (tracemalloc, zero-latency fakes)."""
+
+    for models in (client.models, client.aio.models):
+        models.ttft, models.tokens_per_second = 0.0, 1e9
+    shared.embed_model.latency = 0.0
+    shared.reranker.latency = 0.0  # type: ignore
+
+    sample = conversations[:args.memory_sessions]
+    test = LoadTest(
+        argparse.Namespace(**{**vars(args), 'mode': 'sync', 'think_time': 0.0, 'concurrency': 1}),
+        shared, client, StageRecorder()
+    )
+
+    # one session first, so lazy imports and caches are not counted.
+    test.run(sample[:1])
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    agents = test.run(sample)
+
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del agents
+
+    return dict(
+        sessions=len(sample),
+        turns_per_session=args.turns,
+        bytes_per_session=int(retained / max(len(sample), 1)),
+    )
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data.json')
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync')
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--turns', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--think-time', type=float, default=0.0)
+    parser.add_argument('--catalog-copies', type=int, default=1)
+    parser.add_argument('--speculative', choices=('off', 'prefetch', 'inject'), default='off')
+    parser.add_argument('--response-cache', choices=('off', 'on'), default='off',
+                        help="semantic turn cache; the scripted first turns repeat across sessions")
+    parser.add_argument('--llm-ttft', type=float, default=0.6)
+    parser.add_argument('--llm-tokens-per-second', type=float, default=150)
+    parser.add_argument('--embed-latency', type=float, default=0.08)
+    parser.add_argument('--rerank-latency', type=float, default=0.15)
+    parser.add_argument('--memory-sessions', type=int, default=20)
+    parser.add_argument('--out', default=None, help="optional JSON results path")
+    parser.add_argument('--baseline', default=None, help="JSON results of an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="allowed p95 turn latency regression vs the baseline")
+    args = parser.parse_args()
+
+    index_dir = tempfile.mkdtemp(prefix='bench_load_')
+    try:
+        products = build_index(args.data, args.catalog_copies, index_dir)
+
+        with open(args.data) as f:
+            vocabulary = [
+                word for prod in json.load(f)
+                for word in prod['product_description'].split()
+                if word.isalpha()
+            ]
+
+        client = FakeGeminiClient(
+            vocabulary,
+            ttft=args.llm_ttft,
+            tokens_per_second=args.llm_tokens_per_second,
+        )
+        shared = VecDB(
+            'offline',
+            persist_directory=index_dir,
+            reranker=FakeReranker(latency=args.rerank_latency),
+            embed_model=FakeQueryEmbedding(latency=args.embed_latency),
+        )
+        shared.ensure_loaded()
+
+        recorder = StageRecorder()
+        shared.clean_text = recorder.wrap('clean_text', shared.clean_text)
+        shared.embed_query = recorder.wrap('embed', shared.embed_query)
+        shared.aembed_query = recorder.wrap_async('embed', shared.aembed_query)
+        shared.engine.search = recorder.wrap('retrieve', shared.engine.search)  # type: ignore
+        shared.to_nodes = recorder.wrap('retrieve', shared.to_nodes)
+        shared.fuse = recorder.wrap('fuse', shared.fuse)
+        shared.rerank = recorder.wrap('rerank', shared.rerank)
+        shared.arerank = recorder.wrap_async('rerank', shared.arerank)
+
+        conversations = scripts(products, args.sessions, args.turns)
+
+        test = LoadTest(args, shared, client, recorder)
+        start = time.perf_counter()
+        test.run(conversations)
+        wall = time.perf_counter() - start
+
+        results = dict(
+            commit=git_commit(),
+            config=vars(args),
+            wall_seconds=round(wall, 3),
+            turns=len(test.turn_latencies),
+            turns_per_second=round(len(test.turn_latencies) / wall, 2),
+            errors=test.errors,
+            searches=test.searches,
+            llm_calls=client.calls,
+            response_cache=test.response_cache.stats()
+            if isinstance(test.response_cache, ResponseCache) else None,
+            turn_latency_ms=percentiles(test.turn_latencies),
+            first_token_ms=percentiles(test.first_token),
+            stages=test.stage_report(),
+            background_ms={
+                stage: percentiles(values)
+                for stage, values in recorder.background.items() if values
+            },
+            memory=measure_session_memory(args, shared, client, conversations),
+        )
+
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    latency = results['turn_latency_ms']
+    print(
+        f"{results['turns']} turns in {results['wall_seconds']} s "
+        f"({results['turns_per_second']} turns/s, {results['errors']} errors, "
+        f"{results['searches']} searches)"
+    )
+    print(
+        f"turn latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  "
+        f"| first token p50 {results['first_token_ms'].get('p50')}"
+    )
+    for stage, report in results['stages'].items():
+        print(
+            f"  {stage:<10} {report['per_turn_ms'].get('mean', 0):9.2f} ms/turn  "
+            f"{report['share_of_turn'] * 100:5.1f}% of turn time"
+        )
+    print(f"memory per finished session: {results['memory']['bytes_per_session'] / 1024:.1f} KiB")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        before, after = baseline['turn_latency_ms']['p95'], latency['p95']
+        print(f"p95 turn latency: {before} ms (baseline {baseline.get('commit')}) -> {after} ms")
+        if after > before * (1 + args.tolerance):
+            print("regression: p95 turn latency above tolerance")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Recall and latency of the int8 / binary quantized search against exact search.
+
+Runs on the persisted data.json store and on a synthetic catalog of
+``--synthetic-docs`` vectors (noisy copies of the real product embeddings,
+so the value distribution matches Cohere's). Queries are noisy copies of
+random catalog vectors. The synthetic matrix is written to a temporary
+``.npy`` and memory-mapped, so re-scoring reads full-precision rows from
+disk the way ``VecDB`` does.
+
+No API key needed.
+
+    python -m benchmarks.bench_quantized --synthetic-docs 100000 --out quantized.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from agents.quantized_index import QuantizedSearchEngine
+from agents.vec_store import MmapVecStore
+from agents.vecdb2 import VectorSearchEngine
+
+
+def make_queries(matrix: np.ndarray, n: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    rows = rng.integers(0, len(matrix), size=n)
+    queries = np.asarray(matrix[rows], dtype=np.float32)
+    queries += rng.normal(0, noise / np.sqrt(matrix.shape[1]), queries.shape).astype(np.float32)
+    return MmapVecStore.normalize(queries)
+
+
+def synthetic_matrix(base: np.ndarray, n_docs: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    matrix = np.empty((n_docs, base.shape[1]), dtype=np.float32)
+    for start in range(0, n_docs, 10000):
+        end = min(start + 10000, n_docs)
+        block = base[rng.integers(0, len(base), size=end - start)]
+        block = block + rng.normal(0, noise / np.sqrt(base.shape[1]), block.shape).astype(np.float32)
+        matrix[start:end] = MmapVecStore.normalize(block)
+    return matrix
+
+
+def timed_search(engine, queries: np.ndarray, top_k: int) -> tuple[list[np.ndarray], list[float]]:
+    rows, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        q_rows, _ = engine.search(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        rows.append(q_rows)
+    return rows, latencies
+
+
+def evaluate(
+    name: str,
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    top_ks: list[int],
+    kinds: list[str],
+    oversample: int | None,
+) -> dict:
+    exact = VectorSearchEngine(matrix)
+    max_k = max(top_ks)
+    exact_rows, exact_ms = timed_search(exact, queries, max_k)
+
+    results = dict(
+        docs=len(matrix),
+        queries=len(queries),
+        exact=dict(
+            index_bytes=int(matrix.nbytes),
+            p50_ms=round(float(np.percentile(exact_ms, 50)), 3),
+            p95_ms=round(float(np.percentile(exact_ms, 95)), 3),
+        ),
+    )
+    print(f"{name}: {len(matrix)} docs, exact p50 {results['exact']['p50_ms']:.2f} ms, "
+          f"{matrix.nbytes / 2 ** 20:.1f} MiB float32")
+
+    for kind in kinds:
+        start = time.perf_counter()
+        engine = QuantizedSearchEngine.build(kind, matrix, oversample=oversample)
+        build_s = time.perf_counter() - start
+
+        result = dict(
+            index_bytes=int(engine.nbytes), build_s=round(build_s, 3), oversample=engine.oversample)
+        for top_k in top_ks:
+            rows, latencies = timed_search(engine, queries, top_k)
+            recall = np.mean([
+                len(set(got.tolist()) & set(want[:top_k].tolist())) / top_k
+                for got, want in zip(rows, exact_rows)
+            ])
+            result[f'recall@{top_k}'] = round(float(recall), 4)
+            result[f'p50_ms@{top_k}'] = round(float(np.percentile(latencies, 50)), 3)
+            result[f'p95_ms@{top_k}'] = round(float(np.percentile(latencies, 95)), 3)
+
+        results[kind] = result
+        print(
+            f"  {kind:<7} {engine.nbytes / 2 ** 20:7.2f} MiB  build {build_s:6.2f} s  "
+            f"x{engine.oversample:<3} " +
+            "  ".join(
+                f"recall@{k} {result[f'recall@{k}']:.3f} p50 {result[f'p50_ms@{k}']:.2f} ms"
+                for k in top_ks
+            )
+        )
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--persist-directory', default='./vec_db')
+    parser.add_argument('--synthetic-docs', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--kinds', nargs='+', default=list(QuantizedSearchEngine.KINDS))
+    parser.add_argument('--doc-noise', type=float, default=0.6,
+                        help="norm of the noise added to make synthetic products")
+    parser.add_argument('--query-noise', type=float, default=0.4)
+    parser.add_argument('--oversample', type=int, default=None,
+                        help="candidates re-scored per result (default: per kind)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help="optional JSON results path")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    store = MmapVecStore.load(args.persist_directory)
+
+    results = dict(catalog=evaluate(
+        'data.json',
+        store.vectors,
+        make_queries(store.vectors, args.queries, args.query_noise, rng),
+        [min(k, len(store)) for k in args.top_k],
+        args.kinds,
+        args.oversample,
+    ))
+
+    if args.synthetic_docs:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, MmapVecStore.VECTORS_FILE)
+            np.save(path, synthetic_matrix(
+                np.asarray(store.vectors), args.synthetic_docs, args.doc_noise, rng))
+            matrix = np.load(path, mmap_mode='r')
+
+            results['synthetic'] = evaluate(
+                'synthetic',
+                matrix,
+                make_queries(matrix, args.queries, args.query_noise, rng),
+                args.top_k,
+                args.kinds,
+                args.oversample,
+            )
+            del matrix
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Compare rerank backends against Cohere on the data.json catalog.
+
+For every query the same top-k candidates are retrieved once, then each
+backend reranks them. Reports mean/p95 rerank latency and how often the
+local top-2 matches Cohere's (as a set and in exact order).
+
+    COHERE_API_KEY=... python -m benchmarks.bench_rerank [--backends cosine cross-encoder]
+"""
+import argparse
+import json
+import os
+import re
+import time
+import numpy as np
+from agents.vecdb2 import VecDB
+from agents.rerankers import make_reranker
+
+
+def build_queries(data_path: str, limit: int) -> list[str]:
+    with open(data_path) as f:
+        products = json.load(f)
+
+    queries = []
+    for prod in products[:limit]:
+        # drop the category prefix and the product name so the query has
+        # to be matched on the description content.
+        description = prod['product_description'].split(':', 1)[-1]
+        first_sentence = re.split(r'(?<=\.)\s', description.strip())[0]
+        queries.append(
+            first_sentence.replace(prod['product_name'], 'product')
+        )
+    return queries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='data.json')
+    parser.add_argument('--persist-directory', default='./vec_db')
+    parser.add_argument('--limit', type=int, default=92)
+    parser.add_argument('--backends', nargs='+', default=['cosine', 'cross-encoder'])
+    parser.add_argument('--out', default=None, help="optional JSON results path")
+    args = parser.parse_args()
+
+    cohere_api_key = os.environ['COHERE_API_KEY']
+
+    vecdb = VecDB(
+        cohere_api_key=cohere_api_key,
+        persist_directory=args.persist_directory,
+    )
+    vecdb.load_vecdb()
+
+    queries = [vecdb.clean_text(q) for q in build_queries(args.data, args.limit)]
+    candidates = vecdb.retrieve_many(queries)
+
+    backends = ['cohere'] + [b for b in args.backends if b != 'cohere']
+    rankings: dict[str, list[list[str]]] = {}
+    results = {}
+
+    for backend in backends:
+        reranker = make_reranker(backend, cohere_api_key, top_n=2)
+
+        latencies, ranked_ids = [], []
+        for query, nodes in zip(queries, candidates):
+            start = time.perf_counter()
+            ranked = reranker.rerank(query, nodes)
+            latencies.append((time.perf_counter() - start) * 1000)
+            ranked_ids.append([node.node.node_id for node in ranked])
+
+        rankings[backend] = ranked_ids
+        results[backend] = dict(
+            mean_ms=float(np.mean(latencies)),
+            p95_ms=float(np.percentile(latencies, 95)),
+        )
+
+    for backend in backends:
+        set_agree = np.mean([
+            set(a) == set(b) for a, b in zip(rankings[backend], rankings['cohere'])
+        ])
+        exact_agree = np.mean([
+            a == b for a, b in zip(rankings[backend], rankings['cohere'])
+        ])
+        results[backend].update(
+            top2_set_agreement=float(set_agree),
+            top2_exact_agreement=float(exact_agree),
+        )
+
+    print(f"{'backend':<15}{'mean ms':>10}{'p95 ms':>10}{'set agr':>10}{'exact agr':>11}")
+    for backend, res in results.items():
+        print(
+            f"{backend:<15}{res['mean_ms']:>10.2f}{res['p95_ms']:>10.2f}"
+            f"{res['top2_set_agreement']:>10.2%}{res['top2_exact_agreement']:>11.2%}"
+        )
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(dict(queries=len(queries), results=results), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
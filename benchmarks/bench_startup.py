@@ -0,0 +1,145 @@
+"""Cold-import benchmark based on ``python -X importtime``.
+
+Imports each target module in a fresh interpreter ``--repeat`` times and
+reports the median cumulative import time, the slowest modules it pulled
+in, and which of the known heavy dependencies were loaded eagerly (they
+should only be imported on the code path that needs them). Results can be
+written with ``--out`` and compared against an earlier run with
+``--baseline``; the exit code is 1 when a target got slower than
+``--tolerance`` allows, so it can gate CI.
+
+    python -m benchmarks.bench_startup --out startup.json
+    python -m benchmarks.bench_startup --baseline startup.json --tolerance 0.25
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+TARGETS = (
+    'agents.resources',
+    'agents.vecdb2',
+    'agents.vecdb',
+    'agents.sales_agent',
+    'chat_ui_handler',
+)
+
+HEAVY_MODULES = (
+    'pandas',
+    'llama_index.core',
+    'llama_index.embeddings.cohere',
+    'llama_index.embeddings.huggingface',
+    'llama_index.postprocessor.cohere_rerank',
+    'sentence_transformers',
+    'torch',
+    'nest_asyncio',
+)
+
+
+def import_times(target: str) -> dict[str, tuple[int, int]]:
+    """Module name -> (self us, cumulative us) for one cold import of ``target``."""
+
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        errors = [
+            line for line in proc.stderr.strip().splitlines()
+            if not line.startswith('import time:')
+        ]
+        raise RuntimeError(errors[-1] if errors else 'unknown error')
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+
+    return times
+
+
+def measure(target: str, repeat: int, top: int) -> dict:
+    runs = [import_times(target) for _ in range(repeat)]
+
+    cumulative_ms = statistics.median(
+        run[target][1] for run in runs) / 1000
+
+    last = runs[-1]
+    slowest = sorted(last.items(), key=lambda item: item[1][0], reverse=True)[:top]
+
+    return dict(
+        cumulative_ms=round(cumulative_ms, 1),
+        modules=len(last),
+        heavy=[name for name in HEAVY_MODULES if name in last],
+        slowest=[
+            dict(module=name, self_ms=round(self_us / 1000, 1))
+            for name, (self_us, _) in slowest
+        ],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--targets', nargs='+', default=list(TARGETS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5)
+    parser.add_argument('--out', default=None, help="optional JSON results path")
+    parser.add_argument('--baseline', default=None, help="JSON results of an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown vs the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = {}
+    for target in args.targets:
+        try:
+            results[target] = measure(target, args.repeat, args.top)
+        except RuntimeError as e:
+            results[target] = dict(error=str(e))
+            print(f"{target}: import failed ({e})")
+            continue
+
+        result = results[target]
+        print(
+            f"{target}: {result['cumulative_ms']:8.1f} ms, {result['modules']} modules, "
+            f"heavy: {', '.join(result['heavy']) or '-'}"
+        )
+        for slow in result['slowest']:
+            print(f"    {slow['self_ms']:8.1f} ms  {slow['module']}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(dict(python=sys.version, results=results), f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+        regressions = []
+        for target, result in results.items():
+            before = baseline.get(target, {}).get('cumulative_ms')
+            if before is None or 'cumulative_ms' not in result:
+                continue
+
+            if result['cumulative_ms'] > before * (1 + args.tolerance):
+                regressions.append(
+                    f"{target}: {before} ms -> {result['cumulative_ms']} ms")
+
+            new_heavy = set(result['heavy']) - set(baseline[target].get('heavy', []))
+            if new_heavy:
+                regressions.append(
+                    f"{target}: now imports {', '.join(sorted(new_heavy))}")
+
+        if regressions:
+            print("regressions:\n  " + '\n  '.join(regressions))
+            sys.exit(1)
+
+        print("no regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
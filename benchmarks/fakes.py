@@ -0,0 +1,245 @@
+"""Deterministic offline stand-ins for Gemini, Cohere embeddings and Cohere rerank.
+
+Each fake sleeps for a configurable latency (``time.sleep`` on the sync
+path, ``asyncio.sleep`` on the async one) and derives its output from its
+input only, so benchmark runs are repeatable and need no API keys.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import types
+from google.genai.types import Candidate, Content, GenerateContentResponse, Part
+from agents.embed_pipeline import LocalEmbedder
+from agents.rerankers import CosineReranker
+from agents.response_formatter import ResponseFormatter
+
+
+def seeded_random(text: str) -> random.Random:
+    return random.Random(hashlib.sha256(text.encode('utf-8')).digest())
+
+
+class FakeQueryEmbedding:
+    """``CohereEmbedding`` look-alike for query embeddings (``LocalEmbedder`` vectors)."""
+
+    def __init__(self, dim: int = 1024, latency: float = 0.08) -> None:
+        self.local = LocalEmbedder(dim=dim, latency=0)
+        self.model_name = self.local.model_name
+        self.latency = latency
+        self.calls = 0
+
+    def get_query_embedding(self, text: str) -> list[float]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.local.embed(text).tolist()
+
+    async def aget_query_embedding(self, text: str) -> list[float]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.local.embed(text).tolist()
+
+    def get_text_embedding_batch(self, texts: list[str], **kwargs) -> list[list[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self.local.embed(text).tolist() for text in texts]
+
+    async def aget_text_embedding_batch(self, texts: list[str], **kwargs) -> list[list[float]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [self.local.embed(text).tolist() for text in texts]
+
+
+class FakeReranker(CosineReranker):
+    """Cohere-rerank stand-in: keeps the cosine order after a network-like delay."""
+
+    name = 'fake-rerank'
+
+    def __init__(self, top_n: int = 2, latency: float = 0.15) -> None:
+        super().__init__(top_n)
+        self.latency = latency
+        self.calls = 0
+
+    def rerank(self, query, nodes):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().rerank(query, nodes)
+
+    async def arerank(self, query, nodes):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return CosineReranker.rerank(self, query, nodes)
+
+
+class FakeGeminiModels:
+    """The ``generate_content`` / ``generate_content_stream`` pair of one client side.
+
+    Response policy, decided from the request contents only:
+        * the last content is a RAG result block -> recommend up to two of
+          the products it lists,
+        * the last user message contains "looking for" -> answer and ask
+          for a catalog search (30+ word English query),
+        * otherwise -> a plain answer.
+
+    Latency is ``ttft`` before the first chunk plus the output length at
+    ``tokens_per_second`` (4 characters per token), in ``chunk_chars``
+    sized chunks.
+    """
+
+    RAG_PREFIX = 'Search Results Based on user Query:'
+    PRODUCT_RE = re.compile(r'^\d+\. product name : (.*?)product description', re.MULTILINE)
+    ARABIC_RE = re.compile('[؀-ۿ]')
+
+    def __init__(
+        self,
+        is_async: bool,
+        vocabulary: list[str],
+        ttft: float = 0.6,
+        tokens_per_second: float = 150,
+        chunk_chars: int = 40,
+        answer_words: int = 80,
+        product_words: int = 60,
+    ) -> None:
+
+        self.is_async = is_async
+        self.vocabulary = vocabulary
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.chunk_chars = chunk_chars
+        self.answer_words = answer_words
+        self.product_words = product_words
+        self.calls = 0
+
+    def words(self, rng: random.Random, count: int) -> str:
+        return ' '.join(rng.choice(self.vocabulary) for _ in range(count))
+
+    def payload(self, contents) -> str:
+        self.calls += 1
+
+        last = contents[-1]
+        last_text = ''.join(part.text or '' for part in last.parts or [])
+        user_text = next(
+            (
+                ''.join(part.text or '' for part in content.parts or [])
+                for content in reversed(contents)
+                if content.role == 'user' and not
+                ''.join(part.text or '' for part in content.parts or []).startswith(self.RAG_PREFIX)
+            ),
+            last_text
+        )
+
+        rng = seeded_random(str(len(contents)) + last_text)
+        lang = 'ar' if self.ARABIC_RE.search(user_text) else 'en'
+
+        response = dict(
+            conversational_response=self.words(rng, self.answer_words),
+            conversation_langues=lang,
+            user_search_query=None,
+            recommended_products=None,
+            followup_questions=[self.words(rng, 8) + '?' for _ in range(3)],
+        )
+
+        if last.role == 'user' and last_text.startswith(self.RAG_PREFIX):
+            names = self.PRODUCT_RE.findall(last_text)[:2]
+            if names:
+                response['recommended_products'] = [
+                    dict(
+                        product_name=name.strip().title(),
+                        product_description=f'<p>{self.words(rng, self.product_words)}</p>',
+                        product_info_lang=lang,
+                    )
+                    for name in names
+                ]
+
+        elif 'looking for' in user_text.lower():
+            response['user_search_query'] = \
+                f"Bank Misr products matching: {user_text} {self.words(rng, 30)}"
+
+        return json.dumps(response, ensure_ascii=False)
+
+    def chunks(self, text: str) -> list[str]:
+        return [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+
+    def chunk_delay(self, chunk: str) -> float:
+        return len(chunk) / 4 / self.tokens_per_second
+
+    @staticmethod
+    def response(text: str) -> GenerateContentResponse:
+        return GenerateContentResponse(
+            candidates=[Candidate(content=Content(role='model', parts=[Part(text=text)]))]
+        )
+
+    def complete(self, text: str) -> GenerateContentResponse:
+        response = self.response(text)
+        response.parsed = ResponseFormatter.model_validate_json(text)
+        return response
+
+    def generate_content(self, contents, model=None, config=None):
+        if self.is_async:
+            return self.agenerate_content(contents)
+
+        text = self.payload(contents)
+        time.sleep(self.ttft + self.chunk_delay(text))
+        return self.complete(text)
+
+    async def agenerate_content(self, contents):
+        text = self.payload(contents)
+        await asyncio.sleep(self.ttft + self.chunk_delay(text))
+        return self.complete(text)
+
+    def generate_content_stream(self, contents, model=None, config=None):
+        if self.is_async:
+            return self.agenerate_content_stream(contents)
+
+        text = self.payload(contents)
+
+        def stream():
+            time.sleep(self.ttft)
+            for chunk in self.chunks(text):
+                time.sleep(self.chunk_delay(chunk))
+                yield self.response(chunk)
+
+        return stream()
+
+    async def agenerate_content_stream(self, contents):
+        text = self.payload(contents)
+
+        async def stream():
+            await asyncio.sleep(self.ttft)
+            for chunk in self.chunks(text):
+                await asyncio.sleep(self.chunk_delay(chunk))
+                yield self.response(chunk)
+
+        return stream()
+
+
+class FakeGeminiClient:
+    """``genai.Client`` look-alike with ``models`` and ``aio.models``."""
+
+    def __init__(self, vocabulary: list[str], **model_kwargs) -> None:
+        self.models = FakeGeminiModels(False, vocabulary, **model_kwargs)
+        self.aio = types.SimpleNamespace(
+            models=FakeGeminiModels(True, vocabulary, **model_kwargs))
+
+    @property
+    def calls(self) -> int:
+        return self.models.calls + self.aio.models.calls
+
+
+class NullElement:
+    """Streamlit container stand-in that only counts what would be sent."""
+
+    def __init__(self) -> None:
+        self.updates = 0
+        self.bytes_sent = 0
+
+    def container(self) -> "NullElement":
+        return self
+
+    def empty(self) -> "NullElement":
+        return self
+
+    def markdown(self, body: str, unsafe_allow_html: bool = False) -> None:
+        self.updates += 1
+        self.bytes_sent += len(body)
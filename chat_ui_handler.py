@@ -1,17 +1,52 @@
 import streamlit as st
-from google.genai.types import Content, Part, ContentListUnion, GenerateContentResponse
 from agents.sales_agent import SalesAgent
 from product_card import ProductCard
 from agents.response_formatter import ResponseFormatter
-from time import sleep
+from agents.response_stream import ResponseStream
+from agents.turn_log import ModelTurn, RagTurn, UserTurn
+from agents.tracing import Trace, tracer
+from stream_renderer import StreamRenderer
+from collections import deque
+from time import perf_counter
+from typing import Literal
+import json
 import re
 
 
 class ChatHandler:
+
+    # served by Streamlit's static file serving (server.enableStaticServing)
+    # at app/static/..., so the CSS only carries their URLs.
+    USER_AVATAR = 'static/user_avatar.png'
+    AI_AVATAR = 'static/banque_misr_avatar_logo.jpg'
+
+    HISTORY_CSS = """
+.chat-turn { display: flex; gap: 0.75rem; margin-bottom: 1rem; }
+.chat-turn .chat-avatar { width: 2rem; height: 2rem; border-radius: 0.5rem; flex-shrink: 0; background-size: cover; }
+.chat-turn.user .chat-avatar { background-image: url("{user_avatar}"); }
+.chat-turn.ai .chat-avatar { background-image: url("{ai_avatar}"); }
+.chat-turn .chat-body { flex: 1; min-width: 0; }
+.chat-turn details { border: 1px solid rgba(250, 250, 250, 0.2); border-radius: 0.5rem; padding: 0.5rem 1rem; margin: 0.5rem 0; }
+.product-cards { display: flex; gap: 1rem; }
+.product-card { flex: 1; border: 1px solid rgba(250, 250, 250, 0.2); border-radius: 0.5rem; padding: 1rem; }
+"""
+
+    # adds the history CSS to the page <head>, where it outlives the element
+    # that carried it, so later reruns do not send it again.
+    HISTORY_CSS_SCRIPT = """<script>
+if (!document.getElementById('chat-history-css')) {{
+    const style = document.createElement('style');
+    style.id = 'chat-history-css';
+    style.textContent = {css};
+    document.head.appendChild(style);
+}}
+</script>"""
+
     def __init__(
         self,
         gemini_api_key: str,
         cohere_api_key: str,
+        render_mode: Literal['incremental', 'replay'] = 'incremental',
     ) -> None:
 
         self.agent = SalesAgent(
@@ -19,6 +54,15 @@ class ChatHandler:
             cohere_api_key=cohere_api_key,
         )
         self.chat_hist = []
+        self.render_metrics = dict(updates_sent=0, bytes_sent=0)
+
+        # traces of this session's last turns, for the sidebar panel.
+        self.traces: deque[Trace] = deque(maxlen=20)
+
+        # 'incremental' emits finished turns from cached HTML in one call,
+        # 'replay' rebuilds every message with Streamlit elements.
+        self.render_mode = render_mode
+        self.turn_html_cache: dict[int, tuple[int, str]] = {}
 
         self.arabic_wrapper = '<div style="direction: rtl; text-align: right; padding-right: 15px;">{}</div>'
 
@@ -29,27 +73,28 @@ class ChatHandler:
             "[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF]+")
         return bool(arabic_pattern.search(text))
 
-    def render_user_msg(self, msg: Content | str):
+    def render_user_msg(self, msg: UserTurn | str):
 
-        if isinstance(msg, Content):
-            msg = msg.parts[0].text  # type: ignore
+        if isinstance(msg, UserTurn):
+            msg = msg.text
 
         if self.is_arabic(msg):
             msg = self.arabic_wrapper.format(msg)
 
-        with st.chat_message('user', avatar='pics/user_avatar.png'):
+        with st.chat_message('user', avatar=self.USER_AVATAR):
             st.markdown(msg, unsafe_allow_html=True)
 
     def render_ai_msg(
             self,
-            msg: ResponseFormatter,
+            msg: ModelTurn | ResponseFormatter,
             i: int | None = None
     ):
 
-        with st.chat_message('ai', avatar="pics/banque_misr_avatar_logo.jpg"):
+        with st.chat_message('ai', avatar=self.AI_AVATAR):
 
-            if msg is None:
+            if isinstance(msg, ModelTurn) and not msg.ok:
                 st.error("There are something wrong. try again later.")
+                return i or 0
 
             conversational_response = msg.conversational_response
 
@@ -67,7 +112,8 @@ class ChatHandler:
                     with st.container(border=True):
                         st.write(rag_results)
 
-                msg = self.chat_hist[i+2].parsed
+                msg = self.chat_hist[i+2]
+                conversational_response = msg.conversational_response
 
                 if msg.conversation_langues == 'ar':
                     conversational_response = self.arabic_wrapper.format(
@@ -100,51 +146,210 @@ class ChatHandler:
 
         return i or 0
 
+    @staticmethod
+    def turn_key(turn: list) -> int:
+        # str hashes are cached by the interpreter, so this does not rescan
+        # the text of finished turns on every rerun.
+        return hash(tuple(
+            record.text if isinstance(record, (UserTurn, RagTurn)) else
+            (record.conversational_response, record.raw_text, record.user_search_query,
+             tuple(prod.product_description for prod in record.recommended_products or ()))
+            for record in turn
+        ))
+
+    def text_html(self, text: str, lang: str | None = None) -> str:
+        # blank lines around the text let markdown (tables, lists) render
+        # inside the surrounding HTML.
+        if lang == 'ar' or (lang is None and self.is_arabic(text)):
+            text = self.arabic_wrapper.format(f'\n\n{text}\n\n')
+        return f'\n\n{text}\n\n'
+
+    def turn_html(self, turn: list) -> str:
+        user_html, ai_parts = '', []
+        products_msg = None
+        search_query = ''
+
+        for record in turn:
+            if isinstance(record, UserTurn):
+                user_html = self.text_html(record.text)
+
+            elif isinstance(record, RagTurn):
+                ai_parts.append(
+                    '<details><summary>Search In Database with...</summary>'
+                    f'{self.text_html(search_query, "en")}'
+                    f'{self.text_html(record.text, "en")}</details>'
+                )
+
+            elif not record.ok:
+                ai_parts.append(self.text_html(
+                    "There are something wrong. try again later.", "en"))
+
+            else:
+                ai_parts.append(self.text_html(
+                    record.conversational_response, record.conversation_langues))
+
+                search_query = record.user_search_query or ''
+                if record.recommended_products is not None:
+                    products_msg = record
+
+        if products_msg is not None:
+            title = "<h3>Recommended Products</h3>"
+            if products_msg.conversation_langues == 'ar':
+                title = self.arabic_wrapper.format(
+                    "<h3>" + "المنتاجات المقترحة" + "</h3>")
+
+            cards = ''.join(
+                ProductCard.card_html(
+                    prod.product_name,
+                    prod.product_description,
+                    prod.product_info_lang,  # type: ignore
+                )
+                for prod in products_msg.recommended_products  # type: ignore
+            )
+            ai_parts.append(f'{title}<div class="product-cards">{cards}</div>')
+
+        html = ''
+        if user_html:
+            html += (
+                '<div class="chat-turn user"><div class="chat-avatar"></div>'
+                f'<div class="chat-body">{user_html}</div></div>\n\n'
+            )
+        if ai_parts:
+            html += (
+                '<div class="chat-turn ai"><div class="chat-avatar"></div>'
+                f'<div class="chat-body">{"".join(ai_parts)}</div></div>\n\n'
+            )
+        return html
+
+    @classmethod
+    def history_css(cls) -> str:
+        return cls.HISTORY_CSS \
+            .replace('{user_avatar}', 'app/' + cls.USER_AVATAR) \
+            .replace('{ai_avatar}', 'app/' + cls.AI_AVATAR)
+
+    def inject_history_css(self) -> None:
+        """Send the history CSS once per browser session."""
+
+        if st.session_state.get('chat_history_css'):
+            return
+
+        st.html(
+            self.HISTORY_CSS_SCRIPT.format(css=json.dumps(self.history_css())),
+            unsafe_allow_javascript=True
+        )
+        st.session_state.chat_history_css = True
+
+    def history_html(self) -> list[str]:
+        """The HTML of every finished turn, rebuilt only when a turn changed."""
+
+        parts = []
+        for turn_i, turn in enumerate(self.chat_hist.turns()):  # type: ignore
+            key = self.turn_key(turn)
+
+            cached = self.turn_html_cache.get(turn_i)
+            if cached is None or cached[0] != key:
+                cached = (key, self.turn_html(turn))
+                self.turn_html_cache[turn_i] = cached
+
+            parts.append(cached[1])
+
+        return parts
+
     def render_chat(self):
         self.chat_hist = self.agent.get_chat_hist()
+
+        if self.render_mode == 'incremental':
+            if len(self.chat_hist):
+                self.inject_history_css()
+
+                # one element per turn: an unchanged turn is the same message
+                # on every rerun, which Streamlit's forward message cache
+                # sends as a hash reference once the browser has it.
+                with st.container():
+                    for html in self.history_html():
+                        st.markdown(html, unsafe_allow_html=True)
+            return
+
         chat_len = len(self.chat_hist)
 
         i = 0
         while i < chat_len:
             msg = self.chat_hist[i]
 
-            if isinstance(msg, Content):
+            if isinstance(msg, UserTurn):
                 self.render_user_msg(msg)
 
-            elif isinstance(msg, GenerateContentResponse):
-                i = self.render_ai_msg(msg.parsed, i)  # type: ignore
+            elif isinstance(msg, ModelTurn):
+                i = self.render_ai_msg(msg, i)
 
             i += 1
 
+    def record_render_metrics(self, metrics: dict) -> None:
+        for key in self.render_metrics:
+            self.render_metrics[key] += metrics.get(key, 0)
+
     def stream_markdown(self, text: str, parent, lang) -> None:
 
-        if lang == 'ar':
-            text = self.arabic_wrapper.format(text)
+        renderer = StreamRenderer(
+            parent,
+            wrapper=self.arabic_wrapper if lang == 'ar' else None
+        )
+        renderer.type_text(text)
+
+        self.record_render_metrics(renderer.metrics())
+
+    def stream_response(self, stream: ResponseStream, parent) -> ResponseFormatter | None:
+        """Render ``conversational_response`` tokens as the model produces them."""
+
+        renderer = StreamRenderer(parent)
+
+        # the span also covers the wait for the model; ``render_ms`` is the
+        # time spent in the renderer itself.
+        with tracer.span('ui.stream_response') as span:
+            for delta in stream:
+                start = perf_counter()
+
+                # the language field arrives after the answer, so detect RTL
+                # from the streamed text itself.
+                if renderer.wrapper is None and self.is_arabic(delta):
+                    renderer.wrapper = self.arabic_wrapper
+
+                renderer.push(delta)
+                span.add('render_ms', (perf_counter() - start) * 1000)
+
+            start = perf_counter()
+            renderer.finish()
+            span.add('render_ms', (perf_counter() - start) * 1000)
 
-        rendered_text = ''
-        for chr in text:
-            rendered_text += chr
-            parent.markdown(rendered_text, unsafe_allow_html=True)
-            sleep(.001)
+            span.set(**renderer.metrics())
+
+        self.record_render_metrics(renderer.metrics())
+
+        return stream.parsed
 
     def handle_prompt(self, prompt: str):
 
+        with tracer.span('turn', request_chars=len(prompt)) as span:
+            try:
+                self.respond(prompt)
+            finally:
+                self.traces.append(span.trace)
+
+    def respond(self, prompt: str):
+
         self.render_user_msg(msg=prompt)
 
-        with st.chat_message('ai', avatar="pics/banque_misr_avatar_logo.jpg"):
+        with st.chat_message('ai', avatar=self.AI_AVATAR):
 
             with st.spinner("Thinking...", show_time=True):
-                response: ResponseFormatter = self.agent.generate_response(
-                    prompt)
+                stream = self.agent.generate_response_stream(prompt).start()
+
+            response: ResponseFormatter = self.stream_response(
+                stream, parent=st.empty())  # type: ignore
 
             if response is None:
                 st.error("There Are something wrong, PLease Try Again Later.")
-
-            self.stream_markdown(
-                response.conversational_response,
-                parent=st.empty(),
-                lang=response.conversation_langues
-            )
+                return
 
             if response.user_search_query is not None:
                 with st.expander("Search In Database with...", expanded=True):
@@ -152,16 +357,19 @@ class ChatHandler:
                     st.write(response.user_search_query)
 
                     with st.spinner("Searching In VecDB"):
-                        rag_results, response = self.agent.rag_on(
+                        rag_results, stream = self.agent.rag_on_stream(
                             response.user_search_query
                         )
+                        stream.start()
                     with st.container(border=True):
                         st.write(rag_results)
 
-                self.stream_markdown(
-                    response.conversational_response,
-                    parent=st.empty(),
-                    lang=response.conversation_langues)
+                response = self.stream_response(
+                    stream, parent=st.empty())  # type: ignore
+
+                if response is None:
+                    st.error("There Are something wrong, PLease Try Again Later.")
+                    return
 
             if response.recommended_products is not None:
 
@@ -192,12 +400,13 @@ class ChatHandler:
 
                     # Display the product using the calculated display index
                     with cols[display_index]:
-                        ProductCard(
+                        card = ProductCard(
                             name=prod.product_name,
                             description=prod.product_description,
                             lang=prod.product_info_lang,
                             is_stream=True
                         )
+                        self.record_render_metrics(card.render_metrics)
 
                     # Increment the index
                     index += 1
@@ -209,34 +418,56 @@ class ChatHandler:
                     options=response.followup_questions,  # type: ignore
                 )
 
-    def track_hist(self):
-        self.chat_hist = self.agent.get_chat_hist()
-
-        cln_chat_hist = []
-        for msg in self.chat_hist:
-
-            if isinstance(msg, Content):
-                cln_chat_hist.append(
-                    dict(
-                        role='user',
-                        content=msg.parts[0].text  # type: ignore
-                    )
-                )
-
-            elif isinstance(msg, Part):
-                cln_chat_hist.append(
-                    dict(
-                        role='rag',
-                        content=msg.text
-                    )
-                )
-
-            elif isinstance(msg, GenerateContentResponse):
-                cln_chat_hist.append(
-                    dict(
-                        role='ai',
-                        content=msg.parsed.model_dump()  # type: ignore
-                    )
-                )
-
-        st.sidebar.write(cln_chat_hist)
+    def render_trace_panel(self):
+        """Sidebar view of the last turn's spans and per-stage session totals."""
+
+        with st.sidebar.expander("Turn Traces", expanded=True):
+            if not self.traces:
+                st.caption("No turns traced yet.")
+                return
+
+            trace = self.traces[-1]
+            root = trace.root
+
+            depths = {}
+            rows = []
+            for span in trace.spans:
+                depths[span.span_id] = depths.get(span.parent_id, -1) + 1  # type: ignore
+                rows.append(dict(
+                    stage='\u2003' * depths[span.span_id] + span.name,
+                    ms=round(span.duration * 1000, 1),
+                    status=span.status,
+                    details=', '.join(f'{key}={value}' for key, value in span.attributes.items()),
+                ))
+
+            st.markdown(f"**Last turn:** {root.duration * 1000:.0f} ms ({root.status})")  # type: ignore
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+
+            stage_ms: dict[str, list[float]] = {}
+            tokens = dict(prompt_tokens=0, output_tokens=0)
+            cache = dict(hits=0, lookups=0)
+
+            for trace in self.traces:
+                for name, seconds in trace.stage_totals().items():
+                    stage_ms.setdefault(name, []).append(seconds * 1000)
+
+                for span in trace.spans:
+                    for key in tokens:
+                        tokens[key] += span.attributes.get(key, 0)
+                    if 'cache_hit' in span.attributes:
+                        cache['lookups'] += 1
+                        cache['hits'] += bool(span.attributes['cache_hit'])
+
+            st.markdown(f"**Last {len(self.traces)} turns**, mean ms per turn:")
+            st.dataframe(
+                [
+                    dict(stage=name, ms=round(sum(values) / len(self.traces), 1))
+                    for name, values in sorted(stage_ms.items(), key=lambda item: -sum(item[1]))
+                ],
+                hide_index=True,
+                use_container_width=True
+            )
+            st.caption(
+                f"Tokens: {tokens['prompt_tokens']} prompt, {tokens['output_tokens']} output | "
+                f"Cache hits: {cache['hits']}/{cache['lookups']}"
+            )
@@ -1,10 +1,13 @@
 import streamlit as st
 from typing import Literal
-from time import sleep
+from stream_renderer import StreamRenderer
 import uuid
 
 
 class ProductCard:
+
+    RTL_WRAPPER = '<div style="direction: rtl; text-align: right;  padding-right: 15px;">{}</div>'
+
     def __init__(
         self,
         name: str,
@@ -13,15 +16,15 @@ class ProductCard:
         is_stream=True
     ) -> None:
 
+        self.render_metrics = dict(updates_sent=0, bytes_sent=0)
+
         name = f'<h3>{name}</h3>'
 
         if lang == 'ar':
             # For Arabic, use RTL direction
-            wrapper = '<div style="direction: rtl; text-align: right;  padding-right: 15px;">{}</div>'
-
-            name = wrapper.format(name)
+            name = self.RTL_WRAPPER.format(name)
 
-            description = wrapper.format(description)
+            description = self.RTL_WRAPPER.format(description)
 
         with st.container(border=True, key=str(uuid.uuid4())):
 
@@ -32,33 +35,54 @@ class ProductCard:
                 st.markdown(name, unsafe_allow_html=True)
                 st.markdown(description, unsafe_allow_html=True)
 
-            details = 'Details...' if lang == 'en' else 'تفاصل...'
-            st.markdown(
-                f"""
-                <a href="https://example.com" target="_blank" style="text-decoration: none; direction: {'rtl' if lang == 'ar' else 'ltr'};">
-                <div style="
-                    padding: 0.4em 1em;
-                    color: white;
-                    background-color: #262C33FF;
-                    border-radius: 10px;
-                    text-align: center;
-                    width: 100%;
-                    box-sizing: border-box;
-                    margin-bottom: 15px;
-                ">
-                    {details}
-                </div>
-            </a>
-            """,
-                unsafe_allow_html=True
-            )
+            st.markdown(self.details_html(lang), unsafe_allow_html=True)
+
+    @staticmethod
+    def details_html(lang: Literal["en", 'ar'] = 'en') -> str:
+        details = 'Details...' if lang == 'en' else 'تفاصل...'
+        return f"""
+<a href="https://example.com" target="_blank" style="text-decoration: none; direction: {'rtl' if lang == 'ar' else 'ltr'};">
+<div style="
+    padding: 0.4em 1em;
+    color: white;
+    background-color: #262C33FF;
+    border-radius: 10px;
+    text-align: center;
+    width: 100%;
+    box-sizing: border-box;
+    margin-bottom: 15px;
+">
+    {details}
+</div>
+</a>
+"""
+
+    @classmethod
+    def card_html(
+        cls,
+        name: str,
+        description: str,
+        lang: Literal["en", 'ar'] = 'en',
+    ) -> str:
+        """Static HTML of a finished card, for the cached chat history."""
+
+        name = f'<h3>{name}</h3>'
+        if lang == 'ar':
+            name = cls.RTL_WRAPPER.format(name)
+            description = cls.RTL_WRAPPER.format(description)
+
+        return (
+            '<div class="product-card">'
+            f'{name}{description}{cls.details_html(lang)}'
+            '</div>'
+        )
 
     def stream_markdown(self, text, parent):
 
-        rendered_text = ''
-        for chr in text:
-            rendered_text += chr
-            # Wrap the text in appropriate direction div
-            parent.markdown(rendered_text, unsafe_allow_html=True)
-            sleep(.001)
+        renderer = StreamRenderer(parent)
+        renderer.type_text(text)
+
+        for key, value in renderer.metrics().items():
+            if key in self.render_metrics:
+                self.render_metrics[key] += value
 
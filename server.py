@@ -0,0 +1,426 @@
+"""Headless HTTP/WebSocket entry point for the sales agent.
+
+    GEMINI_API_KEY=... COHERE_API_KEY=... python server.py --port 8080
+
+Endpoints:
+    POST   /sessions                   -> {"session_id": ...}
+    POST   /sessions/{id}/turns        {"prompt": ..., "stream": false}
+    GET    /sessions/{id}/history
+    DELETE /sessions/{id}
+    GET    /sessions/{id}/ws           WebSocket, send {"prompt": ...}
+    GET    /healthz
+    GET    /metrics                    Prometheus text format (--trace-exporters prometheus)
+
+A turn produces ``delta`` events (answer text as it streams), ``search``
+and ``rag`` events when the model searches the catalog, and a ``final``
+event with the parsed response. Streamed HTTP turns return them as NDJSON.
+
+Turns run through a ``TurnLimiter``: at most ``max_concurrent_turns``
+run at once (each one holds Gemini and Cohere calls), up to
+``max_waiting`` wait for a slot, and anything beyond that is rejected
+with 429 and ``Retry-After``. Each session serves one turn at a time
+(409 while busy).
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing, asynccontextmanager
+from typing import Awaitable, Callable
+from aiohttp import WSMsgType, web
+from agents import tracing
+from agents.sales_agent import AsyncSalesAgent
+from agents.turn_log import ModelTurn, RagTurn, UserTurn
+
+
+class Overloaded(Exception):
+    pass
+
+
+class TurnLimiter:
+    """Semaphore with a bounded wait queue; rejects instead of queueing forever."""
+
+    def __init__(self, max_concurrent: int = 32, max_waiting: int = 64) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise Overloaded()
+
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+    def stats(self) -> dict:
+        return dict(
+            active=self.active,
+            waiting=self.waiting,
+            rejected=self.rejected,
+            max_concurrent=self.max_concurrent,
+            max_waiting=self.max_waiting,
+        )
+
+
+class Session:
+    __slots__ = ('agent', 'lock', 'last_used')
+
+    def __init__(self, agent: AsyncSalesAgent) -> None:
+        self.agent = agent
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """Per-session agents (chat state only; clients and index are shared).
+
+    Sessions idle for ``ttl`` seconds are dropped, and past
+    ``max_sessions`` the least recently used idle session is evicted.
+    """
+
+    def __init__(
+        self,
+        agent_factory: Callable[[], AsyncSalesAgent],
+        ttl: float = 1800,
+        max_sessions: int = 10_000,
+    ) -> None:
+
+        self.agent_factory = agent_factory
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def create(self) -> str:
+        self.evict()
+
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = Session(self.agent_factory())
+        return session_id
+
+    def get(self, session_id: str) -> Session | None:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self.sessions.pop(session_id, None) is not None
+
+    def evict(self) -> None:
+        expired_before = time.monotonic() - self.ttl
+        for session_id, session in list(self.sessions.items()):
+            if session.last_used < expired_before and not session.lock.locked():
+                del self.sessions[session_id]
+
+        for session_id, session in list(self.sessions.items()):
+            if len(self.sessions) < self.max_sessions:
+                break
+            if not session.lock.locked():
+                del self.sessions[session_id]
+
+
+async def run_turn(agent: AsyncSalesAgent, prompt: str, emit: Callable[[dict], Awaitable[None]]) -> None:
+    """One chat turn, the same flow as ``ChatHandler.handle_prompt``."""
+
+    stream = await (await agent.generate_response_stream(prompt)).astart()
+    async with aclosing(stream.__aiter__()) as deltas:
+        async for delta in deltas:
+            await emit(dict(type='delta', text=delta))
+
+    response = stream.parsed
+    if response is not None and response.user_search_query is not None:
+        await emit(dict(type='search', query=response.user_search_query))
+
+        _, stream = await agent.rag_on_stream(response.user_search_query)
+        await stream.astart()
+        await emit(dict(type='rag', product_ids=list(agent.vecdb.last_result_ids)))
+
+        async with aclosing(stream.__aiter__()) as deltas:
+            async for delta in deltas:
+                await emit(dict(type='delta', text=delta))
+
+        response = stream.parsed
+
+    if response is None:
+        await emit(dict(type='error', status=502, error="model response could not be parsed"))
+        return
+
+    await emit(dict(type='final', response=response.model_dump()))
+
+
+def history_json(agent: AsyncSalesAgent) -> list[dict]:
+    history = []
+    for record in agent.get_chat_hist():
+        if isinstance(record, UserTurn):
+            history.append(dict(role='user', text=record.text))
+        elif isinstance(record, RagTurn):
+            history.append(dict(role='rag', product_ids=list(record.product_ids)))
+        elif isinstance(record, ModelTurn):
+            history.append(dict(role='model', response=record.to_dict() if record.ok else None))
+    return history
+
+
+class AgentServer:
+
+    def __init__(
+        self,
+        agent_factory: Callable[[], AsyncSalesAgent],
+        max_concurrent_turns: int = 32,
+        max_waiting_turns: int = 64,
+        session_ttl: float = 1800,
+        max_sessions: int = 10_000,
+        retry_after: int = 1,
+    ) -> None:
+
+        self.sessions = SessionStore(agent_factory, session_ttl, max_sessions)
+        self.limiter = TurnLimiter(max_concurrent_turns, max_waiting_turns)
+        self.retry_after = retry_after
+
+        self.turns = 0
+        self.failed_turns = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.get('/healthz', self.healthz),
+            web.get('/metrics', self.metrics),
+            web.post('/sessions', self.create_session),
+            web.delete('/sessions/{session_id}', self.delete_session),
+            web.get('/sessions/{session_id}/history', self.history),
+            web.post('/sessions/{session_id}/turns', self.turn),
+            web.get('/sessions/{session_id}/ws', self.websocket),
+        ])
+        return app
+
+    def session_or_404(self, request: web.Request) -> Session:
+        session = self.sessions.get(request.match_info['session_id'])
+        if session is None:
+            raise web.HTTPNotFound(
+                text=json.dumps(dict(error="unknown session")),
+                content_type='application/json'
+            )
+        return session
+
+    def overloaded(self) -> web.Response:
+        return web.json_response(
+            dict(error="server overloaded, retry later"),
+            status=429,
+            headers={'Retry-After': str(self.retry_after)}
+        )
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(
+            sessions=len(self.sessions),
+            turns=self.turns,
+            failed_turns=self.failed_turns,
+            limiter=self.limiter.stats(),
+        ))
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        prometheus = tracing.tracer.exporter(tracing.PrometheusExporter)
+        if prometheus is None:
+            raise web.HTTPNotFound(text="start the server with --trace-exporters prometheus")
+
+        return web.Response(
+            body=prometheus.render().encode('utf-8'),
+            headers={'Content-Type': prometheus.CONTENT_TYPE}
+        )
+
+    async def create_session(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(session_id=self.sessions.create()), status=201)
+
+    async def delete_session(self, request: web.Request) -> web.Response:
+        if not self.sessions.delete(request.match_info['session_id']):
+            raise web.HTTPNotFound()
+        return web.Response(status=204)
+
+    async def history(self, request: web.Request) -> web.Response:
+        session = self.session_or_404(request)
+        return web.json_response(history_json(session.agent))
+
+    async def guarded_turn(self, session: Session, prompt: str, emit) -> None:
+        """Runs a turn under the session lock and a limiter slot.
+
+        Raises ``Overloaded`` when no slot is available; agent errors are
+        reported as ``error`` events.
+        """
+
+        async with self.limiter.slot():
+            self.turns += 1
+            try:
+                with tracing.tracer.span('turn', request_chars=len(prompt)):
+                    await run_turn(session.agent, prompt, emit)
+
+            except asyncio.TimeoutError:
+                self.failed_turns += 1
+                await emit(dict(type='error', status=504, error="model or retrieval timed out"))
+
+            except (ConnectionResetError, asyncio.CancelledError):
+                self.failed_turns += 1
+                raise
+
+            except Exception as e:
+                self.failed_turns += 1
+                await emit(dict(type='error', status=502, error=f"{type(e).__name__}: {e}"))
+
+    async def turn(self, request: web.Request) -> web.StreamResponse:
+        session = self.session_or_404(request)
+
+        try:
+            body = await request.json()
+        except ValueError:
+            # json.JSONDecodeError, and a body that is not valid utf-8.
+            raise web.HTTPBadRequest(text="request body must be a JSON object")
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(text="request body must be a JSON object")
+
+        prompt = body.get('prompt')
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise web.HTTPBadRequest(text="'prompt' must be a non-empty string")
+
+        if session.lock.locked():
+            return web.json_response(dict(error="session is busy"), status=409)
+
+        async with session.lock:
+            if body.get('stream'):
+                return await self.streamed_turn(request, session, prompt)
+
+            events = []
+
+            async def emit(event: dict) -> None:
+                if event['type'] != 'delta':
+                    events.append(event)
+
+            try:
+                await self.guarded_turn(session, prompt, emit)
+            except Overloaded:
+                return self.overloaded()
+
+            final = events[-1]
+            status = final.get('status', 200) if final['type'] == 'error' else 200
+            return web.json_response(dict(events=events), status=status)
+
+    async def streamed_turn(self, request: web.Request, session: Session, prompt: str) -> web.StreamResponse:
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+
+        async def emit(event: dict) -> None:
+            if not response.prepared:
+                await response.prepare(request)
+            await response.write((json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'))
+
+        try:
+            await self.guarded_turn(session, prompt, emit)
+        except Overloaded:
+            # nothing was sent yet, so a plain 429 can still be returned.
+            return self.overloaded()
+
+        await response.write_eof()
+        return response
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        session = self.session_or_404(request)
+
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+
+        async def emit(event: dict) -> None:
+            await ws.send_json(event)
+
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+
+            try:
+                prompt = json.loads(message.data).get('prompt')
+            except (ValueError, AttributeError):
+                prompt = None
+
+            if not isinstance(prompt, str) or not prompt.strip():
+                await emit(dict(type='error', status=400, error="'prompt' must be a non-empty string"))
+                continue
+
+            if session.lock.locked():
+                await emit(dict(type='error', status=409, error="session is busy"))
+                continue
+
+            async with session.lock:
+                try:
+                    await self.guarded_turn(session, prompt, emit)
+                except Overloaded:
+                    await emit(dict(
+                        type='error', status=429,
+                        error="server overloaded, retry later", retry_after=self.retry_after))
+
+        return ws
+
+
+def env_agent_factory(request_timeout: float | None = 60.0) -> Callable[[], AsyncSalesAgent]:
+    gemini_api_key = os.environ['GEMINI_API_KEY']
+    cohere_api_key = os.environ['COHERE_API_KEY']
+
+    def factory() -> AsyncSalesAgent:
+        return AsyncSalesAgent(
+            gemini_api_key=gemini_api_key,
+            cohere_api_key=cohere_api_key,
+            request_timeout=request_timeout,
+        )
+
+    return factory
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-concurrent-turns', type=int, default=32)
+    parser.add_argument('--max-waiting-turns', type=int, default=64)
+    parser.add_argument('--session-ttl', type=float, default=1800)
+    parser.add_argument('--max-sessions', type=int, default=10_000)
+    parser.add_argument('--request-timeout', type=float, default=60.0)
+    parser.add_argument('--trace-exporters', default=None,
+                        help="comma-separated: log, prometheus, otel (default $AGENT_TRACE_EXPORTERS)")
+    args = parser.parse_args()
+
+    tracing.configure(args.trace_exporters)
+
+    factory = env_agent_factory(args.request_timeout)
+
+    # the first agent loads the shared client and index (see
+    # agents.resources), so no request pays for it.
+    factory()
+
+    server = AgentServer(
+        factory,
+        max_concurrent_turns=args.max_concurrent_turns,
+        max_waiting_turns=args.max_waiting_turns,
+        session_ttl=args.session_ttl,
+        max_sessions=args.max_sessions,
+    )
+    web.run_app(server.app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import re
+from time import monotonic, sleep
+
+
+class StreamRenderer:
+    """Coalesces streamed markdown/HTML into a few cheap Streamlit updates.
+
+    Text is pushed in deltas and re-rendered at most ``max_updates_per_second``
+    times, always cut back to a word or tag boundary so a half-open tag or
+    entity (``<div sty``, ``&nbs``) is never sent. Finished top-level blocks
+    (a paragraph, list, table or closed element) are frozen into their own
+    element and a new placeholder takes the rest, so each update only
+    resends the current block instead of everything rendered so far.
+    """
+
+    TOKEN_RE = re.compile(r'<[^<>]*>|[^<\s]+\s*|\s+|<')
+    BOUNDARY_RE = re.compile(r'\n\s*\n|```|<(/?)([a-zA-Z][\w-]*)[^<>]*?(/?)>')
+    PARTIAL_ENTITY_RE = re.compile(r'&[#\w]{0,10}$')
+
+    VOID_TAGS = frozenset((
+        'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+        'link', 'meta', 'source', 'track', 'wbr',
+    ))
+    BLOCK_TAGS = frozenset((
+        'p', 'div', 'ul', 'ol', 'table', 'blockquote', 'pre',
+        'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    ))
+
+    def __init__(
+        self,
+        parent,
+        max_updates_per_second: float = 30,
+        wrapper: str | None = None,
+    ) -> None:
+
+        self.container = parent.container()
+        self.min_interval = 1 / max_updates_per_second
+        self.wrapper = wrapper
+
+        self.frozen: list[str] = []
+        self.segment = ''
+        self.placeholder = self.container.empty()
+        self.rendered_segment = ''
+        self.last_update = 0.0
+
+        self.updates_sent = 0
+        self.bytes_sent = 0
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.frozen) + self.segment
+
+    def push(self, delta: str) -> None:
+        self.segment += delta
+
+        if monotonic() - self.last_update >= self.min_interval:
+            self.flush()
+
+    def flush(self, final: bool = False) -> None:
+
+        boundary = self.last_block_boundary(self.segment)
+        if 0 < boundary < len(self.segment):
+            self.render(self.segment[:boundary])
+
+            self.frozen.append(self.segment[:boundary])
+            self.segment = self.segment[boundary:]
+            self.placeholder = self.container.empty()
+            self.rendered_segment = ''
+
+        self.render(self.segment if final else self.safe_prefix(self.segment))
+
+    def finish(self) -> str:
+        self.flush(final=True)
+        return self.text
+
+    def type_text(self, text: str, chars_per_second: float = 1000) -> str:
+        """Typewriter effect for already complete text, word by word."""
+
+        start = monotonic()
+        pushed = 0
+        for token in self.TOKEN_RE.findall(text):
+            self.push(token)
+            pushed += len(token)
+
+            delay = start + pushed / chars_per_second - monotonic()
+            if delay > 0:
+                sleep(delay)
+
+        return self.finish()
+
+    def render(self, text: str) -> None:
+        if not text or text == self.rendered_segment:
+            return
+
+        payload = self.wrapper.format(text) if self.wrapper else text
+        self.placeholder.markdown(payload, unsafe_allow_html=True)
+
+        self.rendered_segment = text
+        self.last_update = monotonic()
+        self.updates_sent += 1
+        self.bytes_sent += len(payload.encode('utf-8'))
+
+    def metrics(self) -> dict:
+        return dict(
+            updates_sent=self.updates_sent,
+            bytes_sent=self.bytes_sent,
+            chars=len(self.text),
+            segments=len(self.frozen) + 1,
+        )
+
+    @classmethod
+    def safe_prefix(cls, text: str) -> str:
+        """Longest prefix that ends on a word or tag boundary."""
+
+        open_tag = text.rfind('<')
+        if open_tag > text.rfind('>'):
+            text = text[:open_tag]
+
+        entity = cls.PARTIAL_ENTITY_RE.search(text)
+        if entity:
+            text = text[:entity.start()]
+
+        if text and not text[-1].isspace() and text[-1] != '>':
+            cut = max(text.rfind(' '), text.rfind('\n'), text.rfind('>'))
+            text = text[:cut + 1]
+
+        return text
+
+    @classmethod
+    def last_block_boundary(cls, text: str) -> int:
+        """End of the last top-level block, outside any open tag or code fence."""
+
+        depth = 0
+        in_fence = False
+        boundary = 0
+
+        for match in cls.BOUNDARY_RE.finditer(text):
+            token = match.group(0)
+
+            if token == '```':
+                in_fence = not in_fence
+                continue
+
+            if in_fence:
+                continue
+
+            if token[0] != '<':
+                if depth == 0:
+                    boundary = match.end()
+                continue
+
+            closing, tag, self_closing = match.groups()
+            tag = tag.lower()
+            if self_closing or tag in cls.VOID_TAGS:
+                continue
+
+            if closing:
+                depth = max(depth - 1, 0)
+                if depth == 0 and tag in cls.BLOCK_TAGS:
+                    boundary = match.end()
+            else:
+                depth += 1
+
+        return boundary
@@ -0,0 +1,54 @@
+import os
+import pandas as pd
+import pytest
+from agents import resources, sales_agent
+from agents.embed_pipeline import LocalEmbedder
+from agents.resources import ResourceRegistry
+from agents.response_formatter import ResponseFormatter
+from agents.vecdb2 import VecDB
+from benchmarks.fakes import FakeQueryEmbedding, FakeReranker
+
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data.json')
+COLUMNS = ['product_name', 'product_description']
+
+
+def answer(text: str, search: str | None = None) -> ResponseFormatter:
+    return ResponseFormatter(
+        conversational_response=text,
+        conversation_langues='en',
+        user_search_query=search,
+        followup_questions=None,
+    )
+
+
+def vectorize(persist_directory: str, data: pd.DataFrame | None = None, dim: int = 32) -> None:
+    """Index ``data`` (the whole catalog by default) with an offline embedder."""
+
+    VecDB('offline', persist_directory).vectorize_db(
+        data if data is not None else pd.read_json(DATA_PATH), 'product_name', COLUMNS,
+        embedder=LocalEmbedder(dim=dim, latency=0.0))
+
+
+@pytest.fixture
+def registry(monkeypatch) -> ResourceRegistry:
+    # vectorize_db invalidates the process-wide registry, agents get theirs from it.
+    fresh = ResourceRegistry()
+    monkeypatch.setattr(resources, 'registry', fresh)
+    monkeypatch.setattr(sales_agent, 'registry', fresh)
+    return fresh
+
+
+@pytest.fixture(scope='module')
+def shared_vecdb(tmp_path_factory) -> VecDB:
+    """The catalog loaded once per test module, with instant fake models."""
+
+    persist_directory = str(tmp_path_factory.mktemp('vec_db'))
+    vectorize(persist_directory, dim=64)
+
+    vecdb = VecDB(
+        'offline', persist_directory,
+        reranker=FakeReranker(latency=0.0),
+        embed_model=FakeQueryEmbedding(dim=64, latency=0.0))
+    vecdb.ensure_loaded()
+    return vecdb
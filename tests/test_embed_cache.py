@@ -0,0 +1,40 @@
+import numpy as np
+from agents.embed_cache import EmbeddingCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = EmbeddingCache(max_size=2)
+    cache.put('model', 'a', [1.0, 0.0])
+    cache.put('model', 'b', [0.0, 1.0])
+
+    # reading 'a' makes 'b' the oldest entry.
+    assert cache.get('model', 'a') is not None
+    cache.put('model', 'c', [0.5, 0.5])
+
+    assert len(cache) == 2
+    assert cache.get('model', 'b') is None
+    assert cache.get('model', 'a') is not None and cache.get('model', 'c') is not None
+    # entries of another model are separate.
+    assert cache.get('other', 'a') is None
+
+
+def test_sqlite_entries_survive_a_new_instance(tmp_path):
+    path = str(tmp_path / 'embeddings.sqlite')
+    EmbeddingCache(persist_path=path).put('model', 'credit card', [0.25, 0.5, 0.75])
+
+    cache = EmbeddingCache(max_size=1, persist_path=path)
+    embedding = cache.get('model', 'credit card')
+
+    assert embedding is not None and embedding.dtype == np.float32
+    assert np.array_equal(embedding, [0.25, 0.5, 0.75])
+    assert cache.stats()['disk_hits'] == 1
+
+    # the disk hit is now served from memory.
+    cache.get('model', 'credit card')
+    assert cache.stats()['hits'] == 1
+
+    # a memory eviction falls back to the disk table.
+    cache.put('model', 'savings account', [1.0, 0.0, 0.0])
+    assert len(cache) == 1
+    assert cache.get('model', 'credit card') is not None
+    assert cache.stats()['disk_hits'] == 2
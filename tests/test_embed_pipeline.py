@@ -0,0 +1,67 @@
+import numpy as np
+from agents.embed_pipeline import EmbeddingCheckpoint, EmbeddingPipeline, LocalEmbedder
+
+
+def records(n: int) -> list[tuple[str, str]]:
+    return [(f'doc-{i}', f'product text {i}') for i in range(n)]
+
+
+class FailingEmbedder(LocalEmbedder):
+    """Fails every batch after the first ``ok_batches``."""
+
+    def __init__(self, ok_batches: int, **kwargs) -> None:
+        super().__init__(latency=0.0, **kwargs)
+        self.ok_batches = ok_batches
+
+    async def aembed_batch(self, texts):
+        if self.calls >= self.ok_batches:
+            raise ConnectionError("down")
+        return await super().aembed_batch(texts)
+
+
+def pipeline(embedder, path) -> EmbeddingPipeline:
+    return EmbeddingPipeline(
+        embedder, batch_size=4, max_in_flight=1, max_retries=0,
+        checkpoint_path=str(path), show_progress=False)
+
+
+def interrupted_run(embedder, path) -> None:
+    try:
+        pipeline(embedder, path).run(records(10))
+    except ConnectionError:
+        pass
+
+
+def test_resumes_same_model(tmp_path):
+    path = tmp_path / 'checkpoint.sqlite'
+    interrupted_run(FailingEmbedder(ok_batches=2, dim=8), path)
+
+    resumed = pipeline(LocalEmbedder(dim=8, latency=0.0), path)
+    embeddings = resumed.run(records(10))
+
+    assert resumed.resumed == 8
+    assert all(len(emb) == 8 for emb in embeddings.values())
+
+
+def test_checkpoint_of_another_model_is_cleared(tmp_path):
+    path = tmp_path / 'checkpoint.sqlite'
+    interrupted_run(FailingEmbedder(ok_batches=2, dim=8), path)
+
+    other = pipeline(LocalEmbedder(dim=16, latency=0.0), path)
+    embeddings = other.run(records(10))
+
+    assert other.resumed == 0
+    assert np.stack(list(embeddings.values())).shape == (10, 16)
+
+
+def test_rows_of_another_dimension_are_skipped(tmp_path):
+    path = str(tmp_path / 'checkpoint.sqlite')
+    checkpoint = EmbeddingCheckpoint(path, 'model')
+    checkpoint.save(records(2), [np.ones(8), np.ones(8)])
+    checkpoint.conn.execute(
+        'INSERT INTO embeddings VALUES (?, ?, ?)',
+        ('doc-9', EmbeddingCheckpoint.text_hash('x'), np.ones(4, dtype=np.float32).tobytes()))
+    checkpoint.conn.commit()
+    checkpoint.close()
+
+    assert sorted(EmbeddingCheckpoint(path, 'model').load()) == ['doc-0', 'doc-1']
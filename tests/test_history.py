@@ -0,0 +1,61 @@
+from agents.history import ExtractiveSummarizer, HistoryManager
+from agents.turn_log import ModelTurn, ProductRecord, TurnLog
+
+
+def chat(n_turns: int) -> TurnLog:
+    log = TurnLog()
+    for i in range(n_turns):
+        log.append_user(f"question {i} about cards")
+        log.append_rag(f"Search results {i}: " + "long product details " * 40, (f'product-{i}',))
+        log.extend([ModelTurn(
+            conversational_response=f"answer {i}",
+            recommended_products=(ProductRecord(f'Card {i}', 'details ' * 40, 'en'),),
+        )])
+    return log
+
+
+def tokens(contents) -> int:
+    return sum(HistoryManager.estimate_tokens(HistoryManager.content_text(c)) for c in contents)
+
+
+def test_history_within_budget_collapses_only_older_turns():
+    log = chat(4)
+    contents = HistoryManager(token_budget=100_000, keep_recent_turns=2).compact(log)
+
+    assert len(contents) == len(log)
+    texts = [HistoryManager.content_text(c) for c in contents]
+    assert texts[1] == "Earlier search results (details omitted): product-0"
+    assert 'Card 0' in texts[2] and 'details' not in texts[2]
+    # the newest turns are sent verbatim.
+    assert [c.model_dump() for c in contents[6:]] == [c.model_dump() for c in log.to_contents()[6:]]
+
+
+def test_turns_over_budget_are_summarized_incrementally():
+    calls = []
+
+    def summarizer(previous: str, turns: list[dict]) -> str:
+        calls.append([turn['user'] for turn in turns])
+        return ExtractiveSummarizer()(previous, turns)
+
+    log = chat(8)
+    recent = tokens(log.to_contents()[-6:])
+    history = HistoryManager(token_budget=recent + 200, keep_recent_turns=2, summarizer=summarizer)
+
+    contents = history.compact(log)
+    assert tokens(contents) <= history.token_budget
+    # some older turns still fit collapsed next to the summary.
+    assert 0 < history.summarized_turns < 6
+    assert len(contents) == 1 + 3 * (8 - history.summarized_turns)
+
+    summary = HistoryManager.content_text(contents[0])
+    assert contents[0].role == 'user'
+    assert summary.startswith("Summary of the earlier conversation:")
+    assert "question 0 about cards" in summary and "Card 0" in summary
+    # every turn reaches the summarizer once, in order.
+    assert sum(calls, []) == [f"question {i} about cards" for i in range(history.summarized_turns)]
+
+    # a new turn only sends the turns that left the window to the summarizer.
+    summarized, n_calls = history.summarized_turns, len(calls)
+    log.extend(chat(9).records[-3:])
+    history.compact(log)
+    assert calls[n_calls][0] == f"question {summarized} about cards"
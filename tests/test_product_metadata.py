@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from agents.product_metadata import ProductMetadata
+
+
+@pytest.fixture
+def metadata() -> ProductMetadata:
+    return ProductMetadata.from_values([
+        ['Classic', 'Credit Card: annual fees of EGP 250.'],
+        ['Current Account', 'Current Account: no fees.'],
+        ['Gold', 'Credit Card: an annual fee of 1,000 EGP and a 2% charge.'],
+        ['بطاقة', 'بطاقة ائتمان'],
+        ['Platinum', 'credit card: premium card.'],
+    ])
+
+
+def test_extract(metadata):
+    assert [record['category'] for record in metadata.records] == [
+        'Credit Card', 'Current Account', 'Credit Card', 'other', 'credit card']
+    assert [record['language'] for record in metadata.records] == ['en', 'en', 'en', 'ar', 'en']
+    assert metadata.records[2]['fees'] == [
+        dict(amount=1000.0, unit='EGP'), dict(amount=2.0, unit='%')]
+
+
+def test_category_partitions_are_case_insensitive_and_sorted(metadata):
+    assert metadata.rows(dict(category='CREDIT CARD')).tolist() == [0, 2, 4]
+    assert metadata.rows(dict(category=['current account', 'Credit Card'])).tolist() == [0, 1, 2, 4]
+    assert metadata.rows(dict(category='Loans')).dtype == np.int64
+    assert len(metadata.rows(dict(category='Loans'))) == 0
+
+
+def test_field_filters_combine_with_the_partition(metadata):
+    assert metadata.rows(dict(language='ar')).tolist() == [3]
+    assert metadata.rows(dict(category='credit card', has_fees=False)).tolist() == [4]
+    # percentages are not compared with max_fee.
+    assert metadata.rows(dict(max_fee=500)).tolist() == [0, 1, 3, 4]
+
+
+def test_unknown_filter_is_rejected(metadata):
+    with pytest.raises(ValueError):
+        metadata.rows(dict(colour='gold'))
+
+
+def test_only_amounts_next_to_a_fee_are_fees():
+    fees = ProductMetadata.extract([
+        'Platinum', 'Credit Card: a late payment fee of EGP 150.50 applies. '
+        'Enjoy 10% cashback with no annual fees, and a 3.5% monthly interest rate.'])['fees']
+    assert fees == [dict(amount=150.5, unit='EGP')]
+
+    # a percentage in a sentence about fees that is not one.
+    savings = ProductMetadata.from_values([
+        ['Saver', 'Savings Account: earn 3.5% interest with no monthly fees.'],
+        ['Fund', 'Mutual Fund: management fees are set at 0.25% of NAV.'],
+    ])
+    assert savings.records[0]['fees'] == []
+    assert savings.rows(dict(has_fees=True)).tolist() == [1]
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+from agents.vec_store import MmapVecStore
+from conftest import DATA_PATH, vectorize
+
+
+@pytest.fixture
+def catalog() -> pd.DataFrame:
+    return pd.read_json(DATA_PATH).head(12)
+
+
+def test_vectorize_db_reloads_shared_vecdbs(tmp_path, catalog, registry):
+    vectorize(str(tmp_path), catalog)
+    shared = registry.vecdb('key', str(tmp_path), reranker='cosine')
+    assert len(shared.store) == 12  # type: ignore
+
+    vectorize(str(tmp_path), catalog.head(8))
+
+    # sessions hold ``shared`` itself; it now serves the rewritten store.
+    assert shared.store.ids == catalog.head(8)['product_name'].tolist()  # type: ignore
+    assert registry.vecdb('key', str(tmp_path), reranker='cosine') is shared
+    assert registry.store(str(tmp_path)) is shared.store
+
+
+def test_store_rewritten_elsewhere_is_reloaded_on_get(tmp_path, catalog, registry):
+    vectorize(str(tmp_path), catalog)
+    shared = registry.vecdb('key', str(tmp_path), reranker='cosine')
+    old_store = shared.store
+
+    # e.g. another process re-indexed the directory.
+    MmapVecStore.write(str(tmp_path), ['a', 'b'], ['first', 'second'], [[1.0, 0.0], [0.0, 1.0]])
+
+    assert registry.vecdb('key', str(tmp_path), reranker='cosine') is shared
+    assert shared.store is not old_store
+    assert shared.store.ids == ['a', 'b']  # type: ignore
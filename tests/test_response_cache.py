@@ -0,0 +1,149 @@
+import time
+import numpy as np
+import pandas as pd
+from agents.resources import ResourceRegistry
+from agents.response_cache import ResponseCache
+from agents.sales_agent import SalesAgent
+from benchmarks.fakes import FakeGeminiClient
+from conftest import DATA_PATH, answer
+
+
+PROMPT = "What are the annual fees of the Titanium Credit Card?"
+
+
+def put(cache: ResponseCache, key: str, entities: frozenset[str], embedding) -> None:
+    cache.put(key, key, 'en', entities, embedding, (), answer(key), 'fp')
+
+
+def test_exact_lookup_needs_no_embedding():
+    cache = ResponseCache()
+    put(cache, 'credit card fees', frozenset({'credit', 'card'}), [1.0, 0.0])
+
+    assert cache.exact('credit card fees', 'fp').prompt == 'credit card fees'  # type: ignore
+    assert cache.exact('debit card fees', 'fp') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 0
+
+
+def test_similar_prompt_naming_another_product_is_a_miss():
+    cache = ResponseCache()
+    put(cache, 'gold credit card fees', frozenset({'gold', 'credit', 'card'}), [1.0, 0.0])
+
+    # the same embedding, but another product.
+    assert cache.get([1.0, 0.0], 'en', frozenset({'titanium', 'credit', 'card'}), 'fp') is None
+
+    hit = cache.get([0.99, 0.05], 'en', frozenset({'gold', 'credit', 'card'}), 'fp')
+    assert hit is not None and hit.prompt == 'gold credit card fees'
+
+    # an embedding that was not ready counts a miss.
+    assert cache.get(None, 'en', frozenset(), 'fp') is None
+    assert cache.stats()['misses'] == 2
+
+
+def test_put_replaces_the_entry_of_the_same_prompt_and_evicts_by_key():
+    cache = ResponseCache(max_entries=2)
+    put(cache, 'a', frozenset(), [1.0, 0.0])
+    put(cache, 'a', frozenset(), [1.0, 0.0])
+    put(cache, 'b', frozenset(), [0.0, 1.0])
+    put(cache, 'c', frozenset(), [0.7, 0.7])
+
+    assert len(cache) == 2
+    assert cache.exact('a', 'fp') is None
+    assert cache.exact('b', 'fp') is not None and cache.exact('c', 'fp') is not None
+
+    # a rebuilt index drops every entry.
+    assert cache.exact('b', 'other') is None and len(cache) == 0
+
+
+def test_registry_scopes_the_cache_by_api_keys():
+    registry = ResourceRegistry()
+    cache = registry.response_cache('gemini-a', 'cohere', 'model', 'prompt')
+
+    assert registry.response_cache('gemini-a', 'cohere', 'model', 'prompt') is cache
+    assert registry.response_cache('gemini-b', 'cohere', 'model', 'prompt') is not cache
+    assert registry.response_cache('gemini-a', 'cohere-b', 'model', 'prompt') is not cache
+
+
+def make_agent(shared_vecdb, cache: ResponseCache) -> SalesAgent:
+    vocabulary = ' '.join(pd.read_json(DATA_PATH)['product_description']).split()
+    return SalesAgent(
+        'offline', 'offline',
+        client=FakeGeminiClient(vocabulary, ttft=0.0, tokens_per_second=1e6),
+        shared_vecdb=shared_vecdb,
+        response_cache=cache,
+        cache_wait=0.01,
+    )
+
+
+def test_prompt_entities_keep_product_words_and_numbers(shared_vecdb):
+    assert shared_vecdb.prompt_entities(PROMPT) == frozenset({'titanium', 'credit', 'card'})
+    assert shared_vecdb.prompt_entities("a certificate for 56 days") >= {'56'}
+
+
+def test_slow_embedding_does_not_delay_the_first_call(shared_vecdb):
+    cache = ResponseCache()
+    shared_vecdb.embed_model.latency = 0.5
+    try:
+        agent = make_agent(shared_vecdb, cache)
+
+        start = time.perf_counter()
+        agent.generate_response(PROMPT)
+        assert time.perf_counter() - start < 0.4
+        assert agent.client.calls == 1
+
+        # the turn is stored once its embedding arrives.
+        deadline = time.monotonic() + 5
+        while not len(cache) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(cache) == 1
+    finally:
+        shared_vecdb.embed_model.latency = 0.0
+
+    # a new chat asking the same is answered from the normalized text.
+    other = make_agent(shared_vecdb, cache)
+    response = other.generate_response(PROMPT.lower().rstrip('?') + ' ?')
+    assert other.client.calls == 0
+    assert response.conversational_response == agent.contents.records[-1].conversational_response  # type: ignore
+    assert np.isclose(cache.stats()['hit_rate'], 0.5)
+
+
+def test_embed_wait_follows_the_measured_embedding_latency():
+    cache = ResponseCache(max_embed_wait=0.5)
+    assert cache.embed_wait() == 0.5
+
+    for seconds in [0.1] * 9 + [0.2]:
+        cache.observe_embed(seconds)
+    assert 0.1 <= cache.embed_wait() <= 0.2
+
+    # e.g. the first call loaded the index; one slow embedding does not count.
+    cache.observe_embed(10.0)
+    assert cache.embed_wait() <= 0.2
+
+    for _ in range(10):
+        cache.observe_embed(2.0)
+    assert cache.embed_wait() == 0.5
+
+
+def test_first_turn_waits_for_the_embedding_only_when_a_turn_could_match(shared_vecdb):
+    cache = ResponseCache()
+    other = "Titanium credit card annual fees, please"
+    # a turn stored for another wording with the same embedding and entities.
+    cache.put(
+        other, shared_vecdb.clean_text(other), 'en', shared_vecdb.prompt_entities(PROMPT),
+        shared_vecdb.prompt_embedding(PROMPT), (), answer('cached'), shared_vecdb.index_fingerprint)
+    shared_vecdb.query_cache.clear()
+
+    shared_vecdb.embed_model.latency = 0.1
+    try:
+        agent = make_agent(shared_vecdb, cache)
+        agent.cache_wait = None
+
+        assert agent.generate_response(PROMPT).conversational_response == 'cached'
+        assert agent.client.calls == 0
+
+        # no cached turn names the gold card: the first call does not wait.
+        start = time.perf_counter()
+        make_agent(shared_vecdb, cache).generate_response("What are the annual fees of the Gold Credit Card?")
+        assert time.perf_counter() - start < 0.1
+    finally:
+        shared_vecdb.embed_model.latency = 0.0
+    assert cache.stats()['embed_wait'] >= 0.1
@@ -0,0 +1,62 @@
+import json
+import pytest
+from agents.response_stream import JsonStringFieldParser, ResponseStream
+
+
+RESPONSE = dict(
+    conversational_response='Hello "there"\n\\ tab\t é 😀 مرحبا',
+    conversation_langues='en',
+    user_search_query=None,
+    recommended_products=None,
+    followup_questions=['{"conversational_response": "not me"}'],
+)
+
+
+def chunked(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 7, 64, 10000])
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+def test_field_split_at_every_boundary(size, ensure_ascii):
+    # ensure_ascii escapes the emoji as a 😀 surrogate pair.
+    text = json.dumps(RESPONSE, ensure_ascii=ensure_ascii)
+    parser = JsonStringFieldParser()
+    assert ''.join(parser.feed(chunk) for chunk in chunked(text, size)) == \
+        RESPONSE['conversational_response']
+
+
+def test_field_nested_or_after_other_keys():
+    text = json.dumps(dict(
+        other=dict(conversational_response='nested'),
+        items=['conversational_response', 'x'],
+        conversational_response='top level',
+    ))
+    assert JsonStringFieldParser().feed(text) == 'top level'
+
+
+def test_only_first_occurrence_is_emitted():
+    text = '{"conversational_response": "a", "conversational_response": "b"}'
+    assert JsonStringFieldParser().feed(text) == 'a'
+
+
+def test_stream_parses_and_completes():
+    completed = []
+    text = json.dumps(RESPONSE)
+    stream = ResponseStream(
+        iter([ResponseStream.text_chunk(chunk) for chunk in chunked(text, 4)]),
+        on_complete=completed.append,
+    )
+
+    assert ''.join(stream) == RESPONSE['conversational_response']
+    assert stream.parsed is not None
+    assert stream.parsed.followup_questions == RESPONSE['followup_questions']
+    assert completed == [stream.response]
+    assert stream.response.text == text
+
+
+def test_unparseable_stream_yields_text_and_parses_to_none():
+    stream = ResponseStream.from_text('{"conversational_response": "cut o')
+    assert ''.join(stream) == 'cut o'
+    assert stream.parsed is None
+    assert stream.completed
@@ -0,0 +1,115 @@
+import asyncio
+from concurrent.futures import Future
+import pandas as pd
+import pytest
+from agents.sales_agent import AsyncSalesAgent, SalesAgent
+from agents.turn_log import ModelTurn, UserTurn
+from agents.vecdb2 import VecDB
+from benchmarks.fakes import FakeGeminiClient
+from conftest import DATA_PATH
+
+
+PROMPT = "I am looking for a credit card with low annual fees"
+
+
+def test_speculation_skips_the_products_shown_when_it_started(tmp_path, monkeypatch):
+    shared = VecDB('offline', str(tmp_path))
+    agent = SalesAgent(
+        'offline', 'offline', client=FakeGeminiClient(['word']),
+        shared_vecdb=shared, speculative='prefetch', response_cache='off')
+
+    seen = []
+    monkeypatch.setattr(shared, 'speculate', lambda text, exclude_ids, query_vec: seen.append(exclude_ids))
+
+    # speculation waits for the prompt embedding on the executor thread.
+    embedding: Future = Future()
+    monkeypatch.setattr(agent, 'prompt_embedding', lambda: embedding)
+
+    agent.vecdb.retrieved_node_ids.add('shown')
+    agent.start_speculation(PROMPT)
+    agent.vecdb.retrieved_node_ids.add('shown later')
+    embedding.set_result(None)
+
+    agent.speculation.result(timeout=5)  # type: ignore
+    assert seen == [frozenset({'shown'})]
+
+
+def test_async_speculation_skips_the_products_shown_when_it_started(tmp_path, monkeypatch):
+    shared = VecDB('offline', str(tmp_path))
+    seen = []
+
+    async def aspeculate(text, exclude_ids, query_vec):
+        seen.append(exclude_ids)
+
+    monkeypatch.setattr(shared, 'aspeculate', aspeculate)
+
+    async def run() -> None:
+        agent = AsyncSalesAgent(
+            'offline', 'offline', client=FakeGeminiClient(['word']),
+            shared_vecdb=shared, speculative='prefetch', response_cache='off')
+
+        embedding = asyncio.get_running_loop().create_future()
+        monkeypatch.setattr(agent, 'prompt_embedding', lambda: embedding)
+
+        agent.vecdb.retrieved_node_ids.add('shown')
+        await agent.astart_speculation(PROMPT)
+        agent.vecdb.retrieved_node_ids.add('shown later')
+        embedding.set_result(None)
+        await agent.speculation  # type: ignore
+
+    asyncio.run(run())
+    assert seen == [frozenset({'shown'})]
+
+
+def make_agent(shared_vecdb, ttft: float) -> AsyncSalesAgent:
+    data = pd.read_json(DATA_PATH)
+    vocabulary = ' '.join(data['product_description']).split()
+    return AsyncSalesAgent(
+        'offline', 'offline',
+        client=FakeGeminiClient(vocabulary, ttft=ttft, tokens_per_second=1e6),
+        shared_vecdb=shared_vecdb,
+        response_cache='off',
+    )
+
+
+def test_timed_out_request_leaves_history_unchanged(shared_vecdb):
+    agent = make_agent(shared_vecdb, ttft=0.2)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(agent.generate_response(PROMPT, timeout=0.01))
+
+    assert len(agent.contents) == 0
+
+
+def test_timed_out_rag_round_restores_the_shown_products(shared_vecdb):
+    agent = make_agent(shared_vecdb, ttft=0.05)
+
+    async def chat():
+        response = await agent.generate_response(PROMPT)
+        assert response.user_search_query is not None
+
+        # the RAG block is appended, then the model call times out.
+        agent.client.aio.models.ttft = 0.5
+        with pytest.raises(asyncio.TimeoutError):
+            await agent.rag_on(response.user_search_query, timeout=0.1)
+
+    asyncio.run(chat())
+
+    assert [type(record) for record in agent.contents] == [UserTurn, ModelTurn]
+    assert agent.vecdb.retrieved_node_ids == set()
+
+
+def test_abandoned_stream_is_rolled_back(shared_vecdb):
+    agent = make_agent(shared_vecdb, ttft=0.0)
+
+    async def chat():
+        stream = await agent.generate_response_stream(PROMPT)
+        agent.client.aio.models.tokens_per_second = 1.0
+        stream.chunk_timeout = 0.05
+        with pytest.raises(asyncio.TimeoutError):
+            async for _ in stream:
+                pass
+
+    asyncio.run(chat())
+
+    assert len(agent.contents) == 0
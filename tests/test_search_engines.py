@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from agents.ann_index import IVFIndex
+from agents.quantized_index import QuantizedSearchEngine
+from agents.vec_store import MmapVecStore
+from agents.vecdb2 import VectorSearchEngine
+
+
+N_DOCS, DIM, TOP_K = 400, 32, 10
+
+
+@pytest.fixture(scope='module')
+def matrix() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return MmapVecStore.normalize(rng.normal(size=(N_DOCS, DIM)))
+
+
+@pytest.fixture(scope='module')
+def queries(matrix) -> np.ndarray:
+    rng = np.random.default_rng(1)
+    return MmapVecStore.normalize(matrix[:5] + rng.normal(0, 0.05, size=(5, DIM)))
+
+
+def brute_force(matrix, query, top_k, exclude=None, rows=None) -> tuple[np.ndarray, np.ndarray]:
+    scores = matrix @ query
+    allowed = np.zeros(len(matrix), dtype=bool)
+    allowed[rows if rows is not None else slice(None)] = True
+    if exclude is not None:
+        allowed[exclude] = False
+
+    candidates = np.flatnonzero(allowed)
+    order = np.argsort(-scores[candidates], kind='stable')[:top_k]
+    return candidates[order], scores[candidates[order]]
+
+
+def engines(matrix, exact: bool) -> dict:
+    """Every engine; ``exact`` configures the approximate ones to scan everything."""
+
+    oversample = N_DOCS if exact else None
+    return dict(
+        flat=VectorSearchEngine(matrix),
+        int8=QuantizedSearchEngine.build('int8', matrix, oversample=oversample),
+        binary=QuantizedSearchEngine.build('binary', matrix, oversample=oversample),
+        ivf=IVFIndex.build(matrix, n_lists=8, nprobe=8 if exact else 2),
+    )
+
+
+@pytest.mark.parametrize('name', ['flat', 'int8', 'binary', 'ivf'])
+@pytest.mark.parametrize('scope', ['catalog', 'exclude', 'rows', 'rows+exclude'])
+def test_exact_engines_match_brute_force(matrix, queries, name, scope):
+    engine = engines(matrix, exact=True)[name]
+
+    exclude = np.arange(0, N_DOCS, 3) if 'exclude' in scope else None
+    rows = np.arange(0, N_DOCS, 2) if 'rows' in scope else None
+
+    for query in queries:
+        found, scores = engine.search(query, TOP_K, exclude=exclude, rows=rows)
+        expected, expected_scores = brute_force(matrix, query, TOP_K, exclude, rows)
+
+        assert found.tolist() == expected.tolist()
+        assert np.allclose(scores, expected_scores, atol=1e-5)
+
+
+@pytest.mark.parametrize('name', ['flat', 'int8', 'binary', 'ivf'])
+def test_excluded_rows_are_never_returned(matrix, queries, name):
+    engine = engines(matrix, exact=False)[name]
+
+    # the nearest neighbours of the queries are the ones excluded.
+    exclude = np.unique(np.concatenate([
+        brute_force(matrix, query, 20)[0] for query in queries]))
+
+    rows, _ = engine.search_many(queries, TOP_K, exclude=exclude)
+    assert rows.shape == (len(queries), TOP_K)
+    assert not np.isin(rows, exclude).any()
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.int32, np.int64])
+def test_mask_stays_below_every_score_after_negation(dtype):
+    scores = np.array([[-5, 3, 0, -1]], dtype=dtype)
+
+    assert VectorSearchEngine.mask(scores, np.array([1, 2])) == 2
+
+    rows, _ = VectorSearchEngine.top_k(scores, 2)
+    assert rows.tolist() == [[3, 0]]
@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from server import AgentServer
+
+
+BAD_BODIES = [
+    b'{"prompt": ',
+    b'not json',
+    b'\xff\xfe',
+    b'[]',
+    b'"a prompt"',
+    b'null',
+    b'{}',
+    b'{"prompt": ""}',
+    b'{"prompt": "   "}',
+    b'{"prompt": 42}',
+]
+
+
+@pytest.mark.parametrize('body', BAD_BODIES)
+def test_malformed_turn_body_is_rejected_with_400(body):
+
+    async def post_turn():
+        # the agent is never reached for an invalid body.
+        server = AgentServer(agent_factory=lambda: None)  # type: ignore
+        async with TestClient(TestServer(server.app())) as client:
+            created = await client.post('/sessions')
+            session_id = (await created.json())['session_id']
+
+            response = await client.post(
+                f'/sessions/{session_id}/turns', data=body,
+                headers={'Content-Type': 'application/json'})
+            return response.status
+
+    assert asyncio.run(post_turn()) == 400
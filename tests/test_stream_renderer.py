@@ -0,0 +1,32 @@
+import pytest
+from stream_renderer import StreamRenderer
+
+
+@pytest.mark.parametrize('text, prefix', [
+    ('Our best card <div sty', 'Our best card '),
+    ('<b>Titanium</b> card has <a href="/ca', '<b>Titanium</b> card has '),
+    ('no annual fee&nbs', 'no annual '),
+    ('no annual fee&nbsp; or', 'no annual fee&nbsp; '),
+    ('The Titanium Cre', 'The Titanium '),
+    ('<p>The card</p>', '<p>The card</p>'),
+    ('<', ''),
+])
+def test_safe_prefix_never_ends_inside_a_tag_entity_or_word(text, prefix):
+    assert StreamRenderer.safe_prefix(text) == prefix
+
+
+@pytest.mark.parametrize('text, boundary', [
+    # a paragraph ends at a blank line.
+    ('First paragraph.\n\nSecond', len('First paragraph.\n\n')),
+    # a blank line inside an open element is not a block end.
+    ('<div>one\n\ntwo', 0),
+    ('<div>one\n\ntwo</div> tail', len('<div>one\n\ntwo</div>')),
+    # nor inside a code fence.
+    ('```\ncode\n\nmore', 0),
+    # an inline or void tag does not end a block.
+    ('<b>bold</b> and<br/> more', 0),
+    # the closing tag is only half streamed.
+    ('<p>done</p><ul><li>one</l', len('<p>done</p>')),
+])
+def test_last_block_boundary_skips_open_tags_and_fences(text, boundary):
+    assert StreamRenderer.last_block_boundary(text) == boundary
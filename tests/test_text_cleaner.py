@@ -0,0 +1,54 @@
+import os
+import pytest
+from agents.text_cleaner import clean_text, language
+from benchmarks.bench_clean_text import (
+    SEARCH_QUERIES, differential_check, fuzz_strings, legacy_clean_text)
+
+
+EDGE_CASES = [
+    '',
+    ' ',
+    '\n\t \x0b\x0c\r',
+    'a',
+    '.',
+    '_',
+    'Credit Card: Titanium',
+    'EGP250 annual fee, 1,000 EGP min, rate 22.5% for 1-6 months',
+    '-5 .5 5. 5- ,5 5,',
+    'a.b-c,d a..b 1..2 1.-2',
+    'Hello,\tWorld!\n\nmixed   \x0b whitespace\r\n',
+    "it's the bank’s card",
+    'بطاقة ائتمان تيتانيوم',
+    'Titanium بطاقة 250جنيه ٥٠٠ EGP',
+    '!leading and trailing!',
+    '!leading only',
+    'trailing only!',
+    'a _ b __ c_d',
+    'İstanbul',
+    '((nested)) [brackets] {braces} <tags>',
+]
+
+
+@pytest.mark.parametrize('text', EDGE_CASES + SEARCH_QUERIES)
+def test_matches_legacy_loop(text):
+    assert clean_text(text) == legacy_clean_text(text)
+
+
+def test_matches_legacy_loop_on_fuzz():
+    for text in fuzz_strings(5000, seed=1):
+        assert clean_text(text) == legacy_clean_text(text), text
+
+
+def test_matches_legacy_loop_on_catalog():
+    data_path = os.path.join(os.path.dirname(__file__), '..', 'data.json')
+    assert differential_check(data_path, fuzz=0) > 0
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('credit card fees', 'en'),
+    ('', 'en'),
+    ('ما هي رسوم البطاقة؟', 'ar'),
+    ('Titanium بطاقة', 'ar'),
+])
+def test_language(text, expected):
+    assert language(text) == expected
@@ -0,0 +1,28 @@
+from agents.turn_log import ModelTurn, RagTurn, TurnLog, UserTurn
+from conftest import answer
+
+
+def test_truncate_returns_the_dropped_records():
+    log = TurnLog()
+    log.append_user('hi')
+    log.append_model(answer('hello'))
+    log.append_user('cards?')
+    rag = log.append_rag('1. card', ('card',))
+
+    removed = log.truncate(2)
+
+    assert [type(record) for record in log] == [UserTurn, ModelTurn]
+    assert removed[1] is rag
+    assert log.truncate(5) == [] and len(log) == 2
+
+
+def test_group_turns_starts_a_turn_at_every_user_record():
+    log = TurnLog()
+    log.append_user('a')
+    log.append_model(answer('b', search='query'))
+    log.append_rag('c')
+    log.append_model(answer('d'))
+    log.append_user('e')
+
+    assert [len(turn) for turn in log.turns()] == [4, 1]
+    assert TurnLog.group_turns([RagTurn('orphan')])[0][0].text == 'orphan'
@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+import numpy as np
+from agents.vec_store import MmapVecStore
+
+
+DIM = 8
+
+
+def write(persist_directory: str, n_docs: int) -> dict:
+    rng = np.random.default_rng(n_docs)
+    return MmapVecStore.write(
+        persist_directory,
+        [f'doc-{i}' for i in range(n_docs)],
+        [f'text {i} of {n_docs}' for i in range(n_docs)],
+        rng.normal(size=(n_docs, DIM)),
+        embed_model_name='test')
+
+
+def versions(persist_directory: str) -> list[str]:
+    return sorted(name for name in os.listdir(persist_directory)
+                  if name.startswith(MmapVecStore.FILES_PREFIX))
+
+
+def test_write_keeps_the_current_and_previous_version(tmp_path):
+    persist_directory = str(tmp_path)
+    first = write(persist_directory, 3)
+    second = write(persist_directory, 4)
+    third = write(persist_directory, 5)
+
+    assert versions(persist_directory) == sorted([second['files'], third['files']])
+    assert first['files'] not in versions(persist_directory)
+
+    store = MmapVecStore.load(persist_directory)
+    assert len(store) == 5 and store.text(4) == 'text 4 of 5'
+
+
+def test_flat_version_1_store_is_read_and_later_removed(tmp_path):
+    persist_directory = str(tmp_path)
+    manifest = write(persist_directory, 3)
+
+    # move the files next to the manifest, the layout of version 1.
+    files_directory = os.path.join(persist_directory, manifest['files'])
+    for name in os.listdir(files_directory):
+        os.replace(os.path.join(files_directory, name), os.path.join(persist_directory, name))
+    os.rmdir(files_directory)
+    manifest.update(version=1)
+    del manifest['files']
+    with open(os.path.join(persist_directory, MmapVecStore.MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f)
+
+    assert MmapVecStore.load(persist_directory).text(2) == 'text 2 of 3'
+
+    write(persist_directory, 4)
+    write(persist_directory, 5)
+    assert not os.path.exists(os.path.join(persist_directory, MmapVecStore.VECTORS_FILE))
+    assert len(MmapVecStore.load(persist_directory)) == 5
+
+
+def test_load_never_mixes_files_of_two_versions(tmp_path):
+    persist_directory = str(tmp_path)
+    write(persist_directory, 2)
+
+    done = threading.Event()
+
+    def rewrite():
+        for n_docs in range(3, 40):
+            write(persist_directory, n_docs)
+        done.set()
+
+    writer = threading.Thread(target=rewrite)
+    writer.start()
+    try:
+        while not done.is_set():
+            store = MmapVecStore.load(persist_directory)
+            n_docs = len(store)
+            assert store.vectors.shape == (n_docs, DIM)
+            assert store.text(n_docs - 1) == f'text {n_docs - 1} of {n_docs}'
+    finally:
+        writer.join()
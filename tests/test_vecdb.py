@@ -0,0 +1,143 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from agents import sales_agent
+from agents.embed_pipeline import LocalEmbedder
+from agents.lexical_index import LexicalIndex
+from agents.vec_store import MmapVecStore
+from agents.vecdb2 import VecDB, VecdbChatRAG
+from benchmarks.fakes import FakeGeminiClient, FakeQueryEmbedding
+from conftest import COLUMNS, DATA_PATH, vectorize
+
+
+@pytest.fixture
+def persist_directory(tmp_path, registry) -> str:
+    vectorize(str(tmp_path))
+    return str(tmp_path)
+
+
+def test_vectorize_db_embeds_only_new_and_changed_products(persist_directory, capsys):
+    data = pd.read_json(DATA_PATH)
+    changed = data.drop(index=[0, 1]).reset_index(drop=True)
+    changed.loc[0, 'product_description'] += ' Now with cashback.'
+    vecdb = VecDB('offline', persist_directory)
+    capsys.readouterr()
+
+    vecdb.vectorize_db(changed, 'product_name', COLUMNS, embedder=LocalEmbedder(dim=32, latency=0.0))
+    assert f"embedded: 1, unchanged: {len(changed) - 1}, removed: 2" in capsys.readouterr().out
+
+    store = MmapVecStore.load(persist_directory)
+    assert len(store) == len(changed)
+    assert set(store.ids) == set(changed['product_name'].astype(str))
+
+    # vectors of another embedding model are never reused.
+    vecdb.vectorize_db(changed, 'product_name', COLUMNS, embedder=LocalEmbedder(dim=16, latency=0.0))
+    assert f"embedded: {len(changed)}, unchanged: 0, removed: 0" in capsys.readouterr().out
+    assert MmapVecStore.load(persist_directory).vectors.shape == (len(changed), 16)
+
+
+def test_hybrid_candidates_are_scored_by_cosine(persist_directory):
+    vecdb = VecDB(
+        'offline', persist_directory, reranker='cosine',
+        embed_model=FakeQueryEmbedding(dim=32, latency=0.0))
+    vecdb.ensure_loaded()
+    vecdb.hybrid_candidates = 8
+
+    text = vecdb.clean_text("titanium credit card with 56 days grace period")
+    query_vec = vecdb.embed_query(text)
+    nodes = vecdb.search(query_vec, text)
+
+    rows = [vecdb.store.id_to_row[node.node.node_id] for node in nodes]  # type: ignore
+    cosine = np.asarray(vecdb.store.vectors[rows]) @ MmapVecStore.normalize(query_vec)[0]  # type: ignore
+    assert np.allclose([node.score for node in nodes], cosine, atol=1e-5)
+
+    ranked = vecdb.reranker.rerank(text, nodes)  # type: ignore
+    assert np.allclose([node.score for node in ranked], np.sort(cosine)[::-1][:2], atol=1e-5)
+
+
+def test_lexical_index_rebuilt_on_load_matches_vectorize_db(persist_directory):
+    built = LexicalIndex.load(persist_directory)
+    os.remove(os.path.join(persist_directory, LexicalIndex.FILE))
+
+    vecdb = VecDB('offline', persist_directory, reranker='cosine')
+    rebuilt = vecdb.load_lexical(MmapVecStore.load(persist_directory))
+
+    assert rebuilt.terms == built.terms  # type: ignore
+    assert np.array_equal(rebuilt.docs, built.docs)  # type: ignore
+    assert np.allclose(rebuilt.weights, built.weights)  # type: ignore
+    # the end of a name is not glued to the next column name.
+    assert 'cardproduct' not in built.term_ids and 'card' in built.term_ids
+
+
+def test_agent_forwards_retrieval_settings_to_the_shared_vecdb(persist_directory, registry, monkeypatch):
+    monkeypatch.chdir(persist_directory)
+    os.symlink(persist_directory, 'vec_db')
+
+    embed_model = FakeQueryEmbedding(dim=32, latency=0.0)
+    settings = dict(retrieval='dense', index='ivf', ivf_lists=4, ivf_probes=2, embed_model=embed_model)
+    agent = sales_agent.SalesAgent(
+        'offline', 'offline',
+        client=FakeGeminiClient(['word']),
+        response_cache='off',
+        **settings,
+    )
+
+    shared = agent.vecdb.shared
+    assert shared is registry.vecdb('offline', **settings)  # type: ignore
+    assert (shared.retrieval, shared.index, shared.lexical) == ('dense', 'ivf', None)  # type: ignore
+    assert (shared.ivf_lists, shared.ivf_probes, shared.embed_model) == (4, 2, embed_model)  # type: ignore
+    assert (shared.engine.n_lists, shared.engine.nprobe) == (4, 2)  # type: ignore
+    assert (agent.vecdb.retrieval, agent.vecdb.index, agent.vecdb.ivf_probes) == ('dense', 'ivf', 2)
+    agent.vecdb.prompt_embedding("titanium credit card")
+    assert embed_model.calls == 1
+
+    # any other setting is another shared VecDB.
+    for changed in (dict(index='flat', ivf_lists=None, ivf_probes=16), dict(ivf_lists=8), dict(ivf_probes=4),
+                    dict(embed_model=FakeQueryEmbedding(dim=32, latency=0.0))):
+        assert registry.vecdb('offline', **{**settings, **changed}) is not shared  # type: ignore
+
+
+def test_chat_rag_retrieves_from_the_shared_vecdb(persist_directory):
+    shared = VecDB(
+        'offline', persist_directory, reranker='cosine',
+        embed_model=FakeQueryEmbedding(dim=32, latency=0.0))
+    chat = VecdbChatRAG('offline', persist_directory, reranker='cosine', shared=shared)
+
+    text = "titanium credit card"
+    nodes = chat.retrieve(text)
+    assert [node.node.node_id for node in nodes] == [node.node.node_id for node in shared.retrieve(text)]
+    assert len(chat.retrieve_many([text, "savings account"])) == 2
+    assert len(chat.query_many([text])[0]) == 2
+
+    # the session never loads a private copy of the index.
+    assert shared.store is not None and chat.store is None and chat.engine is None
+
+
+def test_query_keeps_the_index_it_started_with_across_a_reload(persist_directory, tmp_path_factory):
+    vecdb = VecDB(
+        'offline', persist_directory, reranker='cosine',
+        embed_model=FakeQueryEmbedding(dim=32, latency=0.0))
+    old = vecdb.ensure_loaded().store
+
+    # the same products in reverse order: every row names another product.
+    other_directory = str(tmp_path_factory.mktemp('reversed'))
+    MmapVecStore.write(
+        other_directory, old.ids[::-1], old.texts(range(len(old)))[::-1],
+        np.asarray(old.vectors)[::-1], embed_model_name=old.manifest['embed_model_name'])
+    other = MmapVecStore.load(other_directory)
+
+    text = "titanium credit card with 56 days grace period"
+    shown = [node.node.node_id for node in vecdb.query(text)]
+
+    embed_query = vecdb.embed_query
+
+    def reload_while_embedding(text):
+        vecdb.reload(other)
+        return embed_query(text)
+
+    vecdb.embed_query = reload_while_embedding  # type: ignore
+    nodes = vecdb.query(text, exclude_ids=shown)
+
+    assert vecdb.store is other
+    assert nodes and not {node.node.node_id for node in nodes} & set(shown)